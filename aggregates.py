@@ -0,0 +1,273 @@
+"""
+Помесячные агрегаты транзакций.
+
+Таблица monthly_totals хранит сумму (в копейках) и количество транзакций
+по (пользователь, месяц, категория, тип). Триггеры обновляют ее в той же
+транзакции, что и изменение transactions, поэтому статистика панели
+управления зависит от числа месяцев, а не от числа транзакций.
+"""
+
+from datetime import date
+
+from cache import cached
+
+
+# Категория 0 обозначает транзакции без категории (NULL не годится для ключа)
+MONTHLY_TOTALS_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS monthly_totals (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        category_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        total_cents INTEGER NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month, category_id, type)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS monthly_totals_insert
+    AFTER INSERT ON transactions BEGIN
+        INSERT INTO monthly_totals (user_id, month, category_id, type, total_cents, count)
+        VALUES (new.user_id, substr(new.date, 1, 7), COALESCE(new.category_id, 0),
+                new.type, CAST(ROUND(new.amount * 100) AS INTEGER), 1)
+        ON CONFLICT (user_id, month, category_id, type) DO UPDATE SET
+            total_cents = total_cents + excluded.total_cents,
+            count = count + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS monthly_totals_delete
+    AFTER DELETE ON transactions BEGIN
+        UPDATE monthly_totals
+        SET total_cents = total_cents - CAST(ROUND(old.amount * 100) AS INTEGER),
+            count = count - 1
+        WHERE user_id = old.user_id AND month = substr(old.date, 1, 7)
+          AND category_id = COALESCE(old.category_id, 0) AND type = old.type;
+        DELETE FROM monthly_totals
+        WHERE user_id = old.user_id AND month = substr(old.date, 1, 7)
+          AND category_id = COALESCE(old.category_id, 0) AND type = old.type
+          AND count <= 0;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS monthly_totals_update
+    AFTER UPDATE OF amount, type, date, category_id, user_id ON transactions BEGIN
+        UPDATE monthly_totals
+        SET total_cents = total_cents - CAST(ROUND(old.amount * 100) AS INTEGER),
+            count = count - 1
+        WHERE user_id = old.user_id AND month = substr(old.date, 1, 7)
+          AND category_id = COALESCE(old.category_id, 0) AND type = old.type;
+        DELETE FROM monthly_totals
+        WHERE user_id = old.user_id AND month = substr(old.date, 1, 7)
+          AND category_id = COALESCE(old.category_id, 0) AND type = old.type
+          AND count <= 0;
+        INSERT INTO monthly_totals (user_id, month, category_id, type, total_cents, count)
+        VALUES (new.user_id, substr(new.date, 1, 7), COALESCE(new.category_id, 0),
+                new.type, CAST(ROUND(new.amount * 100) AS INTEGER), 1)
+        ON CONFLICT (user_id, month, category_id, type) DO UPDATE SET
+            total_cents = total_cents + excluded.total_cents,
+            count = count + 1;
+    END
+    ''',
+)
+
+# Агрегат, вычисленный напрямую по transactions (эталон для проверки)
+_RECOMPUTE_QUERY = '''
+    SELECT user_id, substr(date, 1, 7) AS month, COALESCE(category_id, 0) AS category_id,
+           type, SUM(CAST(ROUND(amount * 100) AS INTEGER)) AS total_cents,
+           COUNT(*) AS count
+    FROM transactions
+    {where}
+    GROUP BY user_id, month, COALESCE(category_id, 0), type
+'''
+
+
+def create_monthly_totals(db):
+    """
+    Создание таблицы агрегатов, триггеров и первичное заполнение.
+
+    Используется миграцией.
+
+    Args:
+        db (sqlite3.Connection): Соединение писателя в открытой транзакции
+    """
+    for statement in MONTHLY_TOTALS_SCHEMA:
+        db.execute(statement)
+    rebuild_monthly_totals(db)
+
+
+def rebuild_monthly_totals(db, user_id=None):
+    """
+    Пересчет агрегатов с нуля по таблице transactions.
+
+    Args:
+        db (sqlite3.Connection): Соединение писателя в открытой транзакции
+        user_id (int): Пересчитать только одного пользователя
+
+    Returns:
+        int: Количество строк агрегатов
+    """
+    if user_id is None:
+        db.execute('DELETE FROM monthly_totals')
+        where, params = '', ()
+    else:
+        db.execute('DELETE FROM monthly_totals WHERE user_id = ?', (user_id,))
+        where, params = 'WHERE user_id = ?', (user_id,)
+
+    cursor = db.execute(
+        'INSERT INTO monthly_totals (user_id, month, category_id, type, total_cents, count) '
+        + _RECOMPUTE_QUERY.format(where=where),
+        params
+    )
+    return cursor.rowcount
+
+
+def verify_monthly_totals(db, user_id=None):
+    """
+    Сравнение агрегатов с пересчетом по transactions.
+
+    Args:
+        db (sqlite3.Connection): Соединение с базой данных
+        user_id (int): Проверить только одного пользователя
+
+    Returns:
+        list: Расхождения (user_id, month, category_id, type); пусто, если все верно
+    """
+    where, params = ('WHERE user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    stored_where = 'WHERE user_id = ?' if user_id is not None else ''
+
+    rows = db.execute(f'''
+        SELECT user_id, month, category_id, type FROM (
+            SELECT * FROM ({_RECOMPUTE_QUERY.format(where=where)})
+            EXCEPT
+            SELECT user_id, month, category_id, type, total_cents, count
+            FROM monthly_totals {stored_where}
+        )
+        UNION
+        SELECT user_id, month, category_id, type FROM (
+            SELECT user_id, month, category_id, type, total_cents, count
+            FROM monthly_totals {stored_where}
+            EXCEPT
+            SELECT * FROM ({_RECOMPUTE_QUERY.format(where=where)})
+        )
+        ORDER BY 1, 2, 3, 4
+    ''', params * 4 if user_id is not None else ()).fetchall()
+
+    return [tuple(row) for row in rows]
+
+
+@cached('statistics')
+def calculate_statistics(user_id, db, today=None):
+    """
+    Сводная статистика пользователя по помесячным агрегатам.
+
+    Args:
+        user_id (int): ID пользователя
+        db (sqlite3.Connection): Соединение с базой данных
+        today (date): Текущая дата (для тестов)
+
+    Returns:
+        dict: Итоги за все время и за текущий месяц, крупнейшие расходы месяца
+    """
+    month = (today or date.today()).strftime('%Y-%m')
+
+    rows = db.execute('''
+        SELECT type,
+               SUM(total_cents) AS total_cents,
+               SUM(count) AS count,
+               SUM(CASE WHEN month = ? THEN total_cents ELSE 0 END) AS month_cents,
+               SUM(CASE WHEN month = ? THEN count ELSE 0 END) AS month_count
+        FROM monthly_totals
+        WHERE user_id = ?
+        GROUP BY type
+    ''', (month, month, user_id)).fetchall()
+    by_type = {row['type']: row for row in rows}
+
+    def cents(type_, column):
+        row = by_type.get(type_)
+        return row[column] if row else 0
+
+    top_categories = db.execute('''
+        SELECT m.category_id, c.name, c.color, c.budget_limit,
+               SUM(m.total_cents) AS total_cents
+        FROM monthly_totals m
+        LEFT JOIN categories c ON c.id = m.category_id
+        WHERE m.user_id = ? AND m.month = ? AND m.type = 'expense'
+        GROUP BY m.category_id
+        ORDER BY total_cents DESC
+        LIMIT 5
+    ''', (user_id, month)).fetchall()
+
+    total_income = cents('income', 'total_cents')
+    total_expense = cents('expense', 'total_cents')
+    month_income = cents('income', 'month_cents')
+    month_expense = cents('expense', 'month_cents')
+
+    return {
+        'total_income': total_income / 100,
+        'total_expense': total_expense / 100,
+        'balance': (total_income - total_expense) / 100,
+        'transactions_count': sum(row['count'] for row in rows),
+        'month': month,
+        'month_income': month_income / 100,
+        'month_expense': month_expense / 100,
+        'month_balance': (month_income - month_expense) / 100,
+        'month_transactions_count': sum(row['month_count'] for row in rows),
+        'top_expense_categories': [
+            {
+                'category_id': row['category_id'] or None,
+                'name': row['name'],
+                'color': row['color'],
+                'budget_limit': row['budget_limit'],
+                'total': row['total_cents'] / 100,
+            }
+            for row in top_categories
+        ],
+    }
+
+
+@cached('category_statistics')
+def category_statistics(user_id, db, today=None):
+    """
+    Категории пользователя с итогами одним запросом.
+
+    Args:
+        user_id (int): ID пользователя
+        db (sqlite3.Connection): Соединение с базой данных
+        today (date): Текущая дата (для тестов)
+
+    Returns:
+        list: Словари категорий (в порядке type, name) с полями count,
+            total_income, total_expense, month_expense и budget_used
+            (доля лимита, потраченная в текущем месяце)
+    """
+    month = (today or date.today()).strftime('%Y-%m')
+
+    rows = db.execute('''
+        SELECT c.*,
+               COALESCE(SUM(m.count), 0) AS count,
+               COALESCE(SUM(CASE WHEN m.type = 'income' THEN m.total_cents END), 0) AS income_cents,
+               COALESCE(SUM(CASE WHEN m.type = 'expense' THEN m.total_cents END), 0) AS expense_cents,
+               COALESCE(SUM(CASE WHEN m.type = 'expense' AND m.month = ?
+                                 THEN m.total_cents END), 0) AS month_expense_cents
+        FROM categories c
+        LEFT JOIN monthly_totals m ON m.user_id = c.user_id AND m.category_id = c.id
+        WHERE c.user_id = ?
+        GROUP BY c.id
+        ORDER BY c.type, c.name
+    ''', (month, user_id)).fetchall()
+
+    result = []
+    for row in rows:
+        category = {key: row[key] for key in row.keys() if not key.endswith('_cents')}
+        category['total_income'] = row['income_cents'] / 100
+        category['total_expense'] = row['expense_cents'] / 100
+        category['month_expense'] = row['month_expense_cents'] / 100
+        category['budget_used'] = (
+            round(category['month_expense'] / row['budget_limit'], 4)
+            if row['budget_limit'] else None
+        )
+        result.append(category)
+
+    return result
@@ -0,0 +1,120 @@
+"""
+Сравнение построчного и векторного (NumPy) расчета отчета.
+
+Пример:
+    python benchmark_reports.py --rows 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+import reports
+from database import SCHEMA
+
+
+def create_database(path, rows, seed=1):
+    """
+    Тестовая база данных с одним пользователем и rows транзакциями.
+
+    Args:
+        path (str): Путь к файлу базы данных
+        rows (int): Количество транзакций
+        seed (int): Зерно генератора
+
+    Returns:
+        sqlite3.Connection: Соединение
+    """
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    db.execute('CREATE INDEX idx_transactions_user_date ON transactions (user_id, date)')
+    db.execute("INSERT INTO users (id, username, email, password_hash) VALUES (1, 'u', 'u@e', 'x')")
+    db.executemany(
+        'INSERT INTO categories (id, name, type, user_id) VALUES (?, ?, ?, 1)',
+        [(i, f'Категория {i}', 'income' if i <= 3 else 'expense') for i in range(1, 21)]
+    )
+
+    rng = random.Random(seed)
+    start = date(2020, 1, 1)
+    batch = []
+    for _ in range(rows):
+        category = rng.randint(1, 20)
+        batch.append((
+            round(rng.uniform(1, 50000), 2),
+            'income' if category <= 3 else 'expense',
+            (start + timedelta(days=rng.randrange(5 * 365))).isoformat(),
+            category,
+        ))
+        if len(batch) == 50000:
+            db.executemany(
+                'INSERT INTO transactions (amount, type, date, user_id, category_id) VALUES (?, ?, ?, 1, ?)',
+                batch
+            )
+            batch = []
+    if batch:
+        db.executemany(
+            'INSERT INTO transactions (amount, type, date, user_id, category_id) VALUES (?, ?, ?, 1, ?)',
+            batch
+        )
+    db.commit()
+    return db
+
+
+def measure(function, repeat):
+    """Лучшее время из repeat запусков в секундах."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if reports.np is None:
+        parser.error('NumPy не установлен')
+
+    print(f'{"строк":>10} {"загрузка":>10} {"Python":>10} {"NumPy":>10} {"ускорение":>10} '
+          f'{"отчет Py":>10} {"отчет NumPy":>12}')
+
+    for rows in args.rows:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            db = create_database(path, rows)
+            period = (date(2020, 1, 1), date(2024, 12, 31))
+            columns = reports._fetch_columns(db, 1, *period)
+            layout = (period[0].toordinal(), (period[1] - period[0]).days + 1,
+                      reports._month_index(period[0]), 60)
+
+            load = measure(lambda: reports._fetch_columns(db, 1, *period), args.repeat)
+            python = measure(lambda: reports._aggregate_python(columns, *layout), args.repeat)
+            vectorized = measure(lambda: reports._aggregate_numpy(columns, *layout), args.repeat)
+            report_python = measure(
+                lambda: reports.build_report(db, 1, *period, vectorized=False), args.repeat)
+            report_numpy = measure(
+                lambda: reports.build_report(db, 1, *period, vectorized=True), args.repeat)
+
+            assert (reports.build_report(db, 1, *period, vectorized=False)
+                    == reports.build_report(db, 1, *period, vectorized=True))
+
+            print(f'{rows:>10} {load:>9.3f}s {python:>9.3f}s {vectorized:>9.3f}s '
+                  f'{python / vectorized:>9.1f}x {report_python:>9.3f}s {report_numpy:>11.3f}s')
+            db.close()
+        finally:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+"""
+Кеш результатов вычислений.
+
+Ключи содержат пользователя и версию его данных (см. versions), поэтому
+после любой записи старые значения просто перестают запрашиваться и
+вытесняются по LRU или TTL. Бэкенды: память процесса и общий файл SQLite
+для нескольких воркеров. Когда трекер версий замечает запись другого
+воркера, записи пользователя сразу удаляются из памяти процесса.
+"""
+
+import hashlib
+import inspect
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+
+from flask import current_app, has_app_context
+
+from versions import current_data_version, on_version_changed
+
+
+# Признак отсутствия значения (None - допустимое значение кеша)
+MISSING = object()
+
+
+class NullBackend:
+    """Бэкенд, ничего не сохраняющий (кеш отключен)."""
+
+    name = 'null'
+    evictions = 0
+
+    def get(self, key):
+        return MISSING
+
+    def set(self, key, value, ttl=None, tag=None):
+        pass
+
+    def discard_tag(self, tag):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class MemoryBackend:
+    """
+    LRU кеш в памяти процесса со сроком жизни записей.
+
+    Значения возвращаются без копирования, изменять их нельзя.
+    """
+
+    name = 'memory'
+
+    def __init__(self, max_entries=10000, default_ttl=300):
+        """
+        Инициализация кеша.
+
+        Args:
+            max_entries (int): Максимальное количество записей
+            default_ttl (float): Срок жизни записи в секундах
+        """
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        """Значение по ключу или MISSING."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at, tag = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None, tag=None):
+        """Сохранение значения с вытеснением давно неиспользуемых записей."""
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires_at, tag)
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def discard_tag(self, tag):
+        """Удаление всех записей с меткой (например, записей пользователя)."""
+        with self._lock:
+            for key in self._tags.pop(tag, ()):
+                self._entries.pop(key, None)
+
+    def _remove(self, key):
+        """Удаление записи и ее метки; вызывается под блокировкой."""
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[2] is not None:
+            keys = self._tags.get(entry[2])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[entry[2]]
+
+    def clear(self):
+        """Удаление всех записей."""
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    Общий для процессов кеш в отдельном файле SQLite.
+
+    Значения сериализуются pickle. Время последнего чтения хранится в
+    записи, лишние записи удаляются по нему раз в prune_interval вставок.
+    """
+
+    name = 'sqlite'
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        ) WITHOUT ROWID
+    '''
+
+    def __init__(self, path, max_entries=10000, default_ttl=300, prune_interval=100):
+        """
+        Инициализация кеша.
+
+        Args:
+            path (str): Путь к файлу кеша
+            max_entries (int): Максимальное количество записей
+            default_ttl (float): Срок жизни записи в секундах
+            prune_interval (int): Через сколько вставок проверять размер
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.prune_interval = prune_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sets = 0
+        self.evictions = 0
+        self._connection().execute(self.SCHEMA)
+
+    def _connection(self):
+        """Соединение текущего потока."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = OFF')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        """Значение по ключу или MISSING."""
+        connection = self._connection()
+        now = time.time()
+        row = connection.execute(
+            'SELECT value FROM cache WHERE key = ? AND expires_at > ?', (key, now)
+        ).fetchone()
+        if row is None:
+            return MISSING
+        connection.execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None, tag=None):
+        """Сохранение значения; периодически удаляет устаревшие записи."""
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.default_ttl)
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at, now)
+        )
+
+        with self._lock:
+            self._sets += 1
+            prune = self._sets % self.prune_interval == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """
+        Удаление просроченных записей и вытеснение лишних по времени чтения.
+
+        Returns:
+            int: Количество вытесненных записей
+        """
+        connection = self._connection()
+        connection.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+        evicted = connection.execute('''
+            DELETE FROM cache WHERE key IN (
+                SELECT key FROM cache ORDER BY accessed_at
+                LIMIT max(0, (SELECT COUNT(*) FROM cache) - ?)
+            )
+        ''', (self.max_entries,)).rowcount
+        with self._lock:
+            self.evictions += evicted
+        return evicted
+
+    def discard_tag(self, tag):
+        """
+        Метки не хранятся: общий кеш согласован через версии в ключах,
+        а устаревшие записи удаляются prune().
+        """
+
+    def clear(self):
+        """Удаление всех записей."""
+        self._connection().execute('DELETE FROM cache')
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+class Cache:
+    """Кеш с ключами по пользователю и версии данных и метриками."""
+
+    def __init__(self, backend):
+        """
+        Инициализация кеша.
+
+        Args:
+            backend: MemoryBackend, SQLiteBackend или NullBackend
+        """
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(namespace, user_id, version, *parts):
+        """
+        Ключ записи.
+
+        Args:
+            namespace (str): Имя кешируемой функции
+            user_id (int): ID пользователя
+            version (int): Версия данных пользователя
+            *parts: Остальные аргументы
+
+        Returns:
+            str: Ключ вида 'namespace:user_id:version:digest'
+        """
+        digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+        return f'{namespace}:{user_id}:{version}:{digest}'
+
+    def get(self, key):
+        """Значение по ключу или MISSING с учетом попаданий и промахов."""
+        value = self.backend.get(key)
+        with self._lock:
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None, user_id=None):
+        """Сохранение значения, при наличии user_id - с меткой пользователя."""
+        self.backend.set(key, value, ttl, tag=user_id)
+
+    def discard_user(self, user_id):
+        """Удаление записей пользователя из кеша процесса."""
+        self.backend.discard_tag(user_id)
+
+    def clear(self):
+        """Удаление всех записей."""
+        self.backend.clear()
+
+    def stats(self):
+        """
+        Метрики кеша.
+
+        Returns:
+            dict: backend, entries, hits, misses, evictions
+        """
+        return {
+            'backend': self.backend.name,
+            'entries': len(self.backend),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions,
+        }
+
+
+def create_backend(config):
+    """
+    Бэкенд кеша по настройкам приложения.
+
+    Args:
+        config (dict): app.config
+
+    Returns:
+        Бэкенд, выбранный CACHE_BACKEND
+
+    Raises:
+        ValueError: Если бэкенд неизвестен
+    """
+    name = config.get('CACHE_BACKEND', 'memory')
+    max_entries = config.get('CACHE_MAX_ENTRIES', 10000)
+    default_ttl = config.get('CACHE_DEFAULT_TTL', 300)
+
+    if name == 'memory':
+        return MemoryBackend(max_entries, default_ttl)
+    if name == 'sqlite':
+        return SQLiteBackend(config.get('CACHE_PATH', 'family_finance_cache.db'),
+                             max_entries, default_ttl)
+    if name == 'null':
+        return NullBackend()
+    raise ValueError(f'Неизвестный бэкенд кеша: {name}')
+
+
+def init_cache(app):
+    """
+    Создание кеша приложения.
+
+    Args:
+        app (Flask): Приложение
+
+    Returns:
+        Cache: Кеш, доступный через get_cache()
+    """
+    cache = Cache(create_backend(app.config))
+    app.extensions['cache'] = cache
+    # Данные, измененные другим воркером, удаляются из памяти этого процесса
+    on_version_changed(cache.discard_user)
+    return cache
+
+
+def get_cache():
+    """Кеш текущего приложения или None вне контекста приложения."""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('cache')
+
+
+def cached(namespace, ttl=None, user_arg='user_id', db_arg='db'):
+    """
+    Декоратор кеширования результата функции данных пользователя.
+
+    Ключ включает пользователя, версию его данных, базу данных, текущую
+    дату и остальные аргументы, поэтому запись дает новый ключ и
+    инвалидация не требуется. Вне контекста приложения функция
+    вызывается напрямую. Исходная функция доступна как .uncached.
+
+    Example:
+        @cached('statistics')
+        def calculate_statistics(user_id, db, today=None): ...
+
+    Args:
+        namespace (str): Имя пространства ключей
+        ttl (float): Срок жизни записи; по умолчанию CACHE_DEFAULT_TTL
+        user_arg (str): Имя аргумента с ID пользователя
+        db_arg (str): Имя аргумента с соединением
+
+    Returns:
+        function: Декоратор
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None:
+                return func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            user_id = arguments.pop(user_arg)
+            db = arguments.pop(db_arg)
+
+            key = cache.key(
+                namespace, user_id, current_data_version(db, user_id),
+                current_app.config.get('DATABASE_PATH'),
+                date.today().isoformat(),
+                sorted(arguments.items())
+            )
+            value = cache.get(key)
+            if value is MISSING:
+                value = func(*args, **kwargs)
+                cache.set(key, value, ttl, user_id=user_id)
+            return value
+
+        wrapper.uncached = func
+        return wrapper
+    return decorator
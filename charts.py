@@ -0,0 +1,192 @@
+"""
+Группировка транзакций по интервалам времени для графиков.
+
+Итоги по интервалам считаются одним запросом: по диапазону индекса
+транзакций или, если период состоит из целых месяцев, по помесячным
+агрегатам. Интервалы без транзакций дополняются нулями в Python.
+"""
+
+from datetime import date, timedelta
+
+from cache import cached
+
+
+BUCKETS = ('day', 'week', 'month', 'quarter', 'year')
+
+# Максимальное количество интервалов в одном графике
+MAX_CHART_BUCKETS = 5000
+
+# Последняя допустимая дата: начало следующего интервала (до года вперед)
+# должно помещаться в datetime.date
+MAX_CHART_DATE = date(date.max.year - 1, 12, 31)
+
+# Выражения ключа интервала по колонке даты транзакции.
+# Для недели ключ - понедельник (ISO неделя), подпись строится в Python.
+_TRANSACTION_KEYS = {
+    'day': 'date',
+    'week': "date(date, '-' || ((CAST(strftime('%w', date) AS INTEGER) + 6) % 7) || ' days')",
+    'month': 'substr(date, 1, 7)',
+    'quarter': "substr(date, 1, 4) || '-Q' || ((CAST(substr(date, 6, 2) AS INTEGER) + 2) / 3)",
+    'year': 'substr(date, 1, 4)',
+}
+
+# Выражения ключа интервала по колонке month таблицы monthly_totals
+_MONTHLY_KEYS = {
+    'month': 'month',
+    'quarter': "substr(month, 1, 4) || '-Q' || ((CAST(substr(month, 6, 2) AS INTEGER) + 2) / 3)",
+    'year': 'substr(month, 1, 4)',
+}
+
+
+def bucket_start(day, bucket):
+    """
+    Первый день интервала, содержащего дату.
+
+    Args:
+        day (date): Дата
+        bucket (str): Тип интервала из BUCKETS
+
+    Returns:
+        date: Начало интервала
+    """
+    if bucket == 'day':
+        return day
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    if bucket == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    return day.replace(month=1, day=1)
+
+
+def next_bucket(start, bucket):
+    """Начало следующего интервала после интервала, начинающегося с start."""
+    if bucket == 'day':
+        return start + timedelta(days=1)
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    months = {'month': 1, 'quarter': 3, 'year': 12}[bucket]
+    month_index = start.year * 12 + start.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def bucket_label(start, bucket):
+    """
+    Подпись интервала.
+
+    Args:
+        start (date): Начало интервала
+        bucket (str): Тип интервала
+
+    Returns:
+        str: '2024-01-15', '2024-W03', '2024-01', '2024-Q1' или '2024'
+    """
+    if bucket == 'day':
+        return start.isoformat()
+    if bucket == 'week':
+        year, week, _ = start.isocalendar()
+        return f'{year}-W{week:02d}'
+    if bucket == 'month':
+        return start.strftime('%Y-%m')
+    if bucket == 'quarter':
+        return f'{start.year}-Q{(start.month - 1) // 3 + 1}'
+    return str(start.year)
+
+
+def iter_buckets(start, end, bucket):
+    """
+    Начала интервалов, пересекающихся с периодом [start, end].
+
+    Args:
+        start (date): Начало периода
+        end (date): Конец периода включительно
+        bucket (str): Тип интервала
+
+    Yields:
+        date: Начало очередного интервала
+    """
+    current = bucket_start(start, bucket)
+    while current <= end:
+        yield current
+        current = next_bucket(current, bucket)
+
+
+def count_buckets(start, end, bucket):
+    """Количество интервалов в периоде без их перебора."""
+    first = bucket_start(start, bucket)
+    last = bucket_start(end, bucket)
+    if bucket in ('day', 'week'):
+        return (last - first).days // (1 if bucket == 'day' else 7) + 1
+    months = (last.year - first.year) * 12 + last.month - first.month
+    return months // {'month': 1, 'quarter': 3, 'year': 12}[bucket] + 1
+
+
+def _whole_months(start, end):
+    """Период состоит из целых месяцев."""
+    return start.day == 1 and (end + timedelta(days=1)).day == 1
+
+
+@cached('chart')
+def chart_series(db, user_id, start, end, bucket='day'):
+    """
+    Доходы и расходы пользователя по интервалам периода.
+
+    Args:
+        db (sqlite3.Connection): Соединение с базой данных
+        user_id (int): ID пользователя
+        start (date): Начало периода
+        end (date): Конец периода включительно
+        bucket (str): Тип интервала из BUCKETS
+
+    Returns:
+        list: Словари period, start, income, expense для каждого интервала,
+            включая интервалы без транзакций
+
+    Raises:
+        ValueError: Если интервал неизвестен, период пуст, слишком длинный
+            или выходит за MAX_CHART_DATE
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f'Неизвестный интервал: {bucket}')
+    if end > MAX_CHART_DATE:
+        raise ValueError(f'Конец периода позже {MAX_CHART_DATE.isoformat()}')
+    if start > end:
+        raise ValueError('Начало периода позже конца')
+    if count_buckets(start, end, bucket) > MAX_CHART_BUCKETS:
+        raise ValueError(f'Слишком много интервалов (максимум {MAX_CHART_BUCKETS})')
+
+    if bucket in _MONTHLY_KEYS and _whole_months(start, end):
+        rows = db.execute(f'''
+            SELECT {_MONTHLY_KEYS[bucket]} AS bucket, type, SUM(total_cents) AS cents
+            FROM monthly_totals
+            WHERE user_id = ? AND month BETWEEN ? AND ?
+            GROUP BY bucket, type
+        ''', (user_id, start.strftime('%Y-%m'), end.strftime('%Y-%m'))).fetchall()
+    else:
+        rows = db.execute(f'''
+            SELECT {_TRANSACTION_KEYS[bucket]} AS bucket, type,
+                   SUM(CAST(ROUND(amount * 100) AS INTEGER)) AS cents
+            FROM transactions
+            WHERE user_id = ? AND date BETWEEN ? AND ?
+            GROUP BY bucket, type
+        ''', (user_id, start.isoformat(), end.isoformat())).fetchall()
+
+    totals = {}
+    for row in rows:
+        key = row['bucket']
+        if bucket == 'week':
+            key = bucket_label(date.fromisoformat(key), bucket)
+        totals[(key, row['type'])] = row['cents']
+
+    series = []
+    for bucket_begin in iter_buckets(start, end, bucket):
+        label = bucket_label(bucket_begin, bucket)
+        series.append({
+            'period': label,
+            'start': bucket_begin.isoformat(),
+            'income': totals.get((label, 'income'), 0) / 100,
+            'expense': totals.get((label, 'expense'), 0) / 100,
+        })
+
+    return series
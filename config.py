@@ -21,8 +21,76 @@ class Config:
     SQLALCHEMY_DATABASE_URI = f'sqlite:///{DATABASE_PATH}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Пул соединений SQLite
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 10))
+    DATABASE_POOL_TIMEOUT = float(os.environ.get('DATABASE_POOL_TIMEOUT', 30))
+    
+    # Очередь записи (режим WAL, единственный писатель)
+    DATABASE_BUSY_TIMEOUT = float(os.environ.get('DATABASE_BUSY_TIMEOUT', 5))
+    DATABASE_WRITE_RETRIES = int(os.environ.get('DATABASE_WRITE_RETRIES', 5))
+    DATABASE_WRITE_BACKOFF = float(os.environ.get('DATABASE_WRITE_BACKOFF', 0.05))
+    
+    # Применять миграции при старте (в продакшене - через `flask db upgrade`)
+    DATABASE_AUTO_MIGRATE = os.environ.get('DATABASE_AUTO_MIGRATE', 'true').lower() == 'true'
+    
+    # Сколько версий данных пользователей процесс держит в памяти
+    VERSION_TRACKER_MAX_USERS = int(os.environ.get('VERSION_TRACKER_MAX_USERS', 100000))
+    
+    # Кеш результатов: memory (в процессе), sqlite (общий для воркеров) или null
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_PATH = os.environ.get('CACHE_PATH', 'family_finance_cache.db')
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+    CACHE_DEFAULT_TTL = float(os.environ.get('CACHE_DEFAULT_TTL', 300))
+    
+    # Кеш идентичности для load_user и снимок идентичности в сессии
+    IDENTITY_CACHE_MAX_ENTRIES = int(os.environ.get('IDENTITY_CACHE_MAX_ENTRIES', 10000))
+    IDENTITY_CACHE_TTL = float(os.environ.get('IDENTITY_CACHE_TTL', 60))
+    IDENTITY_SESSION_SNAPSHOT = os.environ.get('IDENTITY_SESSION_SNAPSHOT', 'false').lower() == 'true'
+    
+    # Месяц сохраняется снимком отчета через столько дней после его окончания
+    REPORT_SNAPSHOT_GRACE_DAYS = int(os.environ.get('REPORT_SNAPSHOT_GRACE_DAYS', 3))
+    
+    # Фоновые задачи: потоки, длина очереди, каталог и срок хранения результатов
+    # (без JOBS_RESULTS_DIR файлы хранятся в instance/job_results)
+    JOBS_MAX_WORKERS = int(os.environ.get('JOBS_MAX_WORKERS', 2))
+    JOBS_MAX_QUEUED = int(os.environ.get('JOBS_MAX_QUEUED', 20))
+    JOBS_RESULTS_DIR = os.environ.get('JOBS_RESULTS_DIR')
+    JOBS_RESULT_TTL = float(os.environ.get('JOBS_RESULT_TTL', 86400))
+    
+    # Учет SQL по запросам: Server-Timing, предупреждения N+1 и медленные запросы
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', 'true').lower() == 'true'
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+    SQL_SLOW_REQUEST_THRESHOLD = float(os.environ.get('SQL_SLOW_REQUEST_THRESHOLD', 0.5))
+    SQL_SLOWEST_STATEMENTS = int(os.environ.get('SQL_SLOWEST_STATEMENTS', 3))
+    
+    # Метрики /metrics: каталог снимков воркеров (очищается при развертывании)
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1))
+    
     # Аутентификация
     BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    
+    # Пул хеширования паролей: потоки, длина очереди и Retry-After для отказов
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_QUEUED = int(os.environ.get('PASSWORD_HASH_MAX_QUEUED', 16))
+    PASSWORD_HASH_RETRY_AFTER = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', 2))
+    
+    # Подбор стоимости bcrypt при старте: допустимое время проверки пароля
+    # в секундах и границы стоимости. 0 отключает замер при старте, и хеши
+    # создаются с BCRYPT_LOG_ROUNDS; подбор не опускает стоимость ниже него
+    PASSWORD_HASH_TARGET_TIME = float(os.environ.get('PASSWORD_HASH_TARGET_TIME', 0))
+    PASSWORD_HASH_MIN_ROUNDS = int(os.environ.get('PASSWORD_HASH_MIN_ROUNDS', 10))
+    PASSWORD_HASH_MAX_ROUNDS = int(os.environ.get('PASSWORD_HASH_MAX_ROUNDS', 16))
+    
+    # Ограничение частоты входа и регистрации: memory (в процессе),
+    # sqlite (общий для воркеров) или null; правила вида '5/minute'.
+    # RATE_LIMIT_LOGIN_EMAIL считает только неверные пароли для пары email и адрес
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_PATH = os.environ.get('RATE_LIMIT_PATH', 'family_finance_ratelimit.db')
+    RATE_LIMIT_MAX_ENTRIES = int(os.environ.get('RATE_LIMIT_MAX_ENTRIES', 100000))
+    RATE_LIMIT_LOGIN_IP = os.environ.get('RATE_LIMIT_LOGIN_IP', '20/minute')
+    RATE_LIMIT_LOGIN_EMAIL = os.environ.get('RATE_LIMIT_LOGIN_EMAIL', '5/minute')
+    RATE_LIMIT_REGISTER_IP = os.environ.get('RATE_LIMIT_REGISTER_IP', '5/hour')
     LOGIN_DISABLED = False
     
     # Интернационализация
@@ -98,6 +166,9 @@ class ProductionConfig(Config):
     # Более строгие настройки bcrypt
     BCRYPT_LOG_ROUNDS = 15
     
+    # Миграции запускаются явно: `flask db upgrade`
+    DATABASE_AUTO_MIGRATE = os.environ.get('DATABASE_AUTO_MIGRATE', 'false').lower() == 'true'
+    
     # Отключаем отладочную информацию
     ERROR_404_HELP = False
     
@@ -0,0 +1,943 @@
+"""
+Слой доступа к базе данных SQLite для приложения управления финансами.
+Предоставляет пулы соединений, привязанные к запросу Flask, и единственного
+писателя в режиме WAL.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+
+import click
+from flask import current_app, g, has_request_context, request
+from flask.cli import AppGroup
+
+from aggregates import (
+    create_monthly_totals, rebuild_monthly_totals, verify_monthly_totals
+)
+from instrumentation import InstrumentedConnection, setup_instrumentation
+from reports import create_report_snapshots
+from search import create_fts_index
+from versions import VersionTracker, create_data_versions, use_request_tracker
+
+
+# ============================================================================
+# Схема базы данных
+# ============================================================================
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    email TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL DEFAULT 'expense',
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    color TEXT DEFAULT '#3498db',
+    icon TEXT DEFAULT 'fa-folder',
+    budget_limit REAL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    amount REAL NOT NULL,
+    description TEXT,
+    type TEXT NOT NULL,
+    date DATE NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    category_id INTEGER REFERENCES categories (id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+'''
+
+# Таблица учета примененных миграций
+MIGRATIONS_TABLE = '''
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+'''
+
+# Миграция: version - номер по возрастанию, apply - SQL скрипт или функция(db)
+Migration = namedtuple('Migration', ['version', 'name', 'apply'])
+
+
+def create_unique_user_indexes(db):
+    """
+    Замена индексов users (email) и users (username) на уникальные.
+
+    Используется миграцией. Дубликаты, созданные до появления индексов,
+    автоматически не объединяются: миграция останавливается со списком.
+
+    Args:
+        db (sqlite3.Connection): Соединение писателя в открытой транзакции
+
+    Raises:
+        RuntimeError: Если в users есть повторяющиеся email или имена
+    """
+    for column in ('email', 'username'):
+        duplicates = [row[0] for row in db.execute(
+            f'SELECT {column} FROM users GROUP BY {column} HAVING COUNT(*) > 1 LIMIT 10'
+        )]
+        if duplicates:
+            raise RuntimeError(
+                f'Повторяющиеся значения users.{column}: {", ".join(duplicates)}; '
+                f'объедините учетные записи перед миграцией'
+            )
+
+    for column in ('email', 'username'):
+        db.execute(f'DROP INDEX IF EXISTS idx_users_{column}')
+        db.execute(f'CREATE UNIQUE INDEX idx_users_{column} ON users ({column})')
+
+MIGRATIONS = [
+    Migration(1, 'transaction_hot_path_indexes', '''
+        -- Лента транзакций: WHERE user_id = ? ORDER BY date DESC, created_at DESC.
+        -- type и amount делают индекс покрывающим для сумм по периоду.
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_date
+            ON transactions (user_id, date DESC, created_at DESC, type, amount);
+
+        -- Статистика категории: WHERE category_id = ? AND user_id = ?
+        CREATE INDEX IF NOT EXISTS idx_transactions_category_user
+            ON transactions (category_id, user_id, type, amount);
+
+        -- Списки и проверка уникальности категорий пользователя
+        CREATE INDEX IF NOT EXISTS idx_categories_user_name
+            ON categories (user_id, name);
+
+        -- Вход и проверки при регистрации
+        CREATE INDEX IF NOT EXISTS idx_users_email ON users (email);
+        CREATE INDEX IF NOT EXISTS idx_users_username ON users (username);
+    '''),
+    Migration(2, 'transaction_seek_index', '''
+        -- Курсорная пагинация: ключ (date, created_at, id) целиком в индексе,
+        -- обратный обход дает порядок DESC без временного B-дерева.
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_seek
+            ON transactions (user_id, date, created_at, id, type, amount);
+        DROP INDEX IF EXISTS idx_transactions_user_date;
+    '''),
+    # Полнотекстовый индекс описаний с заполнением существующих строк
+    Migration(3, 'transactions_fts', create_fts_index),
+    # Помесячные агрегаты, поддерживаемые триггерами
+    Migration(4, 'monthly_totals', create_monthly_totals),
+    # Версии данных пользователей для ETag и согласованности кешей
+    Migration(5, 'data_versions', create_data_versions),
+    # Снимки отчетов за закрытые месяцы, удаляемые триггерами при записи задним числом
+    Migration(6, 'report_snapshots', create_report_snapshots),
+    Migration(7, 'jobs', '''
+        -- Фоновые задачи: статус, прогресс и файл результата.
+        -- cancel_requested читается выполняющейся задачей в любом воркере.
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            params TEXT,
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            error TEXT,
+            result_path TEXT,
+            result_name TEXT,
+            result_mimetype TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+
+        -- Список задач пользователя от новых к старым
+        CREATE INDEX IF NOT EXISTS idx_jobs_user_created ON jobs (user_id, created_at);
+    '''),
+    # Уникальность email и имени пользователя обеспечивает база данных
+    Migration(8, 'users_unique', create_unique_user_indexes),
+    # Процесс (хост:PID), принявший задачу, для восстановления после перезапуска
+    Migration(9, 'jobs_owner', '''
+        ALTER TABLE jobs ADD COLUMN owner TEXT;
+    '''),
+]
+
+# PRAGMA, применяемые один раз при создании соединения
+DEFAULT_PRAGMAS = (
+    ('foreign_keys', 'ON'),
+    ('synchronous', 'NORMAL'),  # Безопасно в режиме WAL
+    ('temp_store', 'MEMORY'),
+    ('cache_size', '-8000'),  # ~8MB страничного кеша на соединение
+)
+
+# Соединения читателей не могут изменять базу данных
+READER_PRAGMAS = DEFAULT_PRAGMAS + (('query_only', 'ON'),)
+
+# HTTP методы, для которых get_db() возвращает соединение только для чтения
+READ_ONLY_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведенное время."""
+
+
+# ============================================================================
+# Пул соединений
+# ============================================================================
+
+class ConnectionPool:
+    """
+    Ограниченный потокобезопасный пул соединений SQLite.
+
+    Соединения создаются по требованию (не больше max_size), PRAGMA
+    применяются один раз при создании, после возврата в пул соединение
+    переиспользуется следующим запросом.
+    """
+
+    def __init__(self, database_path, max_size=10, timeout=30.0,
+                 pragmas=DEFAULT_PRAGMAS, busy_timeout=5.0, factory=sqlite3.Connection):
+        """
+        Инициализация пула.
+
+        Args:
+            database_path (str): Путь к файлу базы данных
+            max_size (int): Максимальное количество открытых соединений
+            timeout (float): Время ожидания свободного соединения в секундах
+            pragmas (tuple): Пары (имя, значение) PRAGMA для новых соединений
+            busy_timeout (float): Ожидание снятия блокировки SQLite в секундах
+            factory (type): Класс соединения (например, InstrumentedConnection)
+        """
+        self.database_path = database_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = tuple(pragmas)
+        self.busy_timeout = busy_timeout
+        self.factory = factory
+
+        self._idle = deque()
+        self._condition = threading.Condition()
+        self._size = 0
+        self._checked_out = 0
+        self._created = 0
+        self._waits = 0
+        self._wait_time = 0.0
+
+    def _connect(self):
+        """Создание нового соединения с примененными PRAGMA."""
+        connection = sqlite3.connect(
+            self.database_path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,  # Соединение переходит между потоками через пул
+            factory=self.factory
+        )
+        connection.row_factory = sqlite3.Row
+
+        for name, value in self.pragmas:
+            connection.execute(f'PRAGMA {name} = {value}')
+
+        return connection
+
+    def acquire(self, timeout=None):
+        """
+        Получение соединения из пула.
+
+        Args:
+            timeout (float): Время ожидания; по умолчанию таймаут пула
+
+        Returns:
+            sqlite3.Connection: Соединение с базой данных
+
+        Raises:
+            PoolTimeoutError: Если свободное соединение не появилось вовремя
+        """
+        timeout = self.timeout if timeout is None else timeout
+
+        with self._condition:
+            if not self._idle and self._size >= self.max_size:
+                self._waits += 1
+                started = time.perf_counter()
+                deadline = started + timeout
+
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._wait_time += time.perf_counter() - started
+                        raise PoolTimeoutError(
+                            f'Нет свободных соединений с БД ({self.max_size} занято)'
+                        )
+                    self._condition.wait(remaining)
+
+                self._wait_time += time.perf_counter() - started
+
+            if self._idle:
+                self._checked_out += 1
+                return self._idle.pop()
+
+            # Резервируем место под новое соединение
+            self._size += 1
+            self._checked_out += 1
+
+        try:
+            connection = self._connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._checked_out -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._created += 1
+        return connection
+
+    def release(self, connection):
+        """
+        Возврат соединения в пул.
+
+        Незавершенная транзакция откатывается; сломанное соединение
+        закрывается и освобождает место в пуле.
+
+        Args:
+            connection (sqlite3.Connection): Ранее полученное соединение
+        """
+        healthy = True
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except sqlite3.Error:
+            healthy = False
+            connection.close()
+
+        with self._condition:
+            self._checked_out -= 1
+            if healthy:
+                self._idle.append(connection)
+            else:
+                self._size -= 1
+            self._condition.notify()
+
+    def close(self):
+        """Закрытие всех свободных соединений пула."""
+        with self._condition:
+            while self._idle:
+                self._idle.pop().close()
+                self._size -= 1
+
+    def stats(self):
+        """
+        Статистика использования пула.
+
+        Returns:
+            dict: Размер, занятые и свободные соединения, ожидания
+        """
+        with self._condition:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'checked_out': self._checked_out,
+                'idle': len(self._idle),
+                'created': self._created,
+                'waits': self._waits,
+                'wait_time': round(self._wait_time, 6),
+            }
+
+
+class Writer:
+    """
+    Единственный писатель базы данных.
+
+    Все изменения выполняются через одно соединение, доступ к которому
+    выдается по очереди. Транзакция открывается через BEGIN IMMEDIATE;
+    если файл заблокирован другим процессом, попытка повторяется
+    с экспоненциальной задержкой.
+    """
+
+    def __init__(self, database_path, busy_timeout=5.0, retries=5,
+                 backoff=0.05, queue_timeout=30.0, factory=sqlite3.Connection):
+        """
+        Инициализация писателя.
+
+        Args:
+            database_path (str): Путь к файлу базы данных
+            busy_timeout (float): Ожидание снятия блокировки SQLite в секундах
+            retries (int): Количество повторов BEGIN при блокировке
+            backoff (float): Начальная задержка между повторами в секундах
+            queue_timeout (float): Максимальное ожидание своей очереди
+            factory (type): Класс соединения
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self._queue = ConnectionPool(
+            database_path,
+            max_size=1,
+            timeout=queue_timeout,
+            busy_timeout=busy_timeout,
+            factory=factory
+        )
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._transactions = 0
+        self._busy_retries = 0
+        self._busy_failures = 0
+
+    def _begin(self, connection):
+        """Открытие транзакции записи с повторами при блокировке."""
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                connection.execute('BEGIN IMMEDIATE')
+                return
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+                if attempt == self.retries:
+                    with self._lock:
+                        self._busy_failures += 1
+                    raise
+                with self._lock:
+                    self._busy_retries += 1
+                time.sleep(delay)
+                delay *= 2
+
+    @contextmanager
+    def connection(self):
+        """
+        Эксклюзивное соединение писателя без открытия транзакции.
+
+        Yields:
+            sqlite3.Connection: Соединение писателя
+        """
+        current = getattr(self._local, 'connection', None)
+        if current is not None:
+            yield current
+            return
+
+        connection = self._queue.acquire()
+        self._local.connection = connection
+        try:
+            yield connection
+        finally:
+            self._local.connection = None
+            self._queue.release(connection)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Транзакция записи: коммит при успехе, откат при исключении.
+
+        Вложенные вызовы в том же потоке выполняются в рамках внешней
+        транзакции.
+
+        Yields:
+            sqlite3.Connection: Соединение писателя
+        """
+        with self.connection() as connection:
+            if connection.in_transaction:
+                yield connection
+                return
+
+            self._begin(connection)
+            try:
+                yield connection
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+
+            with self._lock:
+                self._transactions += 1
+
+    def close(self):
+        """Закрытие соединения писателя."""
+        self._queue.close()
+
+    def stats(self):
+        """
+        Статистика очереди записи.
+
+        Returns:
+            dict: Ожидания очереди, повторы и ошибки блокировки
+        """
+        queue = self._queue.stats()
+        with self._lock:
+            return {
+                'transactions': self._transactions,
+                'lock_waits': queue['waits'],
+                'lock_wait_time': queue['wait_time'],
+                'busy_retries': self._busy_retries,
+                'busy_failures': self._busy_failures,
+            }
+
+
+# ============================================================================
+# Интеграция с Flask
+# ============================================================================
+
+class Database:
+    """Пулы читателей и соединений общего назначения плюс единственный писатель."""
+
+    def __init__(self, config):
+        """
+        Инициализация по конфигурации приложения.
+
+        Args:
+            config (dict): Конфигурация Flask приложения
+        """
+        path = config.get('DATABASE_PATH', 'family_finance.db')
+        pool_size = config.get('DATABASE_POOL_SIZE', 10)
+        pool_timeout = config.get('DATABASE_POOL_TIMEOUT', 30.0)
+        busy_timeout = config.get('DATABASE_BUSY_TIMEOUT', 5.0)
+        factory = (InstrumentedConnection if config.get('SQL_INSTRUMENTATION', True)
+                   else sqlite3.Connection)
+
+        self.readers = ConnectionPool(
+            path, max_size=pool_size, timeout=pool_timeout,
+            pragmas=READER_PRAGMAS, busy_timeout=busy_timeout, factory=factory
+        )
+        self.connections = ConnectionPool(
+            path, max_size=pool_size, timeout=pool_timeout,
+            busy_timeout=busy_timeout, factory=factory
+        )
+        self.writer = Writer(
+            path,
+            busy_timeout=busy_timeout,
+            retries=config.get('DATABASE_WRITE_RETRIES', 5),
+            backoff=config.get('DATABASE_WRITE_BACKOFF', 0.05),
+            queue_timeout=pool_timeout,
+            factory=factory
+        )
+        self.versions = VersionTracker(config.get('VERSION_TRACKER_MAX_USERS', 100000))
+        self._path = path
+        self._monitor = None
+        self._monitor_lock = threading.Lock()
+
+    def data_version(self):
+        """
+        Счетчик PRAGMA data_version отдельного соединения наблюдателя.
+
+        Значение меняется после фиксации транзакции любым другим соединением,
+        включая писателя этого процесса и соединения других воркеров.
+
+        Returns:
+            int: Значение счетчика
+        """
+        with self._monitor_lock:
+            if self._monitor is None:
+                self._monitor = sqlite3.connect(self._path, check_same_thread=False)
+            return self._monitor.execute('PRAGMA data_version').fetchone()[0]
+
+    def stats(self):
+        """Статистика всех пулов и писателя."""
+        return {
+            'readers': self.readers.stats(),
+            'connections': self.connections.stats(),
+            'writer': self.writer.stats(),
+            'versions': self.versions.stats(),
+        }
+
+    def close(self):
+        """Закрытие всех свободных соединений."""
+        self.readers.close()
+        self.connections.close()
+        self.writer.close()
+        with self._monitor_lock:
+            if self._monitor is not None:
+                self._monitor.close()
+                self._monitor = None
+
+
+_databases_lock = threading.Lock()
+
+
+def get_database(app=None):
+    """
+    Получение пулов соединений для текущей базы данных приложения.
+
+    Объект создается лениво и кешируется по пути к файлу БД, поэтому смена
+    DATABASE_PATH (например, в тестах) получает собственные пулы.
+
+    Args:
+        app (Flask): Приложение; по умолчанию current_app
+
+    Returns:
+        Database: Пулы соединений и писатель
+    """
+    app = app or current_app
+    path = app.config.get('DATABASE_PATH', 'family_finance.db')
+    databases = app.extensions.setdefault('databases', {})
+
+    database = databases.get(path)
+    if database is None:
+        with _databases_lock:
+            database = databases.get(path)
+            if database is None:
+                database = databases[path] = Database(app.config)
+    return database
+
+
+def get_pool(app=None, readonly=False):
+    """
+    Пул соединений текущей базы данных.
+
+    Args:
+        app (Flask): Приложение; по умолчанию current_app
+        readonly (bool): Пул соединений только для чтения
+
+    Returns:
+        ConnectionPool: Пул соединений
+    """
+    database = get_database(app)
+    return database.readers if readonly else database.connections
+
+
+def get_db(readonly=None):
+    """
+    Соединение с базой данных для текущего контекста.
+
+    Соединение берется из пула при первом обращении и возвращается
+    в пул при завершении контекста. Для GET/HEAD запросов соединение
+    открыто только для чтения; изменения выполняются через
+    write_transaction().
+
+    Args:
+        readonly (bool): Режим только для чтения; по умолчанию по методу запроса
+
+    Returns:
+        sqlite3.Connection: Соединение с базой данных
+    """
+    if readonly is None:
+        readonly = g.get('db_readonly_request', False)
+
+    key = 'db_readonly' if readonly else 'db'
+    if key not in g:
+        request_version_tracker()
+        pool = get_pool(readonly=readonly)
+        setattr(g, key, (pool.acquire(), pool))
+    return getattr(g, key)[0]
+
+
+def _mark_readonly_request():
+    """Запросы с безопасными методами получают соединения только для чтения."""
+    g.db_readonly_request = request.method in READ_ONLY_METHODS
+
+
+def request_version_tracker():
+    """
+    Трекер версий данных для текущего запроса.
+
+    PRAGMA data_version сверяется при первом обращении запроса к данным
+    (get_db или current_data_version), поэтому /health, /metrics и статика
+    не занимают общее соединение наблюдателя.
+
+    Returns:
+        VersionTracker: Трекер или None вне запроса
+    """
+    if not has_request_context():
+        return None
+    tracker = g.get('version_tracker')
+    if tracker is None:
+        database = get_database()
+        database.versions.check(database.data_version())
+        tracker = g.version_tracker = database.versions
+    return tracker
+
+
+use_request_tracker(request_version_tracker)
+
+
+def close_db_connection(exception=None):
+    """
+    Возврат соединений текущего контекста в пул.
+
+    Безопасно вызывать повторно и когда соединение не запрашивалось.
+    """
+    for key in ('db', 'db_readonly'):
+        entry = g.pop(key, None)
+        if entry is not None:
+            connection, pool = entry
+            pool.release(connection)
+
+
+# Обработчики, вызываемые после фиксации изменений данных пользователя
+_change_listeners = []
+_write_state = threading.local()
+
+
+def on_user_data_changed(listener):
+    """
+    Регистрация обработчика изменения данных пользователя.
+
+    Обработчик вызывается с user_id после фиксации внешней транзакции
+    write_transaction(user_id=...). Может использоваться как декоратор.
+
+    Args:
+        listener (callable): Функция listener(user_id)
+
+    Returns:
+        callable: Тот же обработчик
+    """
+    _change_listeners.append(listener)
+    return listener
+
+
+@contextmanager
+def write_transaction(user_id=None):
+    """
+    Транзакция записи через единственного писателя.
+
+    Example:
+        with write_transaction(user_id) as db:
+            db.execute('INSERT INTO ...', params)
+
+    Args:
+        user_id (int): Пользователь, чьи данные изменяются; после коммита
+            вызываются обработчики on_user_data_changed
+
+    Yields:
+        sqlite3.Connection: Соединение писателя в открытой транзакции
+    """
+    changed = getattr(_write_state, 'changed', None)
+    outermost = changed is None
+    if outermost:
+        changed = _write_state.changed = set()
+
+    database = get_database()
+    try:
+        with database.writer.transaction() as connection:
+            yield connection
+            if user_id is not None:
+                changed.add(user_id)
+    finally:
+        if outermost:
+            _write_state.changed = None
+
+    if outermost:
+        for changed_user_id in changed:
+            database.versions.invalidate(changed_user_id)
+            for listener in _change_listeners:
+                listener(changed_user_id)
+
+
+def unique_violation(error):
+    """
+    Колонка, нарушившая ограничение UNIQUE.
+
+    Example:
+        try:
+            with write_transaction() as db:
+                db.execute('INSERT INTO users ...', params)
+        except sqlite3.IntegrityError as e:
+            if unique_violation(e) == 'users.email':
+                ...
+
+    Args:
+        error (sqlite3.IntegrityError): Ошибка выполнения выражения
+
+    Returns:
+        str: 'таблица.колонка' (первая колонка составного ключа) или None
+    """
+    message = str(error)
+    prefix = 'UNIQUE constraint failed: '
+    if not message.startswith(prefix):
+        return None
+    return message[len(prefix):].split(',')[0].strip()
+
+
+def get_pool_stats(app=None):
+    """
+    Статистика пулов соединений и очереди записи текущей базы данных.
+
+    Returns:
+        dict: Статистика читателей, соединений и писателя
+    """
+    return get_database(app).stats()
+
+
+# ============================================================================
+# Миграции схемы
+# ============================================================================
+
+def _split_statements(script):
+    """
+    Разбиение SQL скрипта на отдельные выражения.
+
+    В отличие от разбиения по ';' корректно обрабатывает тела триггеров.
+    """
+    statements = []
+    buffer = ''
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            if buffer.strip():
+                statements.append(buffer.strip())
+            buffer = ''
+    if buffer.strip() and not buffer.strip().startswith('--'):
+        statements.append(buffer.strip())
+    return statements
+
+
+def get_schema_version(db):
+    """
+    Номер последней примененной миграции.
+
+    Args:
+        db (sqlite3.Connection): Соединение с базой данных
+
+    Returns:
+        int: Версия схемы; 0, если миграции не применялись
+    """
+    exists = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'"
+    ).fetchone()
+    if not exists:
+        return 0
+    return db.execute(
+        'SELECT COALESCE(MAX(version), 0) FROM schema_migrations'
+    ).fetchone()[0]
+
+
+def migrate(target=None):
+    """
+    Применение недостающих миграций.
+
+    Каждая миграция выполняется в отдельной транзакции писателя вместе
+    с записью в schema_migrations, поэтому прерванное обновление можно
+    безопасно запустить повторно, а параллельно стартующие процессы
+    не применят миграцию дважды.
+
+    Args:
+        target (int): Версия, до которой обновить схему; по умолчанию последняя
+
+    Returns:
+        list: Примененные миграции
+    """
+    writer = get_database().writer
+    applied = []
+
+    with writer.transaction() as db:
+        for statement in _split_statements(MIGRATIONS_TABLE):
+            db.execute(statement)
+
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if target is not None and migration.version > target:
+            break
+
+        with writer.transaction() as db:
+            if get_schema_version(db) >= migration.version:
+                continue
+
+            if callable(migration.apply):
+                migration.apply(db)
+            else:
+                for statement in _split_statements(migration.apply):
+                    db.execute(statement)
+
+            db.execute(
+                'INSERT INTO schema_migrations (version, name) VALUES (?, ?)',
+                (migration.version, migration.name)
+            )
+            db.execute(f'PRAGMA user_version = {int(migration.version)}')
+
+        applied.append(migration)
+
+    return applied
+
+
+db_cli = AppGroup('db', help='Управление схемой базы данных.')
+
+
+@db_cli.command('upgrade')
+@click.option('--target', type=int, default=None, help='Версия схемы для обновления.')
+def upgrade_command(target):
+    """Применение недостающих миграций."""
+    init_db(run_migrations=False)
+    applied = migrate(target)
+
+    for migration in applied:
+        click.echo(f'Применена миграция {migration.version}: {migration.name}')
+    if not applied:
+        click.echo('Схема базы данных актуальна')
+
+    with get_database().writer.connection() as db:
+        db.execute('PRAGMA optimize')
+
+
+@db_cli.command('current')
+def current_command():
+    """Вывод текущей версии схемы."""
+    with get_database().writer.connection() as db:
+        click.echo(get_schema_version(db))
+
+
+@db_cli.command('history')
+def history_command():
+    """Список миграций и их статус."""
+    with get_database().writer.connection() as db:
+        version = get_schema_version(db)
+
+    for migration in MIGRATIONS:
+        status = 'применена' if migration.version <= version else 'ожидает'
+        click.echo(f'{migration.version:>4}  {migration.name}  [{status}]')
+
+
+@db_cli.command('rebuild-totals')
+@click.option('--user-id', type=int, default=None, help='Пересчитать одного пользователя.')
+@click.option('--verify-only', is_flag=True, help='Только проверить, без пересчета.')
+def rebuild_totals_command(user_id, verify_only):
+    """Пересчет и проверка помесячных агрегатов транзакций."""
+    writer = get_database().writer
+
+    if not verify_only:
+        with writer.transaction() as db:
+            rows = rebuild_monthly_totals(db, user_id)
+        click.echo(f'Пересчитано строк агрегатов: {rows}')
+
+    with writer.connection() as db:
+        mismatches = verify_monthly_totals(db, user_id)
+
+    if mismatches:
+        for mismatch in mismatches:
+            click.echo('Расхождение: user_id={} month={} category_id={} type={}'.format(*mismatch))
+        raise click.ClickException(f'Найдено расхождений: {len(mismatches)}')
+
+    click.echo('Агрегаты совпадают с транзакциями')
+
+
+def init_db(run_migrations=None):
+    """
+    Создание таблиц базы данных, если они еще не существуют.
+
+    Переводит базу данных в режим WAL, в котором читатели не блокируют
+    писателя и наоборот, и применяет миграции, если включен
+    DATABASE_AUTO_MIGRATE.
+
+    Args:
+        run_migrations (bool): Применить миграции; по умолчанию из конфигурации
+    """
+    with get_database().writer.connection() as db:
+        db.execute('PRAGMA journal_mode = WAL')
+        db.executescript(SCHEMA)
+        db.commit()
+
+    if run_migrations is None:
+        run_migrations = current_app.config.get('DATABASE_AUTO_MIGRATE', True)
+    if run_migrations:
+        migrate()
+
+
+def setup_database(app):
+    """
+    Подключение слоя базы данных к приложению.
+
+    Args:
+        app (Flask): Приложение Flask
+    """
+    # Первым, чтобы учитывать SQL остальных обработчиков запроса
+    if app.config.get('SQL_INSTRUMENTATION', True):
+        setup_instrumentation(app)
+    app.before_request(_mark_readonly_request)
+    app.teardown_appcontext(close_db_connection)
+    app.cli.add_command(db_cli)
@@ -0,0 +1,108 @@
+"""
+Потоковый экспорт транзакций.
+
+Строки читаются из курсора пачками и сразу превращаются в CSV, поэтому
+память процесса не зависит от размера выгрузки.
+"""
+
+import csv
+import io
+import zlib
+
+
+# Количество строк, читаемых из курсора за один раз
+EXPORT_CHUNK_SIZE = 1000
+
+# Заголовки CSV файла транзакций
+CSV_HEADER = ['Дата', 'Сумма', 'Тип', 'Категория', 'Описание']
+
+
+def iter_csv(cursor, type_labels, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Генератор CSV по курсору транзакций.
+
+    Args:
+        cursor (sqlite3.Cursor): Курсор с полями date, amount, type, category, description
+        type_labels (dict): Подписи типов операций {'income': ..., 'expense': ...}
+        chunk_size (int): Количество строк в одной пачке
+
+    Yields:
+        str: Фрагмент CSV (заголовок или пачка строк)
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(CSV_HEADER)
+    yield buffer.getvalue()
+
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            [
+                row['date'],
+                row['amount'],
+                type_labels.get(row['type'], row['type']),
+                row['category'] or '',
+                row['description'] or '',
+            ]
+            for row in rows
+        )
+        yield buffer.getvalue()
+
+
+def iter_query_csv(pool, query, params, type_labels, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Генератор CSV по запросу на собственном соединении пула.
+
+    Ответ отдается после завершения запроса Flask, когда соединение
+    запроса уже возвращено в пул, поэтому генератор берет соединение
+    при первой итерации и возвращает его по завершении или закрытии.
+
+    Args:
+        pool (ConnectionPool): Пул соединений только для чтения
+        query (str): Запрос с полями date, amount, type, category, description
+        params (list): Параметры запроса
+        type_labels (dict): Подписи типов операций
+        chunk_size (int): Количество строк в одной пачке
+
+    Yields:
+        str: Фрагмент CSV
+    """
+    connection = pool.acquire()
+    try:
+        yield from iter_csv(connection.execute(query, params), type_labels, chunk_size)
+    finally:
+        pool.release(connection)
+
+
+def gzip_stream(chunks, encoding='utf-8', level=6):
+    """
+    Сжатие потока текстовых фрагментов в формат gzip на лету.
+
+    Args:
+        chunks (iterable): Текстовые фрагменты
+        encoding (str): Кодировка текста
+        level (int): Уровень сжатия zlib
+
+    Yields:
+        bytes: Фрагменты gzip файла
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode(encoding))
+            if data:
+                yield data
+
+        yield compressor.flush()
+    finally:
+        # Закрытие источника возвращает его соединение в пул
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,334 @@
+"""
+Фильтры списка транзакций.
+
+Один компилятор фильтров формирует условия WHERE для страницы списка,
+подсчета итогов и экспорта, а количество строк по фильтру кешируется
+до следующего изменения данных пользователя.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from database import on_user_data_changed
+from prefix_sums import range_totals
+from search import build_match_query
+from versions import current_data_version, on_version_changed
+
+
+class TransactionFilter:
+    """
+    Нормализованный набор фильтров транзакций.
+
+    Пустые значения отбрасываются, поэтому одинаковые по смыслу фильтры
+    дают одинаковый ключ кеша.
+    """
+
+    FIELDS = (
+        'start_date', 'end_date', 'category_id',
+        'transaction_type', 'min_amount', 'max_amount', 'search'
+    )
+
+    def __init__(self, start_date=None, end_date=None, category_id=None,
+                 transaction_type=None, min_amount=None, max_amount=None,
+                 search=None):
+        """
+        Инициализация фильтра.
+
+        Args:
+            start_date (date|str): Начало периода включительно
+            end_date (date|str): Конец периода включительно
+            category_id (int): Категория; 0 - все категории
+            transaction_type (str): 'income', 'expense' или 'all'
+            min_amount (Decimal): Минимальная сумма
+            max_amount (Decimal): Максимальная сумма
+            search (str): Слова описания (поиск по префиксу)
+        """
+        self.start_date = _normalize_date(start_date)
+        self.end_date = _normalize_date(end_date)
+        self.category_id = int(category_id) if category_id not in (None, '', '0', 0) else None
+        self.transaction_type = (
+            transaction_type if transaction_type in ('income', 'expense') else None
+        )
+        self.min_amount = _normalize_amount(min_amount)
+        self.max_amount = _normalize_amount(max_amount)
+        self.search = search.strip() if search and search.strip() else None
+
+    @classmethod
+    def from_form(cls, form):
+        """
+        Фильтр из FilterForm; невалидная форма дает пустой фильтр.
+
+        Args:
+            form (FilterForm): Форма фильтров
+
+        Returns:
+            TransactionFilter: Фильтр
+        """
+        if not form.validate():
+            return cls()
+
+        return cls(**{name: getattr(form, name).data for name in cls.FIELDS})
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Фильтр из параметров запроса (для API и экспорта).
+
+        Args:
+            args (MultiDict): request.args
+
+        Returns:
+            TransactionFilter: Фильтр
+
+        Raises:
+            ValueError: Если дата или сумма в неверном формате
+        """
+        values = {name: args.get(name) for name in cls.FIELDS}
+        values['transaction_type'] = values['transaction_type'] or args.get('type')
+        return cls(**values)
+
+    def key(self):
+        """
+        Ключ фильтра для кеширования.
+
+        Returns:
+            tuple: Пары (поле, значение) непустых фильтров
+        """
+        return tuple(
+            (name, str(getattr(self, name)))
+            for name in self.FIELDS
+            if getattr(self, name) is not None
+        )
+
+    def compile(self, alias='t'):
+        """
+        Компиляция фильтра в SQL условия.
+
+        Args:
+            alias (str): Псевдоним таблицы transactions в запросе
+
+        Returns:
+            tuple: (строка ' AND ...', список параметров)
+        """
+        clauses = []
+        params = []
+
+        if self.start_date:
+            clauses.append(f'{alias}.date >= ?')
+            params.append(self.start_date)
+
+        if self.end_date:
+            clauses.append(f'{alias}.date <= ?')
+            params.append(self.end_date)
+
+        if self.category_id is not None:
+            clauses.append(f'{alias}.category_id = ?')
+            params.append(self.category_id)
+
+        if self.transaction_type:
+            clauses.append(f'{alias}.type = ?')
+            params.append(self.transaction_type)
+
+        if self.min_amount is not None:
+            clauses.append(f'{alias}.amount >= ?')
+            params.append(float(self.min_amount))
+
+        if self.max_amount is not None:
+            clauses.append(f'{alias}.amount <= ?')
+            params.append(float(self.max_amount))
+
+        match = build_match_query(self.search)
+        if match:
+            clauses.append(
+                f'{alias}.id IN (SELECT rowid FROM transactions_fts '
+                f'WHERE transactions_fts MATCH ?)'
+            )
+            params.append(match)
+
+        sql = ''.join(f' AND {clause}' for clause in clauses)
+        return sql, params
+
+    def __bool__(self):
+        return bool(self.key())
+
+    def __eq__(self, other):
+        return isinstance(other, TransactionFilter) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f'TransactionFilter({dict(self.key())})'
+
+
+def _normalize_date(value):
+    """Дата в формате ISO или None."""
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value.isoformat()
+    return date.fromisoformat(str(value)).isoformat()
+
+
+def _normalize_amount(value):
+    """Сумма как Decimal с двумя знаками или None."""
+    if value is None or value == '':
+        return None
+    try:
+        amount = Decimal(str(value))
+        if amount.is_finite():
+            return amount.quantize(Decimal('0.01'))
+    except InvalidOperation:
+        pass
+    raise ValueError(f'Некорректная сумма: {value}')
+
+
+# ============================================================================
+# Кеш количества транзакций
+# ============================================================================
+
+class CountCache:
+    """
+    Кеш количества транзакций по (пользователь, фильтр).
+
+    Записи пользователя сбрасываются при изменении его данных. Счетчик
+    поколений не дает сохранить значение, посчитанное до изменения.
+    """
+
+    def __init__(self, max_users=1000):
+        """
+        Инициализация кеша.
+
+        Args:
+            max_users (int): Максимальное число пользователей в кеше
+        """
+        self.max_users = max_users
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, key):
+        """Кешированное количество или None."""
+        with self._lock:
+            counts = self._entries.get(user_id)
+            if counts is not None and key in counts:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return counts[key]
+            self.misses += 1
+            return None
+
+    def generation(self, user_id):
+        """Текущее поколение данных пользователя."""
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def set(self, user_id, key, value, generation):
+        """Сохранение количества, если данные не менялись с generation."""
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return
+            self._entries.setdefault(user_id, {})[key] = value
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Сброс всех записей пользователя."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+
+count_cache = CountCache()
+on_user_data_changed(count_cache.invalidate)
+on_version_changed(count_cache.invalidate)
+
+
+def count_transactions(db, user_id, transaction_filter):
+    """
+    Количество транзакций пользователя по фильтру.
+
+    Повторные вызовы с тем же фильтром (страницы 2..N) берут значение
+    из кеша до следующего изменения данных пользователя.
+
+    Args:
+        db (sqlite3.Connection): Соединение с базой данных
+        user_id (int): ID пользователя
+        transaction_filter (TransactionFilter): Фильтр
+
+    Returns:
+        int: Количество транзакций
+    """
+    # Сверка версии сбрасывает количество, измененное другим воркером
+    current_data_version(db, user_id)
+
+    key = transaction_filter.key()
+    total = count_cache.get(user_id, key)
+    if total is not None:
+        return total
+
+    generation = count_cache.generation(user_id)
+    where, params = transaction_filter.compile()
+    total = db.execute(
+        'SELECT COUNT(*) AS total FROM transactions t WHERE t.user_id = ?' + where,
+        [user_id] + params
+    ).fetchone()['total']
+
+    count_cache.set(user_id, key, total, generation)
+    return total
+
+
+# Фильтры, итоги по которым дает индекс префиксных сумм
+_RANGE_FIELDS = {'start_date', 'end_date', 'transaction_type'}
+
+
+def summarize_transactions(db, user_id, transaction_filter):
+    """
+    Доходы, расходы и баланс транзакций пользователя по фильтру.
+
+    Фильтр только по датам и типу отвечается индексом префиксных сумм
+    без сканирования периода; остальные фильтры - одним запросом SUM.
+
+    Args:
+        db (sqlite3.Connection): Соединение с базой данных
+        user_id (int): ID пользователя
+        transaction_filter (TransactionFilter): Фильтр
+
+    Returns:
+        dict: income, expense и balance
+    """
+    fields = {name for name, _ in transaction_filter.key()}
+
+    if fields <= _RANGE_FIELDS:
+        totals = range_totals(
+            db, user_id,
+            date.fromisoformat(transaction_filter.start_date) if transaction_filter.start_date else None,
+            date.fromisoformat(transaction_filter.end_date) if transaction_filter.end_date else None
+        )
+        income, expense = totals['income'], totals['expense']
+        if transaction_filter.transaction_type == 'income':
+            expense = 0
+        elif transaction_filter.transaction_type == 'expense':
+            income = 0
+    else:
+        where, params = transaction_filter.compile()
+        row = db.execute(f'''
+            SELECT COALESCE(SUM(CASE WHEN t.type = 'income'
+                                     THEN CAST(ROUND(t.amount * 100) AS INTEGER) END), 0) AS income,
+                   COALESCE(SUM(CASE WHEN t.type = 'expense'
+                                     THEN CAST(ROUND(t.amount * 100) AS INTEGER) END), 0) AS expense
+            FROM transactions t
+            WHERE t.user_id = ?{where}
+        ''', [user_id] + params).fetchone()
+        income, expense = row['income'] / 100, row['expense'] / 100
+
+    return {
+        'income': income,
+        'expense': expense,
+        'balance': round(income - expense, 2),
+    }
@@ -0,0 +1,270 @@
+"""
+Кеш идентичности пользователей для Flask-Login.
+
+load_user вызывается в каждом аутентифицированном запросе, включая AJAX
+опросы. Поля пользователя хранятся в ограниченном LRU кеше процесса со
+временем жизни записи, поэтому обычно current_user определяется без
+обращения к базе данных.
+
+Запись пользователя удаляется из кеша:
+- после изменения профиля (forget_identity в маршруте profile);
+- когда трекер версий видит запись данных пользователя в другом воркере;
+- по истечении IDENTITY_CACHE_TTL, что ограничивает устаревание в
+  воркерах, которые этого пользователя еще не проверяли.
+
+При IDENTITY_SESSION_SNAPSHOT снимок идентичности дополнительно хранится
+в подписанной сессии вместе с версией данных пользователя и принимается,
+пока версия не изменилась, - так запрос обходится без чтения users и в
+воркере с холодным кешем.
+
+Хеш пароля в идентичность не входит: он нужен только при входе и смене
+пароля, которые читают строку пользователя сами.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app, has_request_context, session
+
+from database import get_db
+from models import User
+from versions import current_data_version, on_version_changed
+
+
+# Ключ снимка идентичности в сессии
+SESSION_KEY = '_identity'
+
+
+class IdentityCache:
+    """
+    Ограниченный LRU кеш идентичности пользователей со временем жизни записей.
+
+    Идентичность - кортеж (id, username, email, created_at). Счетчик
+    поколений не дает сохранить строку, прочитанную до сброса: поколение -
+    общий счетчик сбросов, а для пользователя помнится номер его последнего
+    сброса. Номера хранятся для не более max_entries пользователей; для
+    вытесненных действует наибольший вытесненный номер, поэтому память
+    ограничена, а устаревшая строка все равно не сохраняется.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60):
+        """
+        Инициализация кеша.
+
+        Args:
+            max_entries (int): Максимальное число пользователей в кеше
+            ttl (float): Время жизни записи в секундах
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._resets = OrderedDict()
+        self._generation = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, database, user_id):
+        """
+        Идентичность пользователя или None.
+
+        Args:
+            database (str): Путь к базе данных
+            user_id (int): ID пользователя
+
+        Returns:
+            tuple: Идентичность или None, если записи нет или она истекла
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry_database, identity, expires = entry
+                if entry_database == database and expires > time.monotonic():
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return identity
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def generation(self, user_id):
+        """Поколение кеша перед чтением записи пользователя из базы."""
+        with self._lock:
+            return self._generation
+
+    def set(self, database, user_id, identity, generation):
+        """Сохранение идентичности, если пользователь не сбрасывался с generation."""
+        with self._lock:
+            if generation < self._resets.get(user_id, self._floor):
+                return
+            self._entries[user_id] = (database, identity, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        """Удаление записи пользователя."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._generation += 1
+            self._resets[user_id] = self._generation
+            self._resets.move_to_end(user_id)
+            while len(self._resets) > self.max_entries:
+                self._floor = self._resets.popitem(last=False)[1]
+
+    def clear(self):
+        """Удаление всех записей."""
+        with self._lock:
+            self._generation += 1
+            self._floor = self._generation
+            self._resets.clear()
+            self._entries.clear()
+
+    def stats(self):
+        """Статистика кеша."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def init_identity(app):
+    """
+    Создание кеша идентичности приложения.
+
+    Args:
+        app (Flask): Приложение
+
+    Returns:
+        IdentityCache: Кеш, доступный через app.extensions['identity']
+    """
+    identity_cache = IdentityCache(
+        max_entries=app.config.get('IDENTITY_CACHE_MAX_ENTRIES', 10000),
+        ttl=app.config.get('IDENTITY_CACHE_TTL', 60)
+    )
+    app.extensions['identity'] = identity_cache
+    # Профиль, измененный другим воркером, перечитывается из базы
+    on_version_changed(identity_cache.discard)
+    return identity_cache
+
+
+def _identity_from_row(row):
+    """Идентичность из строки таблицы users."""
+    created_at = datetime.fromisoformat(row['created_at']) if row['created_at'] else None
+    return (row['id'], row['username'], row['email'], created_at)
+
+
+def _user(identity):
+    """Объект пользователя Flask-Login по идентичности."""
+    user_id, username, email, created_at = identity
+    return User(id=user_id, username=username, email=email,
+                password_hash=None, created_at=created_at)
+
+
+def _snapshot_enabled():
+    """Включено ли хранение снимка идентичности в сессии."""
+    return current_app.config.get('IDENTITY_SESSION_SNAPSHOT', False)
+
+
+def _store_snapshot(identity, version):
+    """Сохранение снимка идентичности в сессии."""
+    user_id, username, email, created_at = identity
+    session[SESSION_KEY] = [
+        user_id, username, email,
+        created_at.isoformat() if created_at else None, version
+    ]
+
+
+def _snapshot_identity(db, user_id):
+    """
+    Идентичность из снимка в сессии, если версия данных не изменилась.
+
+    Returns:
+        tuple: Идентичность или None
+    """
+    snapshot = session.get(SESSION_KEY)
+    if not snapshot or snapshot[0] != user_id:
+        return None
+    if snapshot[4] != current_data_version(db, user_id):
+        return None
+    created_at = datetime.fromisoformat(snapshot[3]) if snapshot[3] else None
+    return (user_id, snapshot[1], snapshot[2], created_at)
+
+
+def load_identity(user_id):
+    """
+    Пользователь для Flask-Login: из кеша, снимка в сессии или из базы.
+
+    Args:
+        user_id (int|str): ID пользователя из сессии
+
+    Returns:
+        User: Пользователь или None, если он не найден
+    """
+    user_id = int(user_id)
+    identity_cache = current_app.extensions['identity']
+    database = current_app.config['DATABASE_PATH']
+
+    identity = identity_cache.get(database, user_id)
+    if identity is not None:
+        return _user(identity)
+
+    generation = identity_cache.generation(user_id)
+    db = get_db()
+
+    snapshot = _snapshot_enabled()
+    if snapshot:
+        identity = _snapshot_identity(db, user_id)
+        if identity is not None:
+            identity_cache.set(database, user_id, identity, generation)
+            return _user(identity)
+        # Версия читается до строки: снимок не окажется новее своей версии
+        version = current_data_version(db, user_id)
+
+    row = db.execute(
+        'SELECT id, username, email, created_at FROM users WHERE id = ?', (user_id,)
+    ).fetchone()
+    if row is None:
+        return None
+
+    identity = _identity_from_row(row)
+    identity_cache.set(database, user_id, identity, generation)
+    if snapshot:
+        _store_snapshot(identity, version)
+    return _user(identity)
+
+
+def remember_identity(user_data):
+    """
+    Сохранение идентичности вошедшего пользователя.
+
+    Args:
+        user_data (sqlite3.Row): Строка таблицы users
+    """
+    identity = _identity_from_row(user_data)
+    identity_cache = current_app.extensions['identity']
+    # Снимок в сессии создаст load_identity: версия должна читаться до строки
+    identity_cache.set(current_app.config['DATABASE_PATH'], identity[0], identity,
+                       identity_cache.generation(identity[0]))
+
+
+def forget_identity(user_id):
+    """
+    Сброс идентичности пользователя после изменения его профиля.
+
+    Args:
+        user_id (int): ID пользователя
+    """
+    identity_cache = current_app.extensions.get('identity')
+    if identity_cache is not None:
+        identity_cache.discard(user_id)
+    if not has_request_context():
+        return
+    snapshot = session.get(SESSION_KEY)
+    if snapshot and snapshot[0] == user_id:
+        session.pop(SESSION_KEY)
@@ -0,0 +1,287 @@
+"""
+Массовый импорт транзакций из CSV (в том числе банковских выписок).
+
+Файл читается потоково, строки проверяются пачками по тем же правилам,
+что и TransactionForm, категории сопоставляются одним запросом, а
+вставка выполняется через executemany в отдельной транзакции на пачку.
+"""
+
+import csv
+import io
+import itertools
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import click
+from flask.cli import AppGroup
+from wtforms.validators import ValidationError
+
+from database import get_db, write_transaction
+from forms import TransactionForm
+from utils import sanitize_input
+from validators import AmountValidator, FutureDateValidator
+
+
+# Количество строк в одной транзакции вставки
+IMPORT_BATCH_SIZE = 1000
+
+# Максимум ошибок, возвращаемых пользователю (остальные только считаются)
+MAX_REPORTED_ERRORS = 100
+
+# Допустимые заголовки колонок -> поле транзакции
+COLUMN_ALIASES = {
+    'date': 'date', 'дата': 'date', 'дата операции': 'date',
+    'amount': 'amount', 'сумма': 'amount', 'сумма операции': 'amount',
+    'type': 'type', 'тип': 'type',
+    'category': 'category', 'категория': 'category',
+    'description': 'description', 'описание': 'description',
+}
+
+TYPE_ALIASES = {
+    'income': 'income', 'доход': 'income',
+    'expense': 'expense', 'расход': 'expense',
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y')
+
+# Те же правила, что у полей TransactionForm
+_amount_validator = AmountValidator(min_value=0.01, max_value=1000000)
+_date_validator = FutureDateValidator(allow_today=True)
+_DESCRIPTION_MAX_LENGTH = 500
+
+
+class ImportResult:
+    """Итог импорта: количество строк и ошибки по номерам строк."""
+
+    def __init__(self):
+        self.total = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        """Регистрация ошибки строки."""
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        """Представление для JSON ответа."""
+        return {
+            'total': self.total,
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+class _Field:
+    """Минимальная замена поля формы для вызова валидаторов."""
+
+    def __init__(self, data):
+        self.data = data
+
+
+def _open_csv(stream):
+    """
+    Потоковый csv.reader с определением разделителя по началу файла.
+
+    Args:
+        stream: Текстовый поток
+
+    Returns:
+        csv.reader: Читатель строк
+    """
+    head = stream.read(4096)
+    head += stream.readline()  # Дочитываем последнюю неполную строку
+
+    try:
+        dialect = csv.Sniffer().sniff(head, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+
+    return csv.reader(itertools.chain(io.StringIO(head, newline=''), stream), dialect)
+
+
+def _parse_amount(value):
+    """Сумма из строки выписки: пробелы-разделители и запятая допускаются."""
+    cleaned = value.replace(' ', '').replace(' ', '').replace(',', '.')
+    try:
+        amount = Decimal(cleaned)
+    except InvalidOperation:
+        raise ValidationError('Некорректный формат суммы')
+    # NaN и бесконечность ломают дальнейшие сравнения суммы
+    if not amount.is_finite():
+        raise ValidationError('Некорректный формат суммы')
+    return amount
+
+
+def _parse_date(value):
+    """Дата в одном из форматов DATE_FORMATS."""
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            continue
+    raise ValidationError('Некорректный формат даты')
+
+
+def validate_row(row, categories):
+    """
+    Проверка и преобразование строки CSV в параметры вставки.
+
+    Отрицательная сумма без указанного типа считается расходом,
+    как в банковских выписках.
+
+    Args:
+        row (dict): Значения по полям транзакции
+        categories (dict): Название категории в нижнем регистре -> id
+
+    Returns:
+        tuple: (amount, description, type, date, category_id)
+
+    Raises:
+        ValidationError: Если строка не проходит проверку
+    """
+    amount = _parse_amount(row.get('amount') or '')
+
+    type_name = (row.get('type') or '').strip().lower()
+    if type_name:
+        transaction_type = TYPE_ALIASES.get(type_name)
+        if transaction_type is None:
+            raise ValidationError('Неизвестный тип операции')
+    else:
+        transaction_type = 'expense' if amount < 0 else 'income'
+    amount = abs(amount)
+    _amount_validator(None, _Field(amount))
+
+    if not row.get('date'):
+        raise ValidationError('Выберите дату')
+    transaction_date = _parse_date(row['date'])
+    _date_validator(None, _Field(transaction_date))
+
+    category_name = (row.get('category') or '').strip().lower()
+    if not category_name:
+        raise ValidationError('Выберите категорию')
+    category_id = categories.get(category_name)
+    if category_id is None:
+        raise ValidationError(f'Категория не найдена: {row["category"].strip()}')
+
+    description = (row.get('description') or '').strip() or None
+    if description:
+        if len(description) > _DESCRIPTION_MAX_LENGTH:
+            raise ValidationError(
+                f'Описание не должно превышать {_DESCRIPTION_MAX_LENGTH} символов'
+            )
+        TransactionForm.validate_description(None, _Field(description))
+        description = sanitize_input(description)
+
+    return float(amount), description, transaction_type, transaction_date.isoformat(), category_id
+
+
+def import_transactions(stream, user_id, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Импорт транзакций пользователя из CSV потока.
+
+    Корректные строки вставляются, некорректные попадают в отчет
+    с номером строки файла. Каждая пачка фиксируется отдельно.
+
+    Args:
+        stream: Текстовый поток CSV с заголовком
+        user_id (int): ID пользователя
+        batch_size (int): Количество строк в одной транзакции вставки
+        progress (callable): Вызывается с ImportResult после каждой пачки
+
+    Returns:
+        ImportResult: Итог импорта
+
+    Raises:
+        ValueError: Если в заголовке нет обязательных колонок
+    """
+    reader = _open_csv(stream)
+    result = ImportResult()
+
+    header = next(reader, None)
+    if header is None:
+        return result
+
+    fields = [COLUMN_ALIASES.get(name.strip().lower()) for name in header]
+    missing = {'date', 'amount', 'category'} - set(fields)
+    if missing:
+        raise ValueError(f'В файле нет колонок: {", ".join(sorted(missing))}')
+
+    categories = {
+        row['name'].strip().lower(): row['id']
+        for row in get_db().execute(
+            'SELECT id, name FROM categories WHERE user_id = ?', (user_id,)
+        )
+    }
+
+    values = []
+    for record in reader:
+        if not any(value.strip() for value in record):
+            continue
+
+        result.total += 1
+        row = {field: value for field, value in zip(fields, record) if field}
+        try:
+            values.append(validate_row(row, categories) + (user_id,))
+        except ValidationError as e:
+            result.add_error(reader.line_num, str(e))
+
+        if len(values) >= batch_size:
+            result.imported += _insert_batch(user_id, values)
+            values = []
+            if progress is not None:
+                progress(result)
+
+    if values:
+        result.imported += _insert_batch(user_id, values)
+
+    return result
+
+
+def _insert_batch(user_id, values):
+    """
+    Вставка пачки транзакций одной транзакцией писателя.
+
+    Триггеры поддерживают поисковый индекс и помесячные агрегаты,
+    а слушатели write_transaction сбрасывают кеши пользователя.
+
+    Args:
+        user_id (int): ID пользователя
+        values (list): Параметры вставки
+
+    Returns:
+        int: Количество вставленных строк
+    """
+    with write_transaction(user_id) as db:
+        db.executemany('''
+            INSERT INTO transactions
+            (amount, description, type, date, category_id, user_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', values)
+    return len(values)
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+transactions_cli = AppGroup('transactions', help='Операции с транзакциями.')
+
+
+@transactions_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', type=int, required=True, help='Владелец транзакций.')
+@click.option('--encoding', default='utf-8-sig', help='Кодировка файла.')
+def import_command(path, user_id, encoding):
+    """Импорт транзакций из CSV файла."""
+    with open(path, encoding=encoding, newline='') as stream:
+        result = import_transactions(stream, user_id)
+
+    click.echo(f'Импортировано: {result.imported} из {result.total}')
+    for error in result.errors:
+        click.echo(f'Строка {error["line"]}: {error["error"]}')
+    if result.failed > len(result.errors):
+        click.echo(f'... и еще {result.failed - len(result.errors)} ошибок')
@@ -0,0 +1,237 @@
+"""
+Инструментирование SQL запросов в рамках HTTP запроса.
+
+Соединения пулов создаются классом InstrumentedConnection: каждый
+execute/executemany замеряется и учитывается в статистике текущего
+запроса (количество, суммарное время, самые медленные выражения).
+Выражения одной формы (без литералов и с учетом списков IN), повторенные
+много раз за запрос, отмечаются как N+1. Итоги уходят в заголовок
+Server-Timing (только числа) и в журнал (с текстом выражений).
+
+Время выражения - это выполнение до первой строки результата; чтение
+остальных строк курсора не учитывается.
+"""
+
+import heapq
+import re
+import sqlite3
+import time
+from functools import lru_cache
+
+from flask import g, has_app_context, request
+
+
+# Выражения, которые не считаются N+1 при повторении
+_IGNORED_PREFIXES = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(sql):
+    """
+    Форма SQL выражения для группировки повторов.
+
+    Литералы заменяются на ?, списки плейсхолдеров сворачиваются,
+    пробелы нормализуются.
+
+    Args:
+        sql (str): Текст выражения
+
+    Returns:
+        str: Нормализованная форма
+    """
+    shape = _STRING_LITERAL.sub('?', sql)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('?, ...', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryStats:
+    """Статистика SQL выражений одного запроса."""
+
+    def __init__(self, slowest_limit=3):
+        """
+        Args:
+            slowest_limit (int): Количество запоминаемых самых медленных выражений
+        """
+        self.slowest_limit = slowest_limit
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = {}
+        self._slowest = []
+        self._sequence = 0
+
+    def record(self, sql, duration):
+        """
+        Учет выполненного выражения.
+
+        Args:
+            sql (str): Текст выражения
+            duration (float): Время выполнения в секундах
+        """
+        shape = statement_shape(sql)
+        self.count += 1
+        self.total_time += duration
+
+        entry = self.shapes.get(shape)
+        if entry is None:
+            self.shapes[shape] = [1, duration]
+        else:
+            entry[0] += 1
+            entry[1] += duration
+
+        # Минимальная куча: в корне самое быстрое из запомненных
+        self._sequence += 1
+        item = (duration, self._sequence, shape)
+        if len(self._slowest) < self.slowest_limit:
+            heapq.heappush(self._slowest, item)
+        elif duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def slowest(self):
+        """
+        Самые медленные выражения.
+
+        Returns:
+            list: Пары (время в секундах, форма) по убыванию времени
+        """
+        return [(duration, shape) for duration, _, shape in sorted(self._slowest, reverse=True)]
+
+    def repeated(self, threshold):
+        """
+        Формы выражений, повторенные не меньше threshold раз (кандидаты N+1).
+
+        Args:
+            threshold (int): Минимальное количество повторов
+
+        Returns:
+            list: Тройки (количество, суммарное время, форма) по убыванию количества
+        """
+        return sorted(
+            (
+                (count, total, shape)
+                for shape, (count, total) in self.shapes.items()
+                if count >= threshold and not shape.upper().startswith(_IGNORED_PREFIXES)
+            ),
+            reverse=True
+        )
+
+
+def current_query_stats():
+    """
+    Статистика SQL текущего запроса.
+
+    Returns:
+        QueryStats: Статистика или None вне инструментированного запроса
+    """
+    return g.get('sql_stats') if has_app_context() else None
+
+
+def _record(sql, started):
+    """Учет выражения в статистике текущего запроса, если она ведется."""
+    duration = time.perf_counter() - started
+    stats = current_query_stats()
+    if stats is not None:
+        stats.record(sql, duration)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, замеряющий время execute и executemany."""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record(sql, started)
+
+    def executemany(self, sql, parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            _record(sql, started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Соединение, выражения которого выполняются InstrumentedCursor."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+
+# ============================================================================
+# Интеграция с Flask
+# ============================================================================
+
+def server_timing(stats, total):
+    """
+    Значение заголовка Server-Timing.
+
+    Args:
+        stats (QueryStats): Статистика SQL запроса
+        total (float): Время обработки запроса в секундах
+
+    Returns:
+        str: Метрики db и app в миллисекундах
+    """
+    return (
+        f'db;dur={stats.total_time * 1000:.2f};desc="{stats.count} queries", '
+        f'app;dur={total * 1000:.2f}'
+    )
+
+
+def setup_instrumentation(app):
+    """
+    Учет SQL по запросам: заголовок Server-Timing и журнал.
+
+    В журнал пишутся предупреждения о повторах одной формы
+    (SQL_N_PLUS_ONE_THRESHOLD и более) и запросы дольше
+    SQL_SLOW_REQUEST_THRESHOLD секунд с самыми медленными выражениями.
+
+    Args:
+        app (Flask): Приложение Flask
+    """
+    threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5)
+    slow_request = app.config.get('SQL_SLOW_REQUEST_THRESHOLD', 0.5)
+    slowest_limit = app.config.get('SQL_SLOWEST_STATEMENTS', 3)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_started = time.perf_counter()
+        g.sql_stats = QueryStats(slowest_limit)
+
+    @app.after_request
+    def report_request_stats(response):
+        stats = g.get('sql_stats')
+        if stats is None:
+            return response
+
+        total = time.perf_counter() - g.request_started
+        response.headers['Server-Timing'] = server_timing(stats, total)
+
+        endpoint = f'{request.method} {request.path}'
+        for count, duration, shape in stats.repeated(threshold):
+            app.logger.warning(
+                f'N+1 query: {count}x ({duration * 1000:.1f}ms) {shape} in {endpoint}'
+            )
+
+        if total >= slow_request:
+            slowest = '; '.join(
+                f'{duration * 1000:.1f}ms {shape}' for duration, shape in stats.slowest()
+            )
+            app.logger.info(
+                f'Slow request {endpoint}: {total * 1000:.1f}ms, '
+                f'{stats.count} queries in {stats.total_time * 1000:.1f}ms; slowest: {slowest}'
+            )
+        return response
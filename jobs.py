@@ -0,0 +1,661 @@
+"""
+Фоновые задачи: экспорт, импорт и тяжелые отчеты вне потока запроса.
+
+Задачи выполняются ограниченным пулом потоков процесса, очередь тоже
+ограничена: при ее заполнении новая задача отклоняется, и воркер остается
+свободным для интерактивных запросов. Статус, прогресс и файл результата
+хранятся в таблице jobs, поэтому состояние задачи видно из любого воркера.
+Задача в очереди отменяется сразу, выполняющаяся - при ближайшем
+сообщении о прогрессе. Незавершенные задачи процесса, который был
+остановлен, при старте помечаются ошибкой и затем удаляются как обычно.
+"""
+
+import io
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from database import get_db, write_transaction
+from exports import EXPORT_CHUNK_SIZE, gzip_stream, iter_csv
+from filters import TransactionFilter, count_transactions
+from imports import import_transactions
+from reports import generate_monthly_report
+
+
+# Статусы задачи
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+# Минимальный интервал между записями прогресса в секундах
+PROGRESS_INTERVAL = 0.5
+
+# Префикс имен загруженных файлов (см. JobRunner.temp_path)
+UPLOAD_PREFIX = 'upload_'
+
+# Поля задачи, отдаваемые клиенту
+_PUBLIC_FIELDS = '''
+    id, kind, status, progress, message, error, result_name,
+    created_at, started_at, finished_at
+'''
+
+
+class JobQueueFullError(Exception):
+    """Очередь фоновых задач заполнена."""
+    pass
+
+
+class JobCancelled(Exception):
+    """Задача отменена пользователем."""
+    pass
+
+
+# Обработчики задач по типу
+_handlers = {}
+
+
+def job_handler(kind):
+    """
+    Регистрация обработчика задачи (декоратор).
+
+    Обработчик вызывается как handler(context, **params) в контексте
+    приложения и возвращает описание файла результата
+    {'path', 'filename', 'mimetype'} или None.
+
+    Args:
+        kind (str): Тип задачи
+
+    Returns:
+        callable: Декоратор
+    """
+    def decorator(function):
+        _handlers[kind] = function
+        return function
+    return decorator
+
+
+def _owner_alive(owner):
+    """
+    Процесс-владелец задачи (хост:PID) еще работает.
+
+    Процессы других хостов считаются живыми: проверить их отсюда нельзя.
+    """
+    if not owner:
+        return False
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname():
+        return True
+    if not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _upload_paths(params):
+    """Загруженный файл из параметров задачи, если он создан temp_path."""
+    path = params.get('path')
+    if path and os.path.basename(path).startswith(UPLOAD_PREFIX):
+        return [path]
+    return []
+
+
+class JobContext:
+    """Доступ обработчика к своей задаче: прогресс, отмена, файлы."""
+
+    def __init__(self, runner, job_id, user_id, cancel_event):
+        """
+        Args:
+            runner (JobRunner): Исполнитель задач
+            job_id (str): ID задачи
+            user_id (int): Владелец задачи
+            cancel_event (threading.Event): Флаг отмены в этом процессе
+        """
+        self.runner = runner
+        self.job_id = job_id
+        self.user_id = user_id
+        self.paths = []
+        self._cancel_event = cancel_event
+        self._reported = 0.0
+
+    def result_path(self, suffix):
+        """
+        Путь к файлу результата задачи.
+
+        Args:
+            suffix (str): Расширение файла
+
+        Returns:
+            str: Путь в каталоге результатов
+        """
+        path = self.runner.path(f'{self.job_id}{suffix}')
+        self.paths.append(path)
+        return path
+
+    def check_cancelled(self):
+        """
+        Проверка флага отмены.
+
+        Raises:
+            JobCancelled: Если задача отменена
+        """
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def progress(self, fraction, message=None):
+        """
+        Сообщение о прогрессе и проверка отмены.
+
+        Запись в базу данных выполняется не чаще PROGRESS_INTERVAL;
+        заодно читается флаг отмены, выставленный другим воркером.
+
+        Args:
+            fraction (float): Доля выполненной работы от 0 до 1
+            message (str): Описание текущего шага
+
+        Raises:
+            JobCancelled: Если задача отменена
+        """
+        self.check_cancelled()
+
+        now = time.monotonic()
+        if now - self._reported < PROGRESS_INTERVAL:
+            return
+        self._reported = now
+
+        with write_transaction() as db:
+            db.execute(
+                'UPDATE jobs SET progress = ?, message = COALESCE(?, message) WHERE id = ?',
+                (min(max(fraction, 0.0), 1.0), message, self.job_id)
+            )
+            cancelled = db.execute(
+                'SELECT cancel_requested FROM jobs WHERE id = ?', (self.job_id,)
+            ).fetchone()[0]
+
+        if cancelled:
+            self._cancel_event.set()
+            raise JobCancelled()
+
+
+class JobRunner:
+    """Ограниченный пул потоков для фоновых задач с состоянием в таблице jobs."""
+
+    def __init__(self, app, max_workers=2, max_queued=20, results_dir='job_results',
+                 result_ttl=86400):
+        """
+        Инициализация исполнителя.
+
+        Args:
+            app (Flask): Приложение, в контексте которого выполняются задачи
+            max_workers (int): Количество потоков
+            max_queued (int): Максимум задач, ожидающих свободного потока
+            results_dir (str): Каталог файлов результатов и загрузок
+                (создается при первой записи)
+            result_ttl (float): Срок хранения завершенных задач в секундах
+        """
+        self.app = app
+        self.results_dir = results_dir
+        self.result_ttl = result_ttl
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queued)
+        self._events = {}
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ('submitted', 'rejected', SUCCEEDED, FAILED, CANCELLED), 0
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def path(self, name):
+        """
+        Путь к файлу в каталоге результатов; каталог создается при необходимости.
+
+        Args:
+            name (str): Имя файла
+
+        Returns:
+            str: Путь в каталоге результатов
+        """
+        os.makedirs(self.results_dir, exist_ok=True)
+        return os.path.join(self.results_dir, name)
+
+    def temp_path(self, suffix=''):
+        """
+        Путь для файла, передаваемого задаче (например, загрузки).
+
+        Файл, переданный задаче параметром path, принадлежит задаче и
+        удаляется вместе с ней, даже если задача не была запущена.
+
+        Args:
+            suffix (str): Расширение файла
+
+        Returns:
+            str: Уникальный путь в каталоге результатов
+        """
+        return self.path(f'{UPLOAD_PREFIX}{uuid.uuid4().hex}{suffix}')
+
+    def submit(self, kind, user_id, **params):
+        """
+        Постановка задачи в очередь.
+
+        Args:
+            kind (str): Тип задачи (см. job_handler)
+            user_id (int): Владелец задачи
+            **params: Параметры обработчика (сериализуемые в JSON)
+
+        Returns:
+            str: ID задачи
+
+        Raises:
+            ValueError: Если тип задачи неизвестен
+            JobQueueFullError: Если очередь заполнена
+        """
+        if kind not in _handlers:
+            raise ValueError(f'Неизвестный тип задачи: {kind}')
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise JobQueueFullError('Очередь фоновых задач заполнена')
+
+        job_id = uuid.uuid4().hex
+        event = threading.Event()
+        try:
+            self.prune()
+            with write_transaction() as db:
+                db.execute(
+                    'INSERT INTO jobs (id, user_id, kind, params, owner) VALUES (?, ?, ?, ?, ?)',
+                    (job_id, user_id, kind, json.dumps(params), self.owner)
+                )
+            with self._lock:
+                self._events[job_id] = event
+            self._executor.submit(self._run, job_id, kind, user_id, params, event)
+        except BaseException:
+            with self._lock:
+                self._events.pop(job_id, None)
+            self._slots.release()
+            raise
+
+        self._count('submitted')
+        return job_id
+
+    def _run(self, job_id, kind, user_id, params, event):
+        """Выполнение задачи в потоке пула."""
+        try:
+            with self.app.app_context():
+                self._execute(job_id, kind, user_id, params, event)
+        except Exception as e:
+            self.app.logger.error(f'Job {job_id} runner error: {e}')
+        finally:
+            with self._lock:
+                self._events.pop(job_id, None)
+            self._slots.release()
+
+    def _execute(self, job_id, kind, user_id, params, event):
+        """Запуск обработчика и запись итогового статуса."""
+        with write_transaction() as db:
+            started = db.execute(
+                '''UPDATE jobs SET status = ?, started_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND status = ?''',
+                (RUNNING, job_id, QUEUED)
+            ).rowcount
+        if not started:
+            # Отменена, пока ждала в очереди
+            self._remove(_upload_paths(params))
+            self._count(CANCELLED)
+            return
+
+        context = JobContext(self, job_id, user_id, event)
+        try:
+            result = _handlers[kind](context, **params) or {}
+        except JobCancelled:
+            self._remove(context.paths)
+            self._finish(job_id, CANCELLED)
+        except Exception as e:
+            self.app.logger.error(f'Job {kind} {job_id} error: {e}')
+            self._remove(context.paths)
+            self._finish(job_id, FAILED, error=str(e))
+        else:
+            self._finish(job_id, SUCCEEDED, result)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        """Запись итогового статуса задачи."""
+        result = result or {}
+        with write_transaction() as db:
+            db.execute(
+                '''UPDATE jobs
+                   SET status = ?, error = ?, result_path = ?, result_name = ?,
+                       result_mimetype = ?, finished_at = CURRENT_TIMESTAMP,
+                       progress = CASE WHEN ? = ? THEN 1 ELSE progress END
+                   WHERE id = ?''',
+                (status, error, result.get('path'), result.get('filename'),
+                 result.get('mimetype'), status, SUCCEEDED, job_id)
+            )
+        self._count(status)
+
+    @staticmethod
+    def _remove(paths):
+        """Удаление файлов, если они существуют."""
+        for path in paths:
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def get(self, job_id, user_id):
+        """
+        Состояние задачи пользователя.
+
+        Args:
+            job_id (str): ID задачи
+            user_id (int): ID пользователя
+
+        Returns:
+            dict: Поля задачи или None, если задача не найдена
+        """
+        row = get_db().execute(
+            f'SELECT {_PUBLIC_FIELDS} FROM jobs WHERE id = ? AND user_id = ?',
+            (job_id, user_id)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def recent(self, user_id, limit=20):
+        """
+        Последние задачи пользователя.
+
+        Args:
+            user_id (int): ID пользователя
+            limit (int): Максимальное количество задач
+
+        Returns:
+            list: Задачи от новых к старым
+        """
+        rows = get_db().execute(
+            f'''SELECT {_PUBLIC_FIELDS} FROM jobs WHERE user_id = ?
+                ORDER BY created_at DESC, rowid DESC LIMIT ?''',
+            (user_id, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def result(self, job_id, user_id):
+        """
+        Файл результата задачи.
+
+        Args:
+            job_id (str): ID задачи
+            user_id (int): ID пользователя
+
+        Returns:
+            sqlite3.Row: status, result_path, result_name, result_mimetype
+                или None, если задача не найдена
+        """
+        return get_db().execute(
+            '''SELECT status, result_path, result_name, result_mimetype
+               FROM jobs WHERE id = ? AND user_id = ?''',
+            (job_id, user_id)
+        ).fetchone()
+
+    def cancel(self, job_id, user_id):
+        """
+        Отмена задачи.
+
+        Args:
+            job_id (str): ID задачи
+            user_id (int): ID пользователя
+
+        Returns:
+            bool: True - отмена принята, False - задача уже завершена,
+                None - задача не найдена
+        """
+        with write_transaction() as db:
+            row = db.execute(
+                'SELECT status FROM jobs WHERE id = ? AND user_id = ?', (job_id, user_id)
+            ).fetchone()
+            if row is None:
+                return None
+            if row['status'] == QUEUED:
+                db.execute(
+                    '''UPDATE jobs SET status = ?, finished_at = CURRENT_TIMESTAMP
+                       WHERE id = ?''',
+                    (CANCELLED, job_id)
+                )
+            elif row['status'] == RUNNING:
+                db.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+            else:
+                return False
+
+        with self._lock:
+            event = self._events.get(job_id)
+        if event is not None:
+            event.set()
+        return True
+
+    def prune(self):
+        """
+        Удаление завершенных задач старше result_ttl вместе с файлами
+        результатов и загрузками.
+
+        Returns:
+            int: Количество удаленных задач
+        """
+        with write_transaction() as db:
+            rows = db.execute(
+                f'''SELECT id, params, result_path FROM jobs
+                    WHERE status IN ({', '.join('?' * len(FINISHED_STATUSES))})
+                      AND finished_at < datetime('now', ?)''',
+                FINISHED_STATUSES + (f'-{int(self.result_ttl)} seconds',)
+            ).fetchall()
+            db.executemany('DELETE FROM jobs WHERE id = ?', [(row['id'],) for row in rows])
+
+        for row in rows:
+            self._remove([row['result_path']] + _upload_paths(json.loads(row['params'])))
+        return len(rows)
+
+    def recover(self):
+        """
+        Завершение задач, оставшихся в очереди или в работе у остановленного процесса.
+
+        Пул и флаги отмены такого процесса потеряны, поэтому задачи
+        помечаются ошибкой с finished_at и удаляются prune() вместе с
+        загрузками по истечении result_ttl. Вызывается до приема задач:
+        задачи с PID этого процесса (PID мог достаться от прежнего
+        процесса) тоже считаются прерванными.
+
+        Returns:
+            int: Количество помеченных задач
+        """
+        with write_transaction() as db:
+            rows = db.execute(
+                'SELECT id, owner FROM jobs WHERE status IN (?, ?)', (QUEUED, RUNNING)
+            ).fetchall()
+            stale = [(FAILED, 'Прервана перезапуском', row['id']) for row in rows
+                     if row['owner'] == self.owner or not _owner_alive(row['owner'])]
+            db.executemany(
+                '''UPDATE jobs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+                   WHERE id = ?''',
+                stale
+            )
+        return len(stale)
+
+    def stats(self):
+        """
+        Статистика исполнителя в этом процессе.
+
+        Returns:
+            dict: Счетчики задач и количество активных (в очереди и в работе)
+        """
+        with self._lock:
+            return dict(self._counters, active=len(self._events))
+
+    def shutdown(self, wait=True):
+        """Остановка пула; задачи в очереди этого процесса не запускаются."""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def init_jobs(app):
+    """
+    Создание исполнителя фоновых задач по конфигурации приложения.
+
+    Вызывается после init_db: задачи остановленных процессов завершаются
+    (см. JobRunner.recover).
+
+    Args:
+        app (Flask): Приложение Flask
+
+    Returns:
+        JobRunner: Исполнитель (также доступен как app.extensions['jobs'])
+    """
+    results_dir = (app.config.get('JOBS_RESULTS_DIR')
+                   or os.path.join(app.instance_path, 'job_results'))
+
+    runner = JobRunner(
+        app,
+        max_workers=app.config.get('JOBS_MAX_WORKERS', 2),
+        max_queued=app.config.get('JOBS_MAX_QUEUED', 20),
+        results_dir=results_dir,
+        result_ttl=app.config.get('JOBS_RESULT_TTL', 86400)
+    )
+    app.extensions['jobs'] = runner
+
+    try:
+        with app.app_context():
+            recovered = runner.recover()
+        if recovered:
+            app.logger.warning(f'Interrupted jobs marked as failed: {recovered}')
+    except Exception as e:
+        app.logger.error(f'Job recovery error: {e}')
+    return runner
+
+
+# ============================================================================
+# Задачи приложения
+# ============================================================================
+
+@job_handler('export')
+def export_job(context, filters, type_labels, compress=False):
+    """
+    Экспорт транзакций по фильтру в CSV файл.
+
+    Args:
+        context (JobContext): Контекст задачи
+        filters (dict): Значения полей TransactionFilter
+        type_labels (dict): Подписи типов операций на языке пользователя
+        compress (bool): Сжать результат gzip
+
+    Returns:
+        dict: Файл результата
+    """
+    transaction_filter = TransactionFilter(**filters)
+    where, where_params = transaction_filter.compile()
+
+    db = get_db(readonly=True)
+    total = count_transactions(db, context.user_id, transaction_filter)
+    cursor = db.execute('''
+        SELECT t.date, t.amount, t.type, t.description, c.name as category
+        FROM transactions t
+        LEFT JOIN categories c ON t.category_id = c.id
+        WHERE t.user_id = ?
+    ''' + where + ' ORDER BY t.date DESC', [context.user_id] + where_params)
+
+    def counted(chunks):
+        # Первый фрагмент - заголовок, далее пачки по EXPORT_CHUNK_SIZE строк
+        for index, chunk in enumerate(chunks):
+            context.progress(index * EXPORT_CHUNK_SIZE / total if total else 1.0)
+            yield chunk
+
+    chunks = counted(iter_csv(cursor, type_labels))
+    filename = f'transactions_{date.today()}.csv'
+    mimetype = 'text/csv'
+    if compress:
+        data = gzip_stream(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    else:
+        data = (chunk.encode('utf-8') for chunk in chunks)
+
+    path = context.result_path('.csv.gz' if compress else '.csv')
+    with open(path, 'wb') as output:
+        for block in data:
+            output.write(block)
+
+    return {'path': path, 'filename': filename, 'mimetype': mimetype}
+
+
+@job_handler('report')
+def report_job(context, start_date, end_date):
+    """
+    Отчет за период (например, за несколько лет) в JSON файл.
+
+    Args:
+        context (JobContext): Контекст задачи
+        start_date (str): Начало периода
+        end_date (str): Конец периода
+
+    Returns:
+        dict: Файл результата
+    """
+    context.progress(0.0, 'Расчет отчета')
+    report = generate_monthly_report(context.user_id, start_date, end_date, get_db(readonly=True))
+    context.check_cancelled()
+
+    path = context.result_path('.json')
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(report, output, ensure_ascii=False)
+
+    return {
+        'path': path,
+        'filename': f'report_{start_date}_{end_date}.json',
+        'mimetype': 'application/json',
+    }
+
+
+@job_handler('import')
+def import_job(context, path, encoding='utf-8-sig'):
+    """
+    Импорт транзакций из загруженного CSV файла.
+
+    Пачки, вставленные до отмены, остаются в базе данных.
+    Загруженный файл удаляется по завершении.
+
+    Args:
+        context (JobContext): Контекст задачи
+        path (str): Путь к загруженному файлу (см. JobRunner.temp_path)
+        encoding (str): Кодировка файла
+
+    Returns:
+        dict: Файл с итогом импорта и ошибками по строкам
+    """
+    try:
+        size = os.path.getsize(path) or 1
+        with open(path, 'rb') as raw:
+            stream = io.TextIOWrapper(raw, encoding=encoding, newline='')
+            result = import_transactions(
+                stream, context.user_id,
+                progress=lambda result: context.progress(
+                    raw.tell() / size, f'Импортировано: {result.imported}'
+                )
+            )
+    finally:
+        os.remove(path)
+
+    output_path = context.result_path('.json')
+    with open(output_path, 'w', encoding='utf-8') as output:
+        json.dump(result.to_dict(), output, ensure_ascii=False)
+
+    return {
+        'path': output_path,
+        'filename': 'import_result.json',
+        'mimetype': 'application/json',
+    }
@@ -3,14 +3,19 @@
 Поддерживает аутентификацию, транзакции, категории, отчеты и интернационализацию.
 """
 
+import io
 import os
 import logging
+import sqlite3
+import time
+from functools import wraps
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 
 from flask import (
     Flask, render_template, redirect, url_for, flash, 
-    request, session, g, jsonify, abort, make_response
+    request, session, jsonify, make_response,
+    Response, send_file
 )
 from flask_login import (
     LoginManager, login_user, logout_user, 
@@ -22,17 +27,37 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.exceptions import HTTPException
 
 # Импорты из наших модулей
-from database import init_db, get_db, close_db_connection
+from database import (
+    init_db, get_db,
+    setup_database, get_pool, get_pool_stats, write_transaction, unique_violation
+)
 from models import User, Transaction, Category
 from forms import (
     RegistrationForm, LoginForm, TransactionForm,
     CategoryForm, FilterForm, ProfileForm, PasswordChangeForm
 )
 from utils import (
-    hash_password, verify_password, format_currency,
-    calculate_statistics, generate_monthly_report,
-    validate_amount, sanitize_input
+    format_currency, validate_amount, sanitize_input
+)
+from cache import init_cache
+from identity import forget_identity, init_identity, load_identity, remember_identity
+from aggregates import calculate_statistics, category_statistics
+from pagination import (
+    paginate, parse_fields, select_clause,
+    InvalidCursorError, MAX_PAGE_SIZE
 )
+from filters import TransactionFilter, summarize_transactions
+from search import search_transactions
+from exports import iter_query_csv, gzip_stream
+from reports import generate_monthly_report
+from imports import import_transactions, transactions_cli
+from jobs import JobQueueFullError, init_jobs
+from metrics import CONTENT_TYPE, setup_metrics
+from passwords import PasswordHasherBusyError, init_passwords
+from ratelimit import client_ip, init_rate_limiter, login_email_key
+from charts import chart_series
+from versions import current_data_version, data_etag
+from prefix_sums import prefix_index, range_totals
 from config import get_config
 from translations import i18n_manager, gettext, set_language
 from validators import EmailValidator, PasswordStrengthValidator
@@ -68,8 +93,16 @@ def create_app(config_name=None):
     setup_logging(app)
     
     # Инициализация базы данных
+    setup_database(app)
+    init_cache(app)
+    init_identity(app)
+    init_passwords(app)
+    init_rate_limiter(app)
+    setup_metrics(app)
+    app.cli.add_command(transactions_cli)
     with app.app_context():
         init_db()
+    init_jobs(app)
     
     # ========================================================================
     # Контекстные процессоры и фильтры шаблонов
@@ -142,22 +175,9 @@ def create_app(config_name=None):
     
     @login_manager.user_loader
     def load_user(user_id):
-        """Загрузка пользователя для Flask-Login."""
+        """Загрузка пользователя для Flask-Login (через кеш идентичности)."""
         try:
-            db = get_db()
-            user_data = db.execute(
-                'SELECT * FROM users WHERE id = ?', (user_id,)
-            ).fetchone()
-            
-            if user_data:
-                return User(
-                    id=user_data['id'],
-                    username=user_data['username'],
-                    email=user_data['email'],
-                    password_hash=user_data['password_hash'],
-                    created_at=datetime.fromisoformat(user_data['created_at']) 
-                    if user_data['created_at'] else None
-                )
+            return load_identity(user_id)
         except Exception as e:
             app.logger.error(f'Error loading user {user_id}: {e}')
         return None
@@ -166,6 +186,46 @@ def create_app(config_name=None):
         """Получение ID текущего пользователя."""
         return current_user.id if current_user.is_authenticated else None
     
+    def etag_by_data_version(html=False):
+        """
+        Условные GET запросы по версии данных пользователя.
+        
+        ETag строится из версии данных, параметров запроса, языка и даты,
+        поэтому при совпадении If-None-Match ответ 304 отдается до
+        выполнения запросов статистики.
+        
+        Args:
+            html (bool): HTML страница: ETag обновляется каждый час (CSRF токены
+                в формах), а ответы с сообщениями flash не кешируются
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                user_id = get_current_user_id()
+                if user_id is None or (html and session.get('_flashes')):
+                    return view(*args, **kwargs)
+                
+                etag = data_etag(
+                    user_id,
+                    current_data_version(get_db(), user_id),
+                    request.full_path,
+                    session.get('language'),
+                    date.today().isoformat(),
+                    int(time.time() // 3600) if html else None
+                )
+                if request.if_none_match.contains(etag):
+                    response = make_response('', 304)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+            return wrapper
+        return decorator
+    
     # ========================================================================
     # Маршруты аутентификации
     # ========================================================================
@@ -177,6 +237,44 @@ def create_app(config_name=None):
             return redirect(url_for('dashboard'))
         return render_template('index.html')
     
+    def password_hasher_busy(template, form):
+        """Ответ 503 при заполненной очереди хеширования паролей."""
+        flash(_('Сервер перегружен, повторите попытку через несколько секунд'), 'warning')
+        response = make_response(render_template(template, form=form), 503)
+        response.headers['Retry-After'] = str(app.extensions['passwords'].retry_after)
+        return response
+    
+    def too_many_attempts(template, form, retry_after):
+        """Ответ 429 при превышении частоты попыток."""
+        flash(_('Слишком много попыток, повторите позже'), 'danger')
+        response = make_response(render_template(template, form=form), 429)
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+    
+    def duplicate_user_field(error, form, template, email_message):
+        """
+        Ошибка формы по нарушению уникальности email или имени пользователя.
+        
+        Args:
+            error (sqlite3.IntegrityError): Ошибка INSERT/UPDATE users
+            form (FlaskForm): Форма с полями email и username
+            template (str): Шаблон формы
+            email_message (str): Сообщение о занятом email
+        
+        Raises:
+            sqlite3.IntegrityError: Если нарушено другое ограничение
+        """
+        column = unique_violation(error)
+        if column == 'users.email':
+            field, message = form.email, email_message
+        elif column == 'users.username':
+            field, message = form.username, _('Имя пользователя уже занято')
+        else:
+            raise error
+        field.errors = list(field.errors) + [message]
+        flash(message, 'danger')
+        return render_template(template, form=form)
+    
     @app.route('/register', methods=['GET', 'POST'])
     def register():
         """Страница регистрации."""
@@ -185,44 +283,36 @@ def create_app(config_name=None):
         
         form = RegistrationForm()
         
+        if request.method == 'POST':
+            retry_after = app.extensions['ratelimit'].check(('register_ip', client_ip()))
+            if retry_after:
+                return too_many_attempts('auth/register.html', form, retry_after)
+        
         if form.validate_on_submit():
             try:
-                db = get_db()
-                
-                # Проверка уникальности email
-                existing_user = db.execute(
-                    'SELECT id FROM users WHERE email = ?', 
-                    (form.email.data,)
-                ).fetchone()
-                
-                if existing_user:
-                    flash(_('Пользователь с таким email уже существует'), 'danger')
-                    return render_template('auth/register.html', form=form)
-                
-                # Проверка уникальности имени пользователя
-                existing_username = db.execute(
-                    'SELECT id FROM users WHERE username = ?', 
-                    (form.username.data,)
-                ).fetchone()
-                
-                if existing_username:
-                    flash(_('Имя пользователя уже занято'), 'danger')
-                    return render_template('auth/register.html', form=form)
-                
                 # Хеширование пароля
-                password_hash = hash_password(form.password.data)
+                password_hash = app.extensions['passwords'].hash(form.password.data)
                 
-                # Создание пользователя
-                db.execute(
-                    '''INSERT INTO users (username, email, password_hash) 
-                       VALUES (?, ?, ?)''',
-                    (form.username.data, form.email.data, password_hash)
-                )
-                db.commit()
+                # Создание пользователя; уникальность email и имени
+                # проверяют индексы users
+                try:
+                    with write_transaction() as db:
+                        db.execute(
+                            '''INSERT INTO users (username, email, password_hash) 
+                               VALUES (?, ?, ?)''',
+                            (form.username.data, form.email.data, password_hash)
+                        )
+                except sqlite3.IntegrityError as e:
+                    return duplicate_user_field(
+                        e, form, 'auth/register.html',
+                        _('Пользователь с таким email уже существует')
+                    )
                 
                 flash(_('Регистрация успешна! Теперь войдите в систему.'), 'success')
                 return redirect(url_for('login'))
                 
+            except PasswordHasherBusyError:
+                return password_hasher_busy('auth/register.html', form)
             except Exception as e:
                 app.logger.error(f'Registration error: {e}')
                 flash(_('Ошибка при регистрации. Попробуйте позже.'), 'danger')
@@ -237,6 +327,16 @@ def create_app(config_name=None):
         
         form = LoginForm()
         
+        limiter = app.extensions['ratelimit']
+        email_hit = ('login_email', login_email_key(request.form.get('email')))
+        
+        if request.method == 'POST':
+            # Попытка с адреса учитывается всегда, по email - только неудачная
+            retry_after = (limiter.check(('login_ip', client_ip()))
+                           or limiter.check(email_hit, consume=False))
+            if retry_after:
+                return too_many_attempts('auth/login.html', form, retry_after)
+        
         if form.validate_on_submit():
             try:
                 db = get_db()
@@ -245,7 +345,14 @@ def create_app(config_name=None):
                     (form.email.data,)
                 ).fetchone()
                 
-                if user_data and verify_password(form.password.data, user_data['password_hash']):
+                if user_data:
+                    password_valid = app.extensions['passwords'].verify(
+                        form.password.data, user_data['password_hash']
+                    )
+                else:
+                    password_valid = False
+                
+                if password_valid:
                     user = User(
                         id=user_data['id'],
                         username=user_data['username'],
@@ -256,13 +363,20 @@ def create_app(config_name=None):
                     )
                     
                     login_user(user, remember=form.remember.data)
+                    remember_identity(user_data)
+                    app.extensions['passwords'].rehash_if_needed(
+                        user_data['id'], form.password.data, user_data['password_hash']
+                    )
                     flash(_('Вход выполнен успешно!'), 'success')
                     
                     next_page = request.args.get('next')
                     return redirect(next_page or url_for('dashboard'))
                 else:
+                    limiter.check(email_hit)
                     flash(_('Неверный email или пароль'), 'danger')
                     
+            except PasswordHasherBusyError:
+                return password_hasher_busy('auth/login.html', form)
             except Exception as e:
                 app.logger.error(f'Login error: {e}')
                 flash(_('Ошибка при входе в систему'), 'danger')
@@ -283,6 +397,7 @@ def create_app(config_name=None):
     
     @app.route('/dashboard')
     @login_required
+    @etag_by_data_version(html=True)
     def dashboard():
         """Панель управления."""
         try:
@@ -330,59 +445,36 @@ def create_app(config_name=None):
             user_id = get_current_user_id()
             db = get_db()
             
-            # Параметры фильтрации
-            page = request.args.get('page', 1, type=int)
+            # Параметры пагинации: курсор позиции и направление листания
             per_page = 20
-            offset = (page - 1) * per_page
+            cursor = request.args.get('cursor')
+            backwards = request.args.get('direction') == 'prev'
             
             # Форма фильтров
             filter_form = FilterForm(request.args, user_id=user_id)
             
-            # Базовый запрос
+            transaction_filter = TransactionFilter.from_form(filter_form)
+            where, where_params = transaction_filter.compile()
+            
+            # Базовый запрос с фильтрами
             query = '''
                 SELECT t.*, c.name as category_name, c.color as category_color
                 FROM transactions t
                 LEFT JOIN categories c ON t.category_id = c.id
                 WHERE t.user_id = ?
-            '''
-            params = [user_id]
-            
-            # Применение фильтров
-            if filter_form.validate():
-                if filter_form.start_date.data:
-                    query += ' AND t.date >= ?'
-                    params.append(filter_form.start_date.data)
-                
-                if filter_form.end_date.data:
-                    query += ' AND t.date <= ?'
-                    params.append(filter_form.end_date.data)
-                
-                if filter_form.category_id.data and filter_form.category_id.data != '0':
-                    query += ' AND t.category_id = ?'
-                    params.append(filter_form.category_id.data)
-                
-                if filter_form.transaction_type.data != 'all':
-                    query += ' AND t.type = ?'
-                    params.append(filter_form.transaction_type.data)
-                
-                if filter_form.search.data:
-                    query += ' AND t.description LIKE ?'
-                    params.append(f'%{filter_form.search.data}%')
-            
-            # Сортировка и пагинация
-            query += ' ORDER BY t.date DESC, t.created_at DESC LIMIT ? OFFSET ?'
-            params.extend([per_page, offset])
-            
-            transactions_list = db.execute(query, params).fetchall()
+            ''' + where
+            params = [user_id] + where_params
             
-            # Общее количество для пагинации
-            count_query = 'SELECT COUNT(*) as total FROM transactions WHERE user_id = ?'
-            count_params = [user_id]
-            
-            # TODO: Применить те же фильтры к count_query
+            # Сортировка и пагинация по ключу (date, created_at, id)
+            try:
+                result = paginate(db, query, params, cursor=cursor,
+                                  per_page=per_page, backwards=backwards)
+            except InvalidCursorError:
+                result = paginate(db, query, params, per_page=per_page)
+            transactions_list = result.items
             
-            total = db.execute(count_query, count_params).fetchone()['total']
-            total_pages = (total + per_page - 1) // per_page
+            # Итоговая строка по фильтру (по префиксным суммам, если фильтр только по датам)
+            summary = summarize_transactions(db, user_id, transaction_filter)
             
             # Категории для формы добавления
             categories = db.execute(
@@ -398,8 +490,9 @@ def create_app(config_name=None):
                                  transactions=transactions_list,
                                  form=transaction_form,
                                  filter_form=filter_form,
-                                 page=page,
-                                 total_pages=total_pages)
+                                 summary=summary,
+                                 next_cursor=result.next_cursor,
+                                 prev_cursor=result.prev_cursor)
             
         except Exception as e:
             app.logger.error(f'Transactions list error: {e}')
@@ -415,27 +508,29 @@ def create_app(config_name=None):
             form = TransactionForm(request.form, user_id=user_id)
             
             if form.validate():
-                db = get_db()
-                
                 # Валидация суммы
                 if not validate_amount(form.amount.data):
                     flash(_('Некорректная сумма'), 'danger')
                     return redirect(url_for('transactions'))
                 
                 # Добавление транзакции
-                db.execute('''
-                    INSERT INTO transactions 
-                    (amount, description, type, date, user_id, category_id)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    form.amount.data,
-                    sanitize_input(form.description.data) if form.description.data else None,
-                    form.transaction_type.data,
-                    form.date.data,
-                    user_id,
-                    form.category_id.data if form.category_id.data != '0' else None
-                ))
-                db.commit()
+                with write_transaction(user_id) as db:
+                    changes = prefix_index.begin(db, user_id)
+                    db.execute('''
+                        INSERT INTO transactions 
+                        (amount, description, type, date, user_id, category_id)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (
+                        form.amount.data,
+                        sanitize_input(form.description.data) if form.description.data else None,
+                        form.transaction_type.data,
+                        form.date.data,
+                        user_id,
+                        form.category_id.data if form.category_id.data != '0' else None
+                    ))
+                    changes.add(form.date.data, form.transaction_type.data, form.amount.data)
+                    changes.finish(db)
+                prefix_index.apply(changes)
                 
                 flash(_('Транзакция успешно добавлена'), 'success')
             else:
@@ -490,21 +585,39 @@ def create_app(config_name=None):
                 form.category_id.choices = [(cat['id'], cat['name']) for cat in categories]
                 
                 if form.validate():
-                    db.execute('''
-                        UPDATE transactions 
-                        SET amount = ?, description = ?, type = ?, 
-                            date = ?, category_id = ?
-                        WHERE id = ? AND user_id = ?
-                    ''', (
-                        form.amount.data,
-                        sanitize_input(form.description.data) if form.description.data else None,
-                        form.transaction_type.data,
-                        form.date.data,
-                        form.category_id.data if form.category_id.data != '0' else None,
-                        transaction_id,
-                        user_id
-                    ))
-                    db.commit()
+                    with write_transaction(user_id) as db:
+                        changes = prefix_index.begin(db, user_id)
+                        # Старые значения читаются в транзакции записи: строка
+                        # могла измениться после чтения для формы
+                        old = db.execute(
+                            'SELECT date, type, amount FROM transactions '
+                            'WHERE id = ? AND user_id = ?',
+                            (transaction_id, user_id)
+                        ).fetchone()
+                        updated = db.execute('''
+                            UPDATE transactions 
+                            SET amount = ?, description = ?, type = ?, 
+                                date = ?, category_id = ?
+                            WHERE id = ? AND user_id = ?
+                        ''', (
+                            form.amount.data,
+                            sanitize_input(form.description.data) if form.description.data else None,
+                            form.transaction_type.data,
+                            form.date.data,
+                            form.category_id.data if form.category_id.data != '0' else None,
+                            transaction_id,
+                            user_id
+                        )).rowcount
+                        if old is not None and updated:
+                            changes.add(old['date'], old['type'], old['amount'], sign=-1)
+                            changes.add(form.date.data, form.transaction_type.data,
+                                        form.amount.data)
+                        changes.finish(db)
+                    prefix_index.apply(changes)
+                    
+                    if not updated:
+                        flash(_('Транзакция не найдена'), 'danger')
+                        return redirect(url_for('transactions'))
                     
                     flash(_('Транзакция успешно обновлена'), 'success')
                     return redirect(url_for('transactions'))
@@ -524,20 +637,22 @@ def create_app(config_name=None):
         """Удаление транзакции."""
         try:
             user_id = get_current_user_id()
-            db = get_db()
-            
-            # Проверка существования транзакции
-            transaction = db.execute(
-                'SELECT id FROM transactions WHERE id = ? AND user_id = ?',
-                (transaction_id, user_id)
-            ).fetchone()
             
-            if transaction:
-                db.execute(
-                    'DELETE FROM transactions WHERE id = ? AND user_id = ?',
+            # Удаленная строка возвращается тем же выражением, поэтому сумма
+            # для индекса совпадает с действительно удаленной
+            with write_transaction(user_id) as db:
+                changes = prefix_index.begin(db, user_id)
+                deleted = db.execute(
+                    'DELETE FROM transactions WHERE id = ? AND user_id = ? '
+                    'RETURNING date, type, amount',
                     (transaction_id, user_id)
-                )
-                db.commit()
+                ).fetchall()
+                for row in deleted:
+                    changes.add(row['date'], row['type'], row['amount'], sign=-1)
+                changes.finish(db)
+            prefix_index.apply(changes)
+            
+            if deleted:
                 flash(_('Транзакция успешно удалена'), 'success')
             else:
                 flash(_('Транзакция не найдена'), 'danger')
@@ -548,6 +663,66 @@ def create_app(config_name=None):
         
         return redirect(url_for('transactions'))
     
+    @app.route('/transactions/import', methods=['POST'])
+    @login_required
+    def import_transactions_file():
+        """Импорт транзакций из CSV файла (выписки)."""
+        wants_json = request.args.get('format') == 'json'
+        
+        try:
+            user_id = get_current_user_id()
+            upload = request.files.get('file')
+            
+            if not upload or not upload.filename:
+                if wants_json:
+                    return jsonify({'success': False, 'error': 'Файл не выбран'}), 400
+                flash(_('Выберите файл для импорта'), 'danger')
+                return redirect(url_for('transactions'))
+            
+            # Большой файл импортируется фоновой задачей
+            if request.values.get('background', type=int):
+                jobs = app.extensions['jobs']
+                path = jobs.temp_path('.csv')
+                upload.save(path)
+                try:
+                    job_id = jobs.submit('import', user_id, path=path)
+                except Exception:
+                    os.remove(path)
+                    raise
+                
+                if wants_json:
+                    return job_accepted(job_id)
+                flash(_('Импорт запущен в фоне'), 'info')
+                return redirect(url_for('transactions'))
+            
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            result = import_transactions(stream, user_id)
+            
+            if wants_json:
+                return jsonify({'success': True, 'data': result.to_dict()})
+            
+            flash(_('Импортировано транзакций: %(imported)s из %(total)s',
+                    imported=result.imported, total=result.total),
+                  'success' if result.imported else 'warning')
+            for error in result.errors[:10]:
+                flash(f'Строка {error["line"]}: {error["error"]}', 'danger')
+            
+        except (ValueError, UnicodeDecodeError) as e:
+            if wants_json:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            flash(str(e), 'danger')
+        except JobQueueFullError as e:
+            if wants_json:
+                return job_queue_full(e)
+            flash(_('Сервер занят, повторите импорт позже'), 'warning')
+        except Exception as e:
+            app.logger.error(f'Import transactions error: {e}')
+            if wants_json:
+                return jsonify({'success': False, 'error': 'Ошибка импорта'}), 500
+            flash(_('Ошибка при импорте транзакций'), 'danger')
+        
+        return redirect(url_for('transactions'))
+    
     # ========================================================================
     # Маршруты категорий
     # ========================================================================
@@ -560,26 +735,9 @@ def create_app(config_name=None):
             user_id = get_current_user_id()
             db = get_db()
             
-            # Получение категорий пользователя
-            categories_list = db.execute('''
-                SELECT * FROM categories 
-                WHERE user_id = ? 
-                ORDER BY type, name
-            ''', (user_id,)).fetchall()
-            
-            # Статистика по категориям
-            category_stats = {}
-            for category in categories_list:
-                stats = db.execute('''
-                    SELECT 
-                        COUNT(*) as count,
-                        COALESCE(SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END), 0) as total_income,
-                        COALESCE(SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END), 0) as total_expense
-                    FROM transactions 
-                    WHERE category_id = ? AND user_id = ?
-                ''', (category['id'], user_id)).fetchone()
-                
-                category_stats[category['id']] = stats
+            # Категории пользователя с итогами одним запросом
+            categories_list = category_statistics(user_id, db)
+            category_stats = {category['id']: category for category in categories_list}
             
             # Форма для добавления категории
             form = CategoryForm()
@@ -615,19 +773,19 @@ def create_app(config_name=None):
                     flash(_('Категория с таким названием уже существует'), 'danger')
                 else:
                     # Добавление категории
-                    db.execute('''
-                        INSERT INTO categories 
-                        (name, type, user_id, color, icon, budget_limit)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (
-                        form.name.data,
-                        form.category_type.data,
-                        user_id,
-                        form.color.data,
-                        form.icon.data or 'fa-folder',
-                        form.budget_limit.data if form.budget_limit.data else None
-                    ))
-                    db.commit()
+                    with write_transaction(user_id) as db:
+                        db.execute('''
+                            INSERT INTO categories 
+                            (name, type, user_id, color, icon, budget_limit)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                        ''', (
+                            form.name.data,
+                            form.category_type.data,
+                            user_id,
+                            form.color.data,
+                            form.icon.data or 'fa-folder',
+                            form.budget_limit.data if form.budget_limit.data else None
+                        ))
                     
                     flash(_('Категория успешно добавлена'), 'success')
             else:
@@ -684,21 +842,21 @@ def create_app(config_name=None):
                         flash(_('Категория с таким названием уже существует'), 'danger')
                     else:
                         # Обновление категории
-                        db.execute('''
-                            UPDATE categories 
-                            SET name = ?, type = ?, color = ?, 
-                                icon = ?, budget_limit = ?
-                            WHERE id = ? AND user_id = ?
-                        ''', (
-                            form.name.data,
-                            form.category_type.data,
-                            form.color.data,
-                            form.icon.data or 'fa-folder',
-                            form.budget_limit.data if form.budget_limit.data else None,
-                            category_id,
-                            user_id
-                        ))
-                        db.commit()
+                        with write_transaction(user_id) as db:
+                            db.execute('''
+                                UPDATE categories 
+                                SET name = ?, type = ?, color = ?, 
+                                    icon = ?, budget_limit = ?
+                                WHERE id = ? AND user_id = ?
+                            ''', (
+                                form.name.data,
+                                form.category_type.data,
+                                form.color.data,
+                                form.icon.data or 'fa-folder',
+                                form.budget_limit.data if form.budget_limit.data else None,
+                                category_id,
+                                user_id
+                            ))
                         
                         flash(_('Категория успешно обновлена'), 'success')
                         return redirect(url_for('categories'))
@@ -736,11 +894,11 @@ def create_app(config_name=None):
                 if transactions_count > 0:
                     flash(_('Нельзя удалить категорию, к которой привязаны транзакции'), 'danger')
                 else:
-                    db.execute(
-                        'DELETE FROM categories WHERE id = ? AND user_id = ?',
-                        (category_id, user_id)
-                    )
-                    db.commit()
+                    with write_transaction(user_id) as db:
+                        db.execute(
+                            'DELETE FROM categories WHERE id = ? AND user_id = ?',
+                            (category_id, user_id)
+                        )
                     flash(_('Категория успешно удалена'), 'success')
             else:
                 flash(_('Категория не найдена'), 'danger')
@@ -778,9 +936,14 @@ def create_app(config_name=None):
             db = get_db()
             monthly_report = generate_monthly_report(user_id, start_date, end_date, db)
             
+            # Итоги периода и остатки на его границах за O(log n)
+            totals = range_totals(db, user_id,
+                                  filter_form.start_date.data, filter_form.end_date.data)
+            
             return render_template('reports/index.html',
                                  filter_form=filter_form,
                                  monthly_report=monthly_report,
+                                 totals=totals,
                                  start_date=start_date,
                                  end_date=end_date)
             
@@ -796,10 +959,8 @@ def create_app(config_name=None):
         try:
             user_id = get_current_user_id()
             format_type = request.args.get('format', 'csv')
-            start_date = request.args.get('start_date')
-            end_date = request.args.get('end_date')
-            
-            db = get_db()
+            transaction_filter = TransactionFilter.from_args(request.args)
+            where, where_params = transaction_filter.compile()
             
             # Получение данных
             query = '''
@@ -807,46 +968,24 @@ def create_app(config_name=None):
                 FROM transactions t
                 LEFT JOIN categories c ON t.category_id = c.id
                 WHERE t.user_id = ?
-            '''
-            params = [user_id]
-            
-            if start_date:
-                query += ' AND t.date >= ?'
-                params.append(start_date)
-            
-            if end_date:
-                query += ' AND t.date <= ?'
-                params.append(end_date)
-            
-            query += ' ORDER BY t.date DESC'
-            transactions = db.execute(query, params).fetchall()
+            ''' + where + ' ORDER BY t.date DESC'
             
-            # Генерация CSV
+            # Потоковая генерация CSV: строки читаются пачками на собственном
+            # соединении генератора (соединение запроса освобождается раньше)
             if format_type == 'csv':
-                import csv
-                import io
+                type_labels = {'income': _('Доход'), 'expense': _('Расход')}
+                chunks = iter_query_csv(get_pool(readonly=True), query,
+                                        [user_id] + where_params, type_labels)
                 
-                output = io.StringIO()
-                writer = csv.writer(output)
+                filename = f'transactions_{date.today()}.csv'
+                mimetype = 'text/csv'
+                if request.args.get('gzip', type=int):
+                    chunks = gzip_stream(chunks)
+                    filename += '.gz'
+                    mimetype = 'application/gzip'
                 
-                # Заголовки
-                writer.writerow(['Дата', 'Сумма', 'Тип', 'Категория', 'Описание'])
-                
-                # Данные
-                for t in transactions:
-                    writer.writerow([
-                        t['date'],
-                        t['amount'],
-                        _('Доход') if t['type'] == 'income' else _('Расход'),
-                        t['category'] or '',
-                        t['description'] or ''
-                    ])
-                
-                # Создание ответа
-                response = make_response(output.getvalue())
-                response.headers['Content-Disposition'] = \
-                    f'attachment; filename=transactions_{date.today()}.csv'
-                response.headers['Content-type'] = 'text/csv'
+                response = Response(chunks, mimetype=mimetype)
+                response.headers['Content-Disposition'] = f'attachment; filename={filename}'
                 
                 return response
             
@@ -859,6 +998,130 @@ def create_app(config_name=None):
             flash(_('Ошибка при экспорте отчета'), 'danger')
             return redirect(url_for('reports'))
     
+    # ========================================================================
+    # Маршруты фоновых задач
+    # ========================================================================
+    
+    def job_accepted(job_id):
+        """Ответ 202 с состоянием поставленной задачи и ссылкой на него."""
+        job = app.extensions['jobs'].get(job_id, get_current_user_id())
+        response = jsonify({'success': True, 'data': job})
+        response.status_code = 202
+        response.headers['Location'] = url_for('job_status', job_id=job_id)
+        return response
+    
+    def job_queue_full(error):
+        """Ответ 503 при заполненной очереди задач."""
+        response = jsonify({'success': False, 'error': str(error)})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    
+    @app.route('/jobs')
+    @login_required
+    def jobs_list():
+        """Последние фоновые задачи пользователя."""
+        try:
+            jobs = app.extensions['jobs'].recent(get_current_user_id())
+            return jsonify({'success': True, 'data': jobs})
+        except Exception as e:
+            app.logger.error(f'Jobs list error: {e}')
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    @app.route('/jobs/export', methods=['POST'])
+    @login_required
+    def submit_export_job():
+        """Экспорт транзакций по фильтру фоновой задачей."""
+        try:
+            transaction_filter = TransactionFilter.from_args(request.values)
+            job_id = app.extensions['jobs'].submit(
+                'export', get_current_user_id(),
+                filters=dict(transaction_filter.key()),
+                type_labels={'income': _('Доход'), 'expense': _('Расход')},
+                compress=bool(request.values.get('gzip', type=int))
+            )
+            return job_accepted(job_id)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except JobQueueFullError as e:
+            return job_queue_full(e)
+        except Exception as e:
+            app.logger.error(f'Export job error: {e}')
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    @app.route('/jobs/report', methods=['POST'])
+    @login_required
+    def submit_report_job():
+        """Отчет за период (например, за несколько лет) фоновой задачей."""
+        try:
+            start_date = date.fromisoformat(request.values.get('start_date', ''))
+            end_date = date.fromisoformat(request.values.get('end_date', ''))
+            if start_date > end_date:
+                raise ValueError('Начало периода позже конца')
+            
+            job_id = app.extensions['jobs'].submit(
+                'report', get_current_user_id(),
+                start_date=start_date.isoformat(), end_date=end_date.isoformat()
+            )
+            return job_accepted(job_id)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except JobQueueFullError as e:
+            return job_queue_full(e)
+        except Exception as e:
+            app.logger.error(f'Report job error: {e}')
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    @app.route('/jobs/<job_id>')
+    @login_required
+    def job_status(job_id):
+        """Статус и прогресс фоновой задачи."""
+        try:
+            job = app.extensions['jobs'].get(job_id, get_current_user_id())
+            if job is None:
+                return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
+            if job['status'] == 'succeeded' and job['result_name']:
+                job['download_url'] = url_for('job_download', job_id=job_id)
+            return jsonify({'success': True, 'data': job})
+        except Exception as e:
+            app.logger.error(f'Job status error: {e}')
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+    @app.route('/jobs/<job_id>/download')
+    @login_required
+    def job_download(job_id):
+        """Скачивание файла результата фоновой задачи."""
+        result = app.extensions['jobs'].result(job_id, get_current_user_id())
+        if result is None:
+            return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
+        if result['status'] != 'succeeded' or not result['result_path']:
+            return jsonify({'success': False, 'error': 'Результат еще не готов'}), 409
+        if not os.path.exists(result['result_path']):
+            return jsonify({'success': False, 'error': 'Срок хранения результата истек'}), 410
+        
+        return send_file(os.path.abspath(result['result_path']),
+                         mimetype=result['result_mimetype'],
+                         as_attachment=True,
+                         download_name=result['result_name'])
+    
+    @app.route('/jobs/<job_id>/cancel', methods=['POST'])
+    @login_required
+    def job_cancel(job_id):
+        """Отмена фоновой задачи."""
+        try:
+            cancelled = app.extensions['jobs'].cancel(job_id, get_current_user_id())
+            if cancelled is None:
+                return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
+            if not cancelled:
+                return jsonify({'success': False, 'error': 'Задача уже завершена'}), 409
+            return jsonify({
+                'success': True,
+                'data': app.extensions['jobs'].get(job_id, get_current_user_id())
+            })
+        except Exception as e:
+            app.logger.error(f'Job cancel error: {e}')
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
     # ========================================================================
     # Маршруты профиля и настроек
     # ========================================================================
@@ -869,14 +1132,12 @@ def create_app(config_name=None):
         """Страница профиля пользователя."""
         try:
             user_id = get_current_user_id()
-            db = get_db()
-            
-            # Получение данных пользователя
-            user_data = db.execute(
-                'SELECT * FROM users WHERE id = ?', (user_id,)
-            ).fetchone()
             
             if request.method == 'GET':
+                # Получение данных пользователя
+                user_data = get_db().execute(
+                    'SELECT * FROM users WHERE id = ?', (user_id,)
+                ).fetchone()
                 form = ProfileForm(
                     username=user_data['username'],
                     email=user_data['email']
@@ -885,35 +1146,21 @@ def create_app(config_name=None):
                 form = ProfileForm(request.form)
                 
                 if form.validate():
-                    # Проверка уникальности email
-                    if form.email.data != user_data['email']:
-                        existing = db.execute(
-                            'SELECT id FROM users WHERE email = ? AND id != ?',
-                            (form.email.data, user_id)
-                        ).fetchone()
-                        
-                        if existing:
-                            flash(_('Email уже используется другим пользователем'), 'danger')
-                            return render_template('profile/index.html', form=form)
-                    
-                    # Проверка уникальности имени пользователя
-                    if form.username.data != user_data['username']:
-                        existing = db.execute(
-                            'SELECT id FROM users WHERE username = ? AND id != ?',
-                            (form.username.data, user_id)
-                        ).fetchone()
-                        
-                        if existing:
-                            flash(_('Имя пользователя уже занято'), 'danger')
-                            return render_template('profile/index.html', form=form)
-                    
-                    # Обновление профиля
-                    db.execute('''
-                        UPDATE users 
-                        SET username = ?, email = ?
-                        WHERE id = ?
-                    ''', (form.username.data, form.email.data, user_id))
-                    db.commit()
+                    # Обновление профиля; уникальность email и имени
+                    # проверяют индексы users
+                    try:
+                        with write_transaction(user_id) as db:
+                            db.execute('''
+                                UPDATE users 
+                                SET username = ?, email = ?
+                                WHERE id = ?
+                            ''', (form.username.data, form.email.data, user_id))
+                    except sqlite3.IntegrityError as e:
+                        return duplicate_user_field(
+                            e, form, 'profile/index.html',
+                            _('Email уже используется другим пользователем')
+                        )
+                    forget_identity(user_id)
                     
                     flash(_('Профиль успешно обновлен'), 'success')
                     return redirect(url_for('profile'))
@@ -937,6 +1184,7 @@ def create_app(config_name=None):
     
     @app.route('/api/statistics')
     @login_required
+    @etag_by_data_version()
     def api_statistics():
         """API для получения статистики."""
         try:
@@ -956,41 +1204,123 @@ def create_app(config_name=None):
                 'error': str(e)
             }), 500
     
+    @app.route('/api/categories')
+    @login_required
+    def api_categories():
+        """API для списка категорий с итогами и расходом по лимиту."""
+        try:
+            user_id = get_current_user_id()
+            db = get_db()
+            
+            return jsonify({
+                'success': True,
+                'data': category_statistics(user_id, db)
+            })
+            
+        except Exception as e:
+            app.logger.error(f'API categories error: {e}')
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
+    @app.route('/api/transactions')
+    @login_required
+    def api_transactions():
+        """API для постраничного списка транзакций (курсорная пагинация)."""
+        try:
+            user_id = get_current_user_id()
+            limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_PAGE_SIZE)
+            cursor = request.args.get('cursor')
+            fields = parse_fields(request.args.get('fields'))
+            db = get_db()
+            
+            where, where_params = TransactionFilter.from_args(request.args).compile()
+            
+            query = select_clause(fields) + ' WHERE t.user_id = ?' + where
+            page = paginate(db, query, [user_id] + where_params,
+                            cursor=cursor, per_page=limit)
+            
+            return jsonify({
+                'success': True,
+                'data': [{name: row[name] for name in fields} for row in page.items],
+                'next_cursor': page.next_cursor
+            })
+            
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        except Exception as e:
+            app.logger.error(f'API transactions error: {e}')
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
+    @app.route('/api/transactions/search')
+    @login_required
+    def api_transactions_search():
+        """API для поиска транзакций по описанию (по релевантности)."""
+        try:
+            user_id = get_current_user_id()
+            limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_PAGE_SIZE)
+            db = get_db()
+            
+            results = search_transactions(db, user_id, request.args.get('q', ''), limit)
+            
+            return jsonify({
+                'success': True,
+                'data': [
+                    {key: row[key] for key in row.keys() if key != 'score'}
+                    for row in results
+                ]
+            })
+            
+        except Exception as e:
+            app.logger.error(f'API search error: {e}')
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
     @app.route('/api/transactions/chart')
     @login_required
+    @etag_by_data_version()
     def api_transactions_chart():
         """API для данных графика транзакций."""
         try:
             user_id = get_current_user_id()
             period = request.args.get('period', 'month')
-            db = get_db()
+            today = date.today()
             
-            # Определение периода
+            # Период и интервал по умолчанию
             if period == 'month':
-                start_date = date.today().replace(day=1)
-                group_by = 'DATE(date)'
+                start_date, end_date, bucket = today.replace(day=1), today, 'day'
             elif period == 'year':
-                start_date = date.today().replace(month=1, day=1)
-                group_by = 'MONTH(date)'
+                start_date = today.replace(month=1, day=1)
+                end_date = today.replace(month=12, day=31)
+                bucket = 'month'
             else:
-                start_date = date.today() - timedelta(days=30)
-                group_by = 'DATE(date)'
-            
-            # Данные для графика
-            chart_data = db.execute(f'''
-                SELECT 
-                    {group_by} as period,
-                    COALESCE(SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END), 0) as income,
-                    COALESCE(SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END), 0) as expense
-                FROM transactions
-                WHERE user_id = ? AND date >= ?
-                GROUP BY {group_by}
-                ORDER BY period
-            ''', (user_id, start_date.isoformat())).fetchall()
+                start_date, end_date, bucket = today - timedelta(days=30), today, 'day'
+            
+            try:
+                start_date = date.fromisoformat(request.args.get('start') or start_date.isoformat())
+                end_date = date.fromisoformat(request.args.get('end') or end_date.isoformat())
+                chart_data = chart_series(
+                    get_db(), user_id, start_date, end_date,
+                    request.args.get('bucket', bucket)
+                )
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
             
             return jsonify({
                 'success': True,
-                'data': [dict(row) for row in chart_data]
+                'data': chart_data
             })
             
         except Exception as e:
@@ -1013,7 +1343,12 @@ def create_app(config_name=None):
             return jsonify({
                 'status': 'healthy',
                 'timestamp': datetime.now().isoformat(),
-                'version': '1.0.0'
+                'version': '1.0.0',
+                'database_pool': get_pool_stats(),
+                'cache': app.extensions['cache'].stats(),
+                'jobs': app.extensions['jobs'].stats(),
+                'passwords': app.extensions['passwords'].stats(),
+                'rate_limit': app.extensions['ratelimit'].stats()
             })
         except Exception as e:
             return jsonify({
@@ -1021,6 +1356,11 @@ def create_app(config_name=None):
                 'error': str(e)
             }), 500
     
+    @app.route('/metrics')
+    def metrics():
+        """Метрики в текстовом формате Prometheus."""
+        return Response(app.extensions['metrics'].render(), mimetype=CONTENT_TYPE)
+    
     @app.route('/set-language/<lang>')
     def set_language_route(lang):
         """Установка языка интерфейса."""
@@ -1038,32 +1378,14 @@ def create_app(config_name=None):
     @app.before_request
     def before_request():
         """Выполняется перед каждым запросом."""
-        g.db = get_db()
-        g.start_time = datetime.now()
+        # Соединение с БД берется из пула лениво, при первом get_db(),
+        # и возвращается в пул при завершении контекста (setup_database);
+        # время запроса и SQL учитывает instrumentation (Server-Timing)
         
         # Логирование запроса
         if app.debug:
             app.logger.debug(f'Request: {request.method} {request.path}')
     
-    @app.after_request
-    def after_request(response):
-        """Выполняется после каждого запроса."""
-        # Закрытие соединения с БД
-        close_db_connection()
-        
-        # Логирование времени выполнения
-        if hasattr(g, 'start_time'):
-            duration = (datetime.now() - g.start_time).total_seconds()
-            if app.debug and duration > 0.1:  # Логируем только медленные запросы
-                app.logger.debug(f'Request took {duration:.3f}s: {request.method} {request.path}')
-        
-        return response
-    
-    @app.teardown_request
-    def teardown_request(exception=None):
-        """Выполняется после обработки запроса (даже при ошибках)."""
-        close_db_connection()
-    
     return app
 
 
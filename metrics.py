@@ -0,0 +1,410 @@
+"""
+Метрики приложения в текстовом формате Prometheus.
+
+Количество запросов и гистограммы задержек (perf_counter) по endpoint
+накапливаются в памяти процесса; запрос обновляет их под одной короткой
+блокировкой. Состояние пулов, кеша и задач снимается при сборе метрик.
+
+Если задан METRICS_DIR, каждый процесс не чаще раза в
+METRICS_FLUSH_INTERVAL секунд сохраняет снимок в metrics_<pid>.json,
+а /metrics объединяет снимки всех воркеров: счетчики и гистограммы
+суммируются по всем файлам, мгновенные значения - только по живым
+процессам. Каталог очищается при каждом развертывании.
+"""
+
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+from flask import g, request
+
+
+# Границы гистограмм в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PASSWORD_HASH_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Описание метрик: имя -> (тип, справка); порядок задает порядок вывода
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests by endpoint, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint.'),
+    'http_requests_in_flight': ('gauge', 'HTTP requests currently being processed.'),
+    'db_pool_connections': ('gauge', 'Database pool connections by pool and state.'),
+    'db_pool_waits_total': ('counter', 'Waits for a free pooled connection.'),
+    'db_writer_transactions_total': ('counter', 'Committed writer transactions.'),
+    'db_writer_busy_retries_total': ('counter', 'Writer BEGIN retries on a locked database.'),
+    'cache_requests_total': ('counter', 'Result cache lookups by result.'),
+    'cache_hit_ratio': ('gauge', 'Result cache hits to lookups since process start.'),
+    'cache_entries': ('gauge', 'Entries in the result cache.'),
+    'jobs_active': ('gauge', 'Background jobs queued or running.'),
+    'password_hash_duration_seconds': ('histogram', 'Password hashing and verification time.'),
+    'password_hash_wait_seconds': ('histogram', 'Time password operations waited for a hashing thread.'),
+    'password_hash_pending': ('gauge', 'Password operations running or queued.'),
+    'password_hash_rejected_total': ('counter', 'Password operations rejected because the queue was full.'),
+    'password_rehash_total': ('counter', 'Password hashes upgraded to the target bcrypt cost on login.'),
+    'rate_limit_rejected_total': ('counter', 'Login and registration attempts rejected by rate limits.'),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _labels_key(labels):
+    """Метки в виде кортежа пар, пригодного для ключа словаря."""
+    return tuple(tuple(pair) for pair in labels)
+
+
+def _pid_alive(pid):
+    """Процесс с указанным PID существует."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsRegistry:
+    """Счетчики и гистограммы процесса со снимками для нескольких воркеров."""
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        """
+        Инициализация реестра.
+
+        Args:
+            directory (str): Каталог снимков процессов; None - только этот процесс
+            flush_interval (float): Минимальный интервал сохранения снимка в секундах
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.in_flight = 0
+        self._requests = {}
+        self._latency = {}
+        self._counters = {}
+        self._histograms = {}
+        self._buckets = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._flushed = 0.0
+
+    def collector(self, function):
+        """
+        Регистрация функции, возвращающей значения при сборе (декоратор).
+
+        Args:
+            function (callable): Функция без аргументов, возвращающая
+                итерируемое (имя, метки, значение)
+
+        Returns:
+            callable: Та же функция
+        """
+        self._collectors.append(function)
+        return function
+
+    def inc(self, name, labels=(), value=1):
+        """Увеличение счетчика."""
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=DEFAULT_BUCKETS):
+        """
+        Учет значения в гистограмме.
+
+        Args:
+            name (str): Имя метрики
+            labels (tuple): Пары (метка, значение)
+            value (float): Значение
+            buckets (tuple): Верхние границы корзин
+        """
+        with self._lock:
+            self._observe(name, labels, value, buckets)
+
+    def _observe(self, name, labels, value, buckets):
+        # Корзины, затем +Inf, сумма и количество
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            self._buckets[name] = buckets
+            histogram = self._histograms[(name, labels)] = [0] * (len(buckets) + 3)
+        histogram[bisect.bisect_left(buckets, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def request_started(self):
+        """Учет начала запроса."""
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, endpoint, method, status, duration):
+        """
+        Учет завершенного запроса одной блокировкой.
+
+        Args:
+            endpoint (str): Имя endpoint Flask
+            method (str): HTTP метод
+            status (int): Код ответа
+            duration (float): Время обработки в секундах
+        """
+        # Метки собираются только при снимке, здесь - плоские ключи
+        key = (endpoint, method, status)
+        with self._lock:
+            self.in_flight -= 1
+            self._requests[key] = self._requests.get(key, 0) + 1
+            histogram = self._latency.get(endpoint)
+            if histogram is None:
+                histogram = self._latency[endpoint] = [0] * (len(DEFAULT_BUCKETS) + 3)
+            histogram[bisect.bisect_left(DEFAULT_BUCKETS, duration)] += 1
+            histogram[-2] += duration
+            histogram[-1] += 1
+
+        if self.directory:
+            now = time.monotonic()
+            if now - self._flushed >= self.flush_interval:
+                self._flushed = now
+                self.flush()
+
+    def snapshot(self):
+        """
+        Текущие значения процесса.
+
+        Returns:
+            dict: pid, counters, histograms, buckets и gauges
+        """
+        counters = []
+        gauges = []
+        for function in self._collectors:
+            for name, labels, value in function():
+                target = counters if METRICS[name][0] == 'counter' else gauges
+                target.append([name, [list(pair) for pair in labels], value])
+
+        with self._lock:
+            counters.extend(
+                [name, [list(pair) for pair in labels], value]
+                for (name, labels), value in self._counters.items()
+            )
+            counters.extend(
+                ['http_requests_total',
+                 [['endpoint', endpoint], ['method', method], ['status', str(status)]], value]
+                for (endpoint, method, status), value in self._requests.items()
+            )
+            histograms = [
+                [name, [list(pair) for pair in labels], list(histogram)]
+                for (name, labels), histogram in self._histograms.items()
+            ]
+            histograms.extend(
+                ['http_request_duration_seconds', [['endpoint', endpoint]], list(histogram)]
+                for endpoint, histogram in self._latency.items()
+            )
+            buckets = {name: list(buckets) for name, buckets in self._buckets.items()}
+            if self._latency:
+                buckets['http_request_duration_seconds'] = list(DEFAULT_BUCKETS)
+            gauges.append(['http_requests_in_flight', [], self.in_flight])
+            return {
+                'pid': os.getpid(),
+                'counters': counters,
+                'histograms': histograms,
+                'buckets': buckets,
+                'gauges': gauges,
+            }
+
+    def flush(self):
+        """Сохранение снимка процесса в каталог снимков."""
+        path = os.path.join(self.directory, f'metrics_{os.getpid()}.json')
+        try:
+            with open(path + '.tmp', 'w') as output:
+                json.dump(self.snapshot(), output)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass
+
+    def _snapshots(self):
+        """Снимки всех процессов (или только этого без каталога)."""
+        if not self.directory:
+            return [self.snapshot()]
+
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+            try:
+                with open(path) as stream:
+                    snapshots.append(json.load(stream))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def collect(self):
+        """
+        Значения, объединенные по процессам.
+
+        Returns:
+            tuple: (counters, histograms, buckets, gauges), где значения
+                сгруппированы по (имя, метки)
+        """
+        counters, histograms, buckets, gauges = {}, {}, {}, {}
+
+        for snapshot in self._snapshots():
+            for name, labels, value in snapshot['counters']:
+                key = (name, _labels_key(labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, histogram in snapshot['histograms']:
+                key = (name, _labels_key(labels))
+                total = histograms.setdefault(key, [0] * len(histogram))
+                for index, value in enumerate(histogram):
+                    total[index] += value
+            buckets.update(snapshot['buckets'])
+
+            if snapshot['pid'] == os.getpid() or _pid_alive(snapshot['pid']):
+                for name, labels, value in snapshot['gauges']:
+                    key = (name, _labels_key(labels))
+                    gauges[key] = gauges.get(key, 0) + value
+
+        hits = counters.get(('cache_requests_total', (('result', 'hit'),)), 0)
+        misses = counters.get(('cache_requests_total', (('result', 'miss'),)), 0)
+        if hits + misses:
+            gauges[('cache_hit_ratio', ())] = hits / (hits + misses)
+
+        return counters, histograms, buckets, gauges
+
+    def render(self):
+        """
+        Метрики в текстовом формате Prometheus 0.0.4.
+
+        Returns:
+            str: Текст для ответа /metrics
+        """
+        counters, histograms, buckets, gauges = self.collect()
+        values = {'counter': counters, 'gauge': gauges}
+        lines = []
+
+        for name, (metric_type, help_text) in METRICS.items():
+            if metric_type == 'histogram':
+                samples = sorted(key for key in histograms if key[0] == name)
+            else:
+                samples = sorted(key for key in values[metric_type] if key[0] == name)
+            if not samples:
+                continue
+
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for key in samples:
+                labels = key[1]
+                if metric_type != 'histogram':
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(values[metric_type][key])}')
+                    continue
+
+                histogram = histograms[key]
+                cumulative = 0
+                bounds = [_format_value(bound) for bound in buckets[name]] + ['+Inf']
+                for bound, count in zip(bounds, histogram[:-2]):
+                    cumulative += count
+                    lines.append(
+                        f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}'
+                    )
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram[-2])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {histogram[-1]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    """Метки в формате {name="value",...}."""
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    """Число без лишней дробной части."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def setup_metrics(app):
+    """
+    Подключение метрик к приложению.
+
+    Args:
+        app (Flask): Приложение Flask
+
+    Returns:
+        MetricsRegistry: Реестр (также доступен как app.extensions['metrics'])
+    """
+    directory = app.config.get('METRICS_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    registry = MetricsRegistry(directory, app.config.get('METRICS_FLUSH_INTERVAL', 1.0))
+    app.extensions['metrics'] = registry
+
+    @registry.collector
+    def database_metrics():
+        for database in list(app.extensions.get('databases', {}).values()):
+            stats = database.stats()
+            for pool in ('readers', 'connections'):
+                yield ('db_pool_connections', (('pool', pool), ('state', 'checked_out')),
+                       stats[pool]['checked_out'])
+                yield ('db_pool_connections', (('pool', pool), ('state', 'idle')),
+                       stats[pool]['idle'])
+                yield ('db_pool_waits_total', (('pool', pool),), stats[pool]['waits'])
+            yield ('db_writer_transactions_total', (), stats['writer']['transactions'])
+            yield ('db_writer_busy_retries_total', (), stats['writer']['busy_retries'])
+
+    @registry.collector
+    def cache_metrics():
+        cache = app.extensions.get('cache')
+        if cache is not None:
+            stats = cache.stats()
+            yield ('cache_requests_total', (('result', 'hit'),), stats['hits'])
+            yield ('cache_requests_total', (('result', 'miss'),), stats['misses'])
+            yield ('cache_entries', (), stats['entries'])
+
+    @registry.collector
+    def job_metrics():
+        jobs = app.extensions.get('jobs')
+        if jobs is not None:
+            yield ('jobs_active', (), jobs.stats()['active'])
+
+    @registry.collector
+    def password_metrics():
+        hasher = app.extensions.get('passwords')
+        if hasher is not None:
+            stats = hasher.stats()
+            yield ('password_hash_pending', (), stats['pending'])
+            yield ('password_hash_rejected_total', (), stats['rejected'])
+            yield ('password_rehash_total', (), stats['rehashed'])
+
+    @registry.collector
+    def rate_limit_metrics():
+        limiter = app.extensions.get('ratelimit')
+        if limiter is not None:
+            yield ('rate_limit_rejected_total', (), limiter.stats()['rejected'])
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        registry.request_started()
+
+    @app.after_request
+    def record_response_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exception=None):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        registry.request_finished(
+            request.endpoint or 'unmatched',
+            request.method,
+            g.pop('metrics_status', 500),
+            time.perf_counter() - started
+        )
+
+    return registry
@@ -0,0 +1,172 @@
+"""
+Курсорная (keyset) пагинация списков транзакций.
+
+Вместо LIMIT/OFFSET страница ищется по ключу сортировки последней
+показанной строки (date, created_at, id), поэтому стоимость запроса
+не зависит от глубины листания.
+"""
+
+import base64
+import json
+from collections import namedtuple
+
+
+# Колонки сортировки ленты транзакций; id делает ключ уникальным
+SEEK_COLUMNS = ('t.date', 't.created_at', 't.id')
+
+# Поля, доступные для проекции в JSON API: имя -> SQL выражение
+TRANSACTION_FIELDS = {
+    'id': 't.id',
+    'amount': 't.amount',
+    'description': 't.description',
+    'type': 't.type',
+    'date': 't.date',
+    'created_at': 't.created_at',
+    'category_id': 't.category_id',
+    'category_name': 'c.name',
+    'category_color': 'c.color',
+}
+
+# Поля, требующие JOIN с таблицей категорий
+CATEGORY_FIELDS = frozenset(['category_name', 'category_color'])
+
+MAX_PAGE_SIZE = 100
+
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor'])
+
+
+class InvalidCursorError(ValueError):
+    """Курсор поврежден или сформирован не этим приложением."""
+
+
+def encode_cursor(row):
+    """
+    Кодирование позиции строки в непрозрачный курсор.
+
+    Args:
+        row: Строка с полями date, created_at и id
+
+    Returns:
+        str: Курсор, безопасный для использования в URL
+    """
+    key = [str(row['date']), row['created_at'], row['id']]
+    raw = json.dumps(key, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Декодирование курсора в ключ сортировки.
+
+    Args:
+        cursor (str): Курсор из encode_cursor
+
+    Returns:
+        tuple: (date, created_at, id)
+
+    Raises:
+        InvalidCursorError: Если курсор некорректен
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise InvalidCursorError('Некорректный курсор') from e
+
+    if (not isinstance(key, list) or len(key) != 3
+            or not isinstance(key[0], str) or not isinstance(key[1], str)
+            or not isinstance(key[2], int) or isinstance(key[2], bool)):
+        raise InvalidCursorError('Некорректный курсор')
+
+    return tuple(key)
+
+
+def parse_fields(fields):
+    """
+    Разбор параметра проекции полей.
+
+    Args:
+        fields (str): Имена полей через запятую; пусто - все поля
+
+    Returns:
+        list: Имена полей в порядке запроса
+
+    Raises:
+        ValueError: Если запрошено неизвестное поле
+    """
+    if not fields:
+        return list(TRANSACTION_FIELDS)
+
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in TRANSACTION_FIELDS]
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(unknown)}')
+
+    return list(dict.fromkeys(names))
+
+
+def select_clause(fields):
+    """
+    SELECT и FROM для проекции полей транзакции.
+
+    Колонки ключа сортировки выбираются всегда, JOIN с категориями
+    добавляется только при необходимости.
+
+    Args:
+        fields (list): Имена полей из TRANSACTION_FIELDS
+
+    Returns:
+        str: Начало SQL запроса до WHERE
+    """
+    columns = dict.fromkeys(['id', 'date', 'created_at'] + list(fields))
+    select = ', '.join(f'{TRANSACTION_FIELDS[name]} AS {name}' for name in columns)
+
+    query = f'SELECT {select} FROM transactions t'
+    if CATEGORY_FIELDS.intersection(fields):
+        query += ' LEFT JOIN categories c ON t.category_id = c.id'
+    return query
+
+
+def paginate(db, query, params, cursor=None, per_page=20, backwards=False):
+    """
+    Выборка страницы транзакций по курсору.
+
+    Args:
+        db (sqlite3.Connection): Соединение с базой данных
+        query (str): Запрос с псевдонимом t и WHERE, без ORDER BY и LIMIT
+        params (list): Параметры запроса
+        cursor (str): Курсор позиции; None - первая страница
+        per_page (int): Размер страницы
+        backwards (bool): Листать к более новым записям (предыдущая страница)
+
+    Returns:
+        Page: Строки страницы и курсоры соседних страниц
+
+    Raises:
+        InvalidCursorError: Если курсор некорректен
+    """
+    params = list(params)
+    seek = ', '.join(SEEK_COLUMNS)
+
+    if cursor:
+        query += f' AND ({seek}) {">" if backwards else "<"} (?, ?, ?)'
+        params.extend(decode_cursor(cursor))
+
+    direction = 'ASC' if backwards else 'DESC'
+    query += ' ORDER BY ' + ', '.join(f'{column} {direction}' for column in SEEK_COLUMNS)
+    query += ' LIMIT ?'
+    params.append(per_page + 1)
+
+    rows = db.execute(query, params).fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if backwards:
+        rows.reverse()
+        next_cursor = encode_cursor(rows[-1]) if rows else None
+        prev_cursor = encode_cursor(rows[0]) if rows and has_more else None
+    else:
+        next_cursor = encode_cursor(rows[-1]) if rows and has_more else None
+        prev_cursor = encode_cursor(rows[0]) if rows and cursor else None
+
+    return Page(rows, next_cursor, prev_cursor)
@@ -0,0 +1,319 @@
+"""
+Хеширование и проверка паролей в ограниченном пуле потоков.
+
+bcrypt с BCRYPT_LOG_ROUNDS = 15 занимает сотни миллисекунд на пароль.
+Чтобы всплеск входов не занял все потоки воркера, хеширование выполняется
+в отдельном пуле из PASSWORD_HASH_WORKERS потоков (bcrypt освобождает
+GIL, поэтому потоки работают параллельно). Кроме выполняющихся, в очереди
+может ждать не больше PASSWORD_HASH_MAX_QUEUED операций; остальные сразу
+получают PasswordHasherBusyError, а маршруты отвечают 503 с Retry-After.
+
+Стоимость bcrypt записана в каждом хеше ($2b$<rounds>$...). Целевая
+стоимость - BCRYPT_LOG_ROUNDS или, если задан PASSWORD_HASH_TARGET_TIME,
+подобранная при старте по времени проверки на этом оборудовании, но не
+ниже BCRYPT_LOG_ROUNDS. Замер выполняется в каждом воркере и может дать
+разную стоимость, поэтому после подбора хеши дороже цели (до
+PASSWORD_HASH_MAX_ROUNDS) считаются подходящими: воркеры не перехешируют
+пароли друг за другом туда и обратно. После успешного входа пароль с
+неподходящей стоимостью перехешируется в фоне, так что хеши постепенно
+переходят на целевую стоимость без блокировки пользователей.
+"""
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from database import write_transaction
+from metrics import PASSWORD_HASH_BUCKETS
+
+
+_BCRYPT_PREFIX = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+
+def hash_cost(password_hash):
+    """
+    Стоимость (log2 раундов) bcrypt хеша.
+
+    Args:
+        password_hash (str): Сохраненный хеш
+
+    Returns:
+        int: Стоимость или None, если это не bcrypt хеш
+    """
+    match = _BCRYPT_PREFIX.match(password_hash or '')
+    return int(match.group(1)) if match else None
+
+
+def calibrate_rounds(target_time, min_rounds=10, max_rounds=16, probe_rounds=8):
+    """
+    Подбор стоимости bcrypt по времени проверки пароля на этом оборудовании.
+
+    Проверка с probe_rounds замеряется несколько раз, время для остальных
+    стоимостей оценивается удвоением на каждый раунд.
+
+    Args:
+        target_time (float): Допустимое время проверки пароля в секундах
+        min_rounds (int): Минимальная стоимость
+        max_rounds (int): Максимальная стоимость
+        probe_rounds (int): Стоимость пробного замера
+
+    Returns:
+        int: Наибольшая стоимость в пределах target_time, но не меньше min_rounds
+    """
+    password = b'calibration-password'
+    probe_hash = bcrypt.hashpw(password, bcrypt.gensalt(probe_rounds))
+    probe_time = float('inf')
+    for _ in range(3):
+        started = time.perf_counter()
+        bcrypt.checkpw(password, probe_hash)
+        probe_time = min(probe_time, time.perf_counter() - started)
+
+    rounds = min_rounds
+    for candidate in range(min_rounds, max_rounds + 1):
+        if probe_time * 2 ** (candidate - probe_rounds) <= target_time:
+            rounds = candidate
+    return rounds
+
+
+class PasswordHasherBusyError(Exception):
+    """Очередь хеширования паролей заполнена."""
+
+
+class PasswordHasher:
+    """Ограниченный пул потоков для bcrypt с контролем длины очереди."""
+
+    def __init__(self, app, max_workers=2, max_queued=16, retry_after=2, rounds=12,
+                 max_rounds=None):
+        """
+        Инициализация пула.
+
+        Args:
+            app (Flask): Приложение (настройки bcrypt и метрики)
+            max_workers (int): Количество потоков хеширования
+            max_queued (int): Максимум операций, ожидающих свободного потока
+            retry_after (int): Значение Retry-After для отказов в секундах
+            rounds (int): Целевая стоимость новых хешей
+            max_rounds (int): Наибольшая стоимость, не требующая перехеширования;
+                None - только rounds
+        """
+        self.app = app
+        self.retry_after = retry_after
+        self.rounds = rounds
+        self.max_rounds = rounds if max_rounds is None else max(rounds, max_rounds)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='password')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queued)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def _run(self, operation, function, args, submitted):
+        """Выполнение операции в потоке пула с учетом времени в метриках."""
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                return function(*args)
+        finally:
+            finished = time.perf_counter()
+            registry = self.app.extensions.get('metrics')
+            if registry is not None:
+                labels = (('operation', operation),)
+                registry.observe('password_hash_wait_seconds', labels,
+                                 started - submitted, PASSWORD_HASH_BUCKETS)
+                registry.observe('password_hash_duration_seconds', labels,
+                                 finished - started, PASSWORD_HASH_BUCKETS)
+
+    def _done(self, future):
+        """Освобождение места в очереди после завершения операции."""
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def _submit(self, operation, function, *args):
+        """
+        Постановка операции в пул.
+
+        Returns:
+            Future: Результат операции
+
+        Raises:
+            PasswordHasherBusyError: Если очередь заполнена
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusyError('Слишком много одновременных операций с паролями')
+
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self._executor.submit(
+                self._run, operation, function, args, time.perf_counter()
+            )
+        except BaseException:
+            with self._lock:
+                self.pending -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _call(self, operation, function, *args):
+        """
+        Выполнение операции в пуле с ожиданием результата.
+
+        Raises:
+            PasswordHasherBusyError: Если очередь заполнена
+        """
+        return self._submit(operation, function, *args).result()
+
+    def _hash_password(self, password):
+        """Хеширование с целевой стоимостью пула (выполняется в потоке пула)."""
+        salt = bcrypt.gensalt(self.rounds)
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+    @staticmethod
+    def _verify_password(password, password_hash):
+        """Проверка пароля по bcrypt хешу (выполняется в потоке пула)."""
+        try:
+            return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+        except ValueError:
+            # Хеш не в формате bcrypt
+            return False
+
+    def hash(self, password):
+        """
+        Хеширование пароля.
+
+        Args:
+            password (str): Пароль
+
+        Returns:
+            str: Хеш пароля
+
+        Raises:
+            PasswordHasherBusyError: Если очередь заполнена
+        """
+        return self._call('hash', self._hash_password, password)
+
+    def verify(self, password, password_hash):
+        """
+        Проверка пароля.
+
+        Args:
+            password (str): Пароль
+            password_hash (str): Сохраненный хеш
+
+        Returns:
+            bool: Пароль верный
+
+        Raises:
+            PasswordHasherBusyError: Если очередь заполнена
+        """
+        return self._call('verify', self._verify_password, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        """
+        Стоимость хеша вне [rounds, max_rounds] (или это не bcrypt хеш).
+
+        Args:
+            password_hash (str): Сохраненный хеш
+
+        Returns:
+            bool: Нужно перехешировать
+        """
+        cost = hash_cost(password_hash)
+        return cost is None or not self.rounds <= cost <= self.max_rounds
+
+    def _rehash(self, user_id, password, password_hash):
+        """Перехеширование пароля с заменой хеша, если его не сменили."""
+        try:
+            new_hash = self._hash_password(password)
+            with write_transaction() as db:
+                updated = db.execute(
+                    'UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                    (new_hash, user_id, password_hash)
+                ).rowcount
+            if updated:
+                with self._lock:
+                    self.rehashed += 1
+        except Exception as e:
+            self.app.logger.error(f'Password rehash error for user {user_id}: {e}')
+
+    def rehash_if_needed(self, user_id, password, password_hash):
+        """
+        Фоновое перехеширование пароля после успешного входа.
+
+        Если пул занят, перехеширование откладывается до следующего входа.
+
+        Args:
+            user_id (int): ID пользователя
+            password (str): Проверенный пароль
+            password_hash (str): Текущий хеш
+
+        Returns:
+            bool: Перехеширование поставлено в очередь
+        """
+        if not self.needs_rehash(password_hash):
+            return False
+        try:
+            self._submit('rehash', self._rehash, user_id, password, password_hash)
+        except PasswordHasherBusyError:
+            return False
+        return True
+
+    def stats(self):
+        """Статистика пула."""
+        with self._lock:
+            return {
+                'pending': self.pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'rehashed': self.rehashed,
+                'rounds': self.rounds,
+                'max_rounds': self.max_rounds,
+            }
+
+    def shutdown(self, wait=True):
+        """Остановка пула."""
+        self._executor.shutdown(wait=wait)
+
+
+def init_passwords(app):
+    """
+    Создание пула хеширования паролей приложения.
+
+    Args:
+        app (Flask): Приложение
+
+    Returns:
+        PasswordHasher: Пул, доступный как app.extensions['passwords']
+    """
+    rounds = max_rounds = app.config.get('BCRYPT_LOG_ROUNDS', 12)
+    target_time = app.config.get('PASSWORD_HASH_TARGET_TIME', 0)
+    if target_time:
+        # Подбор только повышает стоимость относительно BCRYPT_LOG_ROUNDS
+        max_rounds = app.config.get('PASSWORD_HASH_MAX_ROUNDS', 16)
+        rounds = max(rounds, calibrate_rounds(
+            target_time,
+            min_rounds=app.config.get('PASSWORD_HASH_MIN_ROUNDS', 10),
+            max_rounds=max_rounds
+        ))
+        app.logger.info(f'Calibrated bcrypt cost: {rounds} rounds for {target_time}s')
+
+    hasher = PasswordHasher(
+        app,
+        max_workers=app.config.get('PASSWORD_HASH_WORKERS', 2),
+        max_queued=app.config.get('PASSWORD_HASH_MAX_QUEUED', 16),
+        retry_after=app.config.get('PASSWORD_HASH_RETRY_AFTER', 2),
+        rounds=rounds,
+        max_rounds=max_rounds
+    )
+    app.extensions['passwords'] = hasher
+    return hasher
@@ -0,0 +1,347 @@
+"""
+Индекс префиксных сумм по дням для итогов за произвольный период.
+
+Для каждого пользователя строятся два дерева Фенвика (доходы и расходы
+в копейках) над массивом дней. Итог за период и остаток на дату
+вычисляются за O(log n) без сканирования транзакций. Индекс строится
+лениво одним сгруппированным запросом, обновляется маршрутами записи
+и перестраивается, если версия данных пользователя ушла вперед.
+"""
+
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import date
+
+from flask import current_app, has_app_context
+
+from versions import current_data_version, get_data_version, on_version_changed
+
+
+# Запас дней после последней транзакции (и сегодняшнего дня) для новых записей
+GROWTH_DAYS = 62
+
+
+class FenwickTree:
+    """Дерево Фенвика над компактным массивом 64-битных целых."""
+
+    def __init__(self, size):
+        """
+        Инициализация нулевого дерева.
+
+        Args:
+            size (int): Количество элементов
+        """
+        self.size = size
+        self._tree = array('q', bytes(8 * (size + 1)))
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Построение дерева по значениям за O(n).
+
+        Args:
+            values (list): Значения элементов
+
+        Returns:
+            FenwickTree: Дерево
+        """
+        tree = cls(len(values))
+        data = tree._tree
+        for index, value in enumerate(values, 1):
+            data[index] += value
+            parent = index + (index & -index)
+            if parent <= tree.size:
+                data[parent] += data[index]
+        return tree
+
+    def add(self, index, delta):
+        """Прибавление delta к элементу index (с нуля)."""
+        index += 1
+        while index <= self.size:
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index):
+        """Сумма элементов [0, index]; для index < 0 - ноль."""
+        total = 0
+        index = min(index, self.size - 1) + 1
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def range_sum(self, start, end):
+        """Сумма элементов [start, end]."""
+        if end < start:
+            return 0
+        return self.prefix(end) - self.prefix(start - 1)
+
+
+class DailyTotals:
+    """Префиксные суммы доходов и расходов пользователя по дням."""
+
+    def __init__(self, origin, income, expense, version):
+        """
+        Args:
+            origin (int): Порядковый номер первого дня (date.toordinal)
+            income (FenwickTree): Доходы по дням в копейках
+            expense (FenwickTree): Расходы по дням в копейках
+            version (int): Версия данных пользователя, которой соответствует индекс
+        """
+        self.origin = origin
+        self.income = income
+        self.expense = expense
+        self.version = version
+
+    @classmethod
+    def build(cls, db, user_id, today=None):
+        """
+        Построение индекса одним сгруппированным запросом.
+
+        Args:
+            db (sqlite3.Connection): Соединение с базой данных
+            user_id (int): ID пользователя
+            today (date): Текущая дата (для тестов)
+
+        Returns:
+            DailyTotals: Индекс
+        """
+        # Версия и суммы читаются из одного снимка базы данных
+        owned = not db.in_transaction
+        if owned:
+            db.execute('BEGIN')
+        try:
+            version = get_data_version(db, user_id)
+            rows = db.execute('''
+                SELECT date, type, SUM(CAST(ROUND(amount * 100) AS INTEGER)) AS cents
+                FROM transactions
+                WHERE user_id = ?
+                GROUP BY date, type
+            ''', (user_id,)).fetchall()
+        finally:
+            if owned:
+                db.commit()
+
+        today = (today or date.today()).toordinal()
+        days = [date.fromisoformat(str(row['date'])[:10]).toordinal() for row in rows]
+        origin = min(days, default=today)
+        size = max(days + [today]) - origin + 1 + GROWTH_DAYS
+
+        income = [0] * size
+        expense = [0] * size
+        for day, row in zip(days, rows):
+            target = income if row['type'] == 'income' else expense
+            target[day - origin] += row['cents']
+
+        return cls(origin, FenwickTree.from_values(income),
+                   FenwickTree.from_values(expense), version)
+
+    def covers(self, day):
+        """Дата попадает в массив индекса."""
+        return 0 <= day.toordinal() - self.origin < self.income.size
+
+    def add(self, day, transaction_type, cents):
+        """Изменение суммы дня; дата должна попадать в индекс."""
+        tree = self.income if transaction_type == 'income' else self.expense
+        tree.add(day.toordinal() - self.origin, cents)
+
+    def totals(self, start=None, end=None):
+        """
+        Доходы и расходы за период включительно.
+
+        Args:
+            start (date): Начало периода; None - с первой транзакции
+            end (date): Конец периода; None - до последнего дня индекса
+
+        Returns:
+            tuple: (доходы, расходы) в копейках
+        """
+        first = start.toordinal() - self.origin if start else 0
+        last = end.toordinal() - self.origin if end else self.income.size - 1
+        first = max(first, 0)
+        return self.income.range_sum(first, last), self.expense.range_sum(first, last)
+
+    def balance_before(self, day):
+        """Остаток (доходы минус расходы) на начало дня в копейках."""
+        index = day.toordinal() - self.origin - 1
+        return self.income.prefix(index) - self.expense.prefix(index)
+
+
+def _index_key(user_id):
+    """Ключ индекса: база данных приложения и пользователь."""
+    path = current_app.config.get('DATABASE_PATH') if has_app_context() else None
+    return path, user_id
+
+
+class PrefixSumIndex:
+    """Индексы префиксных сумм пользователей с вытеснением по LRU."""
+
+    def __init__(self, max_users=256):
+        """
+        Args:
+            max_users (int): Максимальное количество индексов в памяти
+        """
+        self.max_users = max_users
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.updates = 0
+
+    def get(self, db, user_id):
+        """
+        Индекс пользователя, соответствующий текущей версии данных.
+
+        Args:
+            db (sqlite3.Connection): Соединение с базой данных
+            user_id (int): ID пользователя
+
+        Returns:
+            DailyTotals: Индекс
+        """
+        key = _index_key(user_id)
+        version = current_data_version(db, user_id)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None and index.version == version:
+                self._indexes.move_to_end(key)
+                return index
+
+        index = DailyTotals.build(db, user_id)
+        with self._lock:
+            self.builds += 1
+            self._indexes[key] = index
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    def summary(self, db, user_id, start=None, end=None):
+        """
+        Итоги пользователя за период и остатки на его границах.
+
+        Args:
+            db (sqlite3.Connection): Соединение с базой данных
+            user_id (int): ID пользователя
+            start (date): Начало периода включительно; None - без ограничения
+            end (date): Конец периода включительно; None - без ограничения
+
+        Returns:
+            tuple: (доходы, расходы, остаток на начало) в копейках
+        """
+        index = self.get(db, user_id)
+        # Чтение под блокировкой: apply() изменяет массивы на месте
+        with self._lock:
+            income, expense = index.totals(start, end)
+            opening = index.balance_before(start) if start else 0
+        return income, expense, opening
+
+    def begin(self, db, user_id):
+        """
+        Начало учета изменений внутри write_transaction.
+
+        Example:
+            with write_transaction(user_id) as db:
+                changes = prefix_index.begin(db, user_id)
+                db.execute('INSERT INTO transactions ...')
+                changes.add(day, 'expense', amount)
+                changes.finish(db)
+            prefix_index.apply(changes)
+
+        Args:
+            db (sqlite3.Connection): Соединение писателя в открытой транзакции
+            user_id (int): ID пользователя
+
+        Returns:
+            IndexChanges: Накопитель изменений
+        """
+        return IndexChanges(user_id, get_data_version(db, user_id))
+
+    def apply(self, changes):
+        """
+        Применение изменений после фиксации транзакции.
+
+        Индекс обновляется, только если он соответствовал версии до
+        записи и все даты в него попадают; иначе он удаляется и будет
+        построен заново при следующем чтении.
+
+        Args:
+            changes (IndexChanges): Изменения зафиксированной транзакции
+        """
+        key = _index_key(changes.user_id)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                return
+            if (index.version != changes.version_before or changes.version_after is None
+                    or not all(index.covers(day) for day, _, _ in changes.deltas)):
+                del self._indexes[key]
+                return
+            for day, transaction_type, cents in changes.deltas:
+                index.add(day, transaction_type, cents)
+            index.version = changes.version_after
+            self.updates += 1
+
+    def discard(self, user_id):
+        """Удаление индексов пользователя."""
+        with self._lock:
+            for key in [key for key in self._indexes if key[1] == user_id]:
+                del self._indexes[key]
+
+
+class IndexChanges:
+    """Изменения сумм по дням в одной транзакции записи."""
+
+    def __init__(self, user_id, version_before):
+        self.user_id = user_id
+        self.version_before = version_before
+        self.version_after = None
+        self.deltas = []
+
+    def add(self, day, transaction_type, amount, sign=1):
+        """
+        Учет добавленной (sign=1) или удаленной (sign=-1) суммы.
+
+        Args:
+            day (date|str): Дата транзакции
+            transaction_type (str): 'income' или 'expense'
+            amount (float|Decimal): Сумма
+            sign (int): 1 или -1
+        """
+        if not isinstance(day, date):
+            day = date.fromisoformat(str(day)[:10])
+        self.deltas.append((day, transaction_type, sign * int(round(float(amount) * 100))))
+
+    def finish(self, db):
+        """Фиксация версии после изменений (внутри той же транзакции)."""
+        self.version_after = get_data_version(db, self.user_id)
+
+
+prefix_index = PrefixSumIndex()
+on_version_changed(prefix_index.discard)
+
+
+def range_totals(db, user_id, start=None, end=None):
+    """
+    Итоги пользователя за период и остатки на его границах.
+
+    Args:
+        db (sqlite3.Connection): Соединение с базой данных
+        user_id (int): ID пользователя
+        start (date): Начало периода включительно; None - без ограничения
+        end (date): Конец периода включительно; None - без ограничения
+
+    Returns:
+        dict: income, expense, balance за период, opening_balance на начало
+            и closing_balance на конец периода
+    """
+    income, expense, opening = prefix_index.summary(db, user_id, start, end)
+    closing = opening + income - expense
+
+    return {
+        'income': income / 100,
+        'expense': expense / 100,
+        'balance': (income - expense) / 100,
+        'opening_balance': opening / 100,
+        'closing_balance': closing / 100,
+    }
@@ -0,0 +1,357 @@
+"""
+Ограничение частоты попыток входа и регистрации.
+
+Каждое правило (например, login_ip или login_email) задается строкой
+вида '5/minute' и работает как корзина токенов: емкость - количество
+попыток, токены восполняются равномерно за период. Попытка расходует
+токен; если токена нет, запрос отклоняется с Retry-After до появления
+следующего токена, до проверки формы, обращений к базе и bcrypt.
+
+Вход ограничивается по адресу на каждую попытку, а по паре email и адрес -
+только за неверные пароли: перед bcrypt корзина пары лишь проверяется.
+Успешный вход токенов не тратит, а чужие неудачные попытки с другого
+адреса не блокируют владельца учетной записи.
+
+Бэкенды: память процесса (компактный LRU словарь ключ -> (токены,
+время); вытесненная корзина просто считается полной) и общий файл
+SQLite для нескольких воркеров.
+"""
+
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request
+
+
+# Длительность периодов правил в секундах
+PERIODS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+}
+
+
+def parse_rate(rate):
+    """
+    Разбор правила вида '5/minute'.
+
+    Args:
+        rate (str): Количество попыток и период
+
+    Returns:
+        tuple: (емкость корзины, период в секундах)
+
+    Raises:
+        ValueError: Если правило записано неверно
+    """
+    try:
+        count, period = rate.split('/')
+        count = int(count)
+        seconds = PERIODS[period.strip().lower()]
+    except (ValueError, KeyError):
+        raise ValueError(f'Неверное правило ограничения частоты: {rate}')
+    if count <= 0:
+        raise ValueError(f'Неверное правило ограничения частоты: {rate}')
+    return count, seconds
+
+
+def _take(tokens, updated_at, now, capacity, period, consume=True):
+    """
+    Расход токена из корзины.
+
+    Args:
+        consume (bool): False - только проверка наличия токена
+
+    Returns:
+        tuple: (токены после попытки, секунд до следующего токена или 0)
+    """
+    rate = capacity / period
+    tokens = min(capacity, tokens + (now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1 if consume else tokens, 0
+    return tokens, (1 - tokens) / rate
+
+
+class NullBackend:
+    """Бэкенд без ограничений."""
+
+    name = 'null'
+
+    def take(self, key, capacity, period, consume=True):
+        return 0
+
+    def reset(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class MemoryBackend:
+    """Корзины в памяти процесса с вытеснением давно неиспользуемых."""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=100000):
+        """
+        Инициализация хранилища.
+
+        Args:
+            max_entries (int): Максимальное количество корзин
+        """
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, period, consume=True):
+        """
+        Расход токена корзины key.
+
+        Args:
+            consume (bool): False - только проверка, корзина не меняется
+
+        Returns:
+            float: 0, если попытка разрешена, иначе секунды до следующего токена
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not consume:
+                tokens, updated_at = self._buckets.get(key, (capacity, now))
+                return _take(tokens, updated_at, now, capacity, period, consume=False)[1]
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens, retry_after = _take(tokens, updated_at, now, capacity, period)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def reset(self):
+        """Удаление всех корзин."""
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBackend:
+    """
+    Общие для процессов корзины в отдельном файле SQLite.
+
+    Корзина читается и обновляется в одной транзакции BEGIN IMMEDIATE.
+    Раз в prune_interval попыток удаляются корзины, которые уже снова полны.
+    """
+
+    name = 'sqlite'
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            full_at REAL NOT NULL
+        ) WITHOUT ROWID
+    '''
+
+    def __init__(self, path, prune_interval=1000):
+        """
+        Инициализация хранилища.
+
+        Args:
+            path (str): Путь к файлу
+            prune_interval (int): Через сколько попыток удалять полные корзины
+        """
+        self.path = path
+        self.prune_interval = prune_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._takes = 0
+        self._connection().execute(self.SCHEMA)
+
+    def _connection(self):
+        """Соединение текущего потока."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = OFF')
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, capacity, period, consume=True):
+        """
+        Расход токена корзины key.
+
+        Args:
+            consume (bool): False - только проверка, корзина не меняется
+
+        Returns:
+            float: 0, если попытка разрешена, иначе секунды до следующего токена
+        """
+        connection = self._connection()
+        now = time.time()
+        if not consume:
+            row = connection.execute(
+                'SELECT tokens, updated_at FROM rate_limits WHERE key = ?', (key,)
+            ).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            return _take(tokens, updated_at, now, capacity, period, consume=False)[1]
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT tokens, updated_at FROM rate_limits WHERE key = ?', (key,)
+            ).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens, retry_after = _take(tokens, updated_at, now, capacity, period)
+            connection.execute(
+                'INSERT OR REPLACE INTO rate_limits (key, tokens, updated_at, full_at) '
+                'VALUES (?, ?, ?, ?)',
+                (key, tokens, now, now + (capacity - tokens) * period / capacity)
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+        with self._lock:
+            self._takes += 1
+            prune = self._takes % self.prune_interval == 0
+        if prune:
+            connection.execute('DELETE FROM rate_limits WHERE full_at <= ?', (now,))
+        return retry_after
+
+    def reset(self):
+        """Удаление всех корзин."""
+        self._connection().execute('DELETE FROM rate_limits')
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM rate_limits').fetchone()[0]
+
+
+class RateLimiter:
+    """Именованные правила ограничения частоты поверх бэкенда корзин."""
+
+    def __init__(self, backend, rules):
+        """
+        Инициализация ограничителя.
+
+        Args:
+            backend: MemoryBackend, SQLiteBackend или NullBackend
+            rules (dict): Имя правила -> строка вида '5/minute'
+        """
+        self.backend = backend
+        self.rules = {name: parse_rate(rate) for name, rate in rules.items()}
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def check(self, *hits, consume=True):
+        """
+        Учет попытки по нескольким правилам.
+
+        Токен расходуется по каждому правилу, даже если другое уже отказало,
+        поэтому перебор адресов не обходит правило по email и наоборот.
+
+        Args:
+            *hits: Пары (имя правила, ключ); пустые ключи пропускаются
+            consume (bool): False - только проверка без расхода токенов
+
+        Returns:
+            int: 0, если попытка разрешена, иначе Retry-After в секундах
+        """
+        retry_after = 0
+        for name, key in hits:
+            if not key:
+                continue
+            capacity, period = self.rules[name]
+            retry_after = max(retry_after, self.backend.take(
+                f'{name}:{key}', capacity, period, consume=consume
+            ))
+        if retry_after:
+            with self._lock:
+                self.rejected += 1
+        return math.ceil(retry_after)
+
+    def reset(self):
+        """Сброс всех корзин."""
+        self.backend.reset()
+
+    def stats(self):
+        """
+        Метрики ограничителя.
+
+        Returns:
+            dict: backend, buckets, rejected
+        """
+        return {
+            'backend': self.backend.name,
+            'buckets': len(self.backend),
+            'rejected': self.rejected,
+        }
+
+
+def client_ip():
+    """Адрес клиента текущего запроса."""
+    return request.remote_addr or 'unknown'
+
+
+def normalize_email(email):
+    """Email в виде ключа корзины (без пробелов, в нижнем регистре)."""
+    return (email or '').strip().lower()
+
+
+def login_email_key(email):
+    """
+    Ключ корзины неудачных входов: email вместе с адресом клиента.
+
+    Returns:
+        str: Ключ или пустая строка без email
+    """
+    email = normalize_email(email)
+    return f'{email}|{client_ip()}' if email else ''
+
+
+def create_backend(config):
+    """
+    Бэкенд корзин по настройкам приложения.
+
+    Args:
+        config (dict): app.config
+
+    Returns:
+        Бэкенд, выбранный RATE_LIMIT_BACKEND
+
+    Raises:
+        ValueError: Если бэкенд неизвестен
+    """
+    name = config.get('RATE_LIMIT_BACKEND', 'memory')
+    if name == 'memory':
+        return MemoryBackend(config.get('RATE_LIMIT_MAX_ENTRIES', 100000))
+    if name == 'sqlite':
+        return SQLiteBackend(config.get('RATE_LIMIT_PATH', 'family_finance_ratelimit.db'))
+    if name == 'null':
+        return NullBackend()
+    raise ValueError(f'Неизвестный бэкенд ограничения частоты: {name}')
+
+
+def init_rate_limiter(app):
+    """
+    Создание ограничителя частоты приложения.
+
+    Args:
+        app (Flask): Приложение
+
+    Returns:
+        RateLimiter: Ограничитель, доступный как app.extensions['ratelimit']
+    """
+    limiter = RateLimiter(create_backend(app.config), {
+        'login_ip': app.config.get('RATE_LIMIT_LOGIN_IP', '20/minute'),
+        'login_email': app.config.get('RATE_LIMIT_LOGIN_EMAIL', '5/minute'),
+        'register_ip': app.config.get('RATE_LIMIT_REGISTER_IP', '5/hour'),
+    })
+    app.extensions['ratelimit'] = limiter
+    return limiter
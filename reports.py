@@ -0,0 +1,564 @@
+"""
+Отчет по транзакциям за период.
+
+Транзакции периода загружаются одним запросом в столбцы (копейки int64,
+порядковые номера дней и месяцев, коды типа и категории), а разбивки по
+месяцам, категориям и типам считаются векторно в NumPy. Без NumPy
+используется построчный расчет с тем же результатом.
+
+Закрытые месяцы (завершившиеся более льготного периода назад) сохраняются
+снимками в таблице report_snapshots. Отчет склеивается из снимков, и заново
+считаются только открытые и частично попавшие в период месяцы. Триггеры
+удаляют снимок месяца, которого коснулась запись задним числом.
+"""
+
+import heapq
+import json
+import sqlite3
+from collections import defaultdict
+from datetime import date, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy необязателен
+    np = None
+
+from flask import current_app, has_app_context
+
+from cache import cached
+from versions import get_data_version
+
+
+# Количество крупнейших транзакций каждого типа в отчете
+LARGEST_LIMIT = 5
+
+# Дней после конца месяца, в течение которых он еще считается открытым
+SNAPSHOT_GRACE_DAYS = 3
+
+# Снимок месяца удаляется при любом изменении его транзакций
+REPORT_SNAPSHOTS_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS report_snapshots (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        data TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, month)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS report_snapshots_insert
+    AFTER INSERT ON transactions BEGIN
+        DELETE FROM report_snapshots
+        WHERE user_id = new.user_id AND month = substr(new.date, 1, 7);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS report_snapshots_delete
+    AFTER DELETE ON transactions BEGIN
+        DELETE FROM report_snapshots
+        WHERE user_id = old.user_id AND month = substr(old.date, 1, 7);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS report_snapshots_update
+    AFTER UPDATE OF amount, type, date, category_id, user_id ON transactions BEGIN
+        DELETE FROM report_snapshots
+        WHERE (user_id = old.user_id AND month = substr(old.date, 1, 7))
+           OR (user_id = new.user_id AND month = substr(new.date, 1, 7));
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS report_snapshots_user_delete
+    AFTER DELETE ON users BEGIN
+        DELETE FROM report_snapshots WHERE user_id = old.id;
+    END
+    ''',
+)
+
+# Снимок сохраняется, только если данные не изменились после его расчета
+_STORE_SNAPSHOT_QUERY = '''
+    INSERT OR REPLACE INTO report_snapshots (user_id, month, data)
+    SELECT ?, ?, ?
+    WHERE COALESCE((SELECT version FROM data_versions WHERE user_id = ?), 0) = ?
+'''
+
+# Столбцы: id, копейки, номер дня (date.toordinal), номер месяца, доход (1/0), категория
+_COLUMNS_QUERY = '''
+    SELECT id,
+           CAST(ROUND(amount * 100) AS INTEGER),
+           CAST(julianday(date) - 1721424.5 AS INTEGER),
+           CAST(substr(date, 1, 4) AS INTEGER) * 12 + CAST(substr(date, 6, 2) AS INTEGER) - 1,
+           type = 'income',
+           COALESCE(category_id, 0)
+    FROM transactions
+    WHERE user_id = ? AND date BETWEEN ? AND ?
+'''
+
+_ID, _CENTS, _DAY, _MONTH, _INCOME, _CATEGORY = range(6)
+
+
+def _to_date(value):
+    """Дата из date или строки ISO."""
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def _month_index(day):
+    """Порядковый номер месяца (год * 12 + месяц - 1)."""
+    return day.year * 12 + day.month - 1
+
+
+def _month_start(index):
+    """Первый день месяца по порядковому номеру."""
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _month_label(index):
+    """Месяц в формате YYYY-MM по порядковому номеру."""
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def create_report_snapshots(db):
+    """
+    Создание таблицы снимков отчетов и триггеров.
+
+    Используется миграцией; снимки строятся лениво при первом отчете.
+
+    Args:
+        db (sqlite3.Connection): Соединение писателя в открытой транзакции
+    """
+    for statement in REPORT_SNAPSHOTS_SCHEMA:
+        db.execute(statement)
+
+
+def _fetch_columns(db, user_id, start, end):
+    """Строки периода кортежами (без фабрики sqlite3.Row)."""
+    cursor = db.cursor()
+    cursor.row_factory = None
+    return cursor.execute(_COLUMNS_QUERY, (user_id, start.isoformat(), end.isoformat())).fetchall()
+
+
+def _aggregate_numpy(rows, first_day, days, first_month, months):
+    """
+    Векторный расчет итогов.
+
+    Returns:
+        dict: Итоги по типам, месяцам, категориям и крупнейшие транзакции
+    """
+    data = np.array(rows, dtype=np.int64).reshape(-1, 6)
+    cents = data[:, _CENTS]
+    income = data[:, _INCOME] == 1
+    month = data[:, _MONTH] - first_month
+
+    # Итоги по месяцам: индекс = месяц * 2 + тип
+    slots = month * 2 + income
+    by_month = np.bincount(slots, weights=cents, minlength=months * 2).round().astype(np.int64)
+    month_counts = np.bincount(month, minlength=months)
+
+    # Расходы по дням для дня с наибольшими тратами
+    by_day = np.bincount(data[~income, _DAY] - first_day, weights=cents[~income], minlength=days)
+    peak_day = int(by_day.argmax()) if (~income).any() else None
+
+    # Итоги по категориям: коды категорий -> плотные индексы, затем по типу
+    codes, dense = np.unique(data[:, _CATEGORY], return_inverse=True)
+    slots = dense * 2 + income
+    by_category = np.bincount(slots, weights=cents, minlength=len(codes) * 2).round().astype(np.int64)
+    category_counts = np.bincount(slots, minlength=len(codes) * 2)
+
+    def largest(mask):
+        selected = np.flatnonzero(mask)
+        if len(selected) > LARGEST_LIMIT:
+            # Порог - N-я по величине сумма; равные ему суммы упорядочиваются по id
+            values = cents[selected]
+            threshold = np.partition(values, len(values) - LARGEST_LIMIT)[len(values) - LARGEST_LIMIT]
+            selected = selected[values >= threshold]
+        order = np.lexsort((data[selected, _ID], -cents[selected]))[:LARGEST_LIMIT]
+        return [(int(data[i, _ID]), int(cents[i])) for i in selected[order]]
+
+    return {
+        'income': int(cents[income].sum()),
+        'expense': int(cents[~income].sum()),
+        'income_count': int(income.sum()),
+        'expense_count': int((~income).sum()),
+        'months': [
+            (int(by_month[i * 2 + 1]), int(by_month[i * 2]), int(month_counts[i]))
+            for i in range(months)
+        ],
+        'categories': {
+            (int(code), transaction_type): (int(by_category[i * 2 + flag]),
+                                            int(category_counts[i * 2 + flag]))
+            for i, code in enumerate(codes)
+            for flag, transaction_type in ((1, 'income'), (0, 'expense'))
+            if category_counts[i * 2 + flag]
+        },
+        'largest_income': largest(income),
+        'largest_expense': largest(~income),
+        'peak_day': (first_day + peak_day, int(round(by_day[peak_day])))
+        if peak_day is not None else None,
+    }
+
+
+def _aggregate_python(rows, first_day, days, first_month, months):
+    """Построчный расчет итогов (без NumPy); результат как у _aggregate_numpy."""
+    totals = {True: 0, False: 0}
+    counts = {True: 0, False: 0}
+    by_month = [[0, 0, 0] for _ in range(months)]
+    by_category = defaultdict(lambda: [0, 0])
+    largest = {True: [], False: []}
+    by_day = defaultdict(int)
+
+    for row in rows:
+        cents, is_income = row[_CENTS], bool(row[_INCOME])
+        totals[is_income] += cents
+        counts[is_income] += 1
+
+        month = by_month[row[_MONTH] - first_month]
+        month[0 if is_income else 1] += cents
+        month[2] += 1
+
+        category = by_category[(row[_CATEGORY], 'income' if is_income else 'expense')]
+        category[0] += cents
+        category[1] += 1
+
+        largest[is_income].append((cents, -row[_ID]))
+        if not is_income:
+            by_day[row[_DAY]] += cents
+
+    def top(items):
+        return [(-row_id, cents) for cents, row_id in heapq.nlargest(LARGEST_LIMIT, items)]
+
+    return {
+        'income': totals[True],
+        'expense': totals[False],
+        'income_count': counts[True],
+        'expense_count': counts[False],
+        'months': [tuple(month) for month in by_month],
+        'categories': {key: tuple(value) for key, value in by_category.items()},
+        'largest_income': top(largest[True]),
+        'largest_expense': top(largest[False]),
+        'peak_day': min(by_day.items(), key=lambda item: (-item[1], item[0]), default=None),
+    }
+
+
+def _aggregate(rows, first_day, days, first_month, months, vectorized):
+    """Итоги по строкам векторно или построчно."""
+    aggregate = _aggregate_numpy if vectorized and rows else _aggregate_python
+    return aggregate(rows, first_day, days, first_month, months)
+
+
+def _merge(parts, first_month, months):
+    """
+    Склейка итогов отдельных месяцев в итоги периода.
+
+    Args:
+        parts (dict): Номер месяца -> итоги месяца (months=1)
+        first_month (int): Номер первого месяца периода
+        months (int): Количество месяцев периода
+
+    Returns:
+        dict: Итоги в формате _aggregate_numpy
+    """
+    result = {'income': 0, 'expense': 0, 'income_count': 0, 'expense_count': 0}
+    by_month = [(0, 0, 0)] * months
+    categories = defaultdict(lambda: (0, 0))
+    largest = {'largest_income': [], 'largest_expense': []}
+    peaks = []
+
+    for month, part in parts.items():
+        for key in result:
+            result[key] += part[key]
+        by_month[month - first_month] = part['months'][0]
+        for key, (total, count) in part['categories'].items():
+            previous_total, previous_count = categories[key]
+            categories[key] = (previous_total + total, previous_count + count)
+        for key, items in largest.items():
+            items.extend(part[key])
+        if part['peak_day']:
+            peaks.append(part['peak_day'])
+
+    # Порядок при равенстве тот же, что и при расчете за весь период
+    result.update({
+        'months': by_month,
+        'categories': dict(categories),
+        'peak_day': min(peaks, key=lambda item: (-item[1], item[0]), default=None),
+    })
+    for key, items in largest.items():
+        result[key] = heapq.nsmallest(LARGEST_LIMIT, items, key=lambda item: (-item[1], item[0]))
+    return result
+
+
+def _dump_snapshot(part):
+    """Итоги месяца в JSON."""
+    return json.dumps({
+        **part,
+        'categories': [
+            [category_id, transaction_type, total, count]
+            for (category_id, transaction_type), (total, count) in part['categories'].items()
+        ],
+    })
+
+
+def _load_snapshot(data):
+    """Итоги месяца из JSON."""
+    part = json.loads(data)
+    part['months'] = [tuple(month) for month in part['months']]
+    part['categories'] = {
+        (category_id, transaction_type): (total, count)
+        for category_id, transaction_type, total, count in part['categories']
+    }
+    part['largest_income'] = [tuple(item) for item in part['largest_income']]
+    part['largest_expense'] = [tuple(item) for item in part['largest_expense']]
+    part['peak_day'] = tuple(part['peak_day']) if part['peak_day'] else None
+    return part
+
+
+def _grace_days():
+    """Льготный период закрытия месяца из конфигурации."""
+    if has_app_context():
+        return current_app.config.get('REPORT_SNAPSHOT_GRACE_DAYS', SNAPSHOT_GRACE_DAYS)
+    return SNAPSHOT_GRACE_DAYS
+
+
+def closed_months(start, end, today=None, grace_days=None):
+    """
+    Закрытые месяцы, целиком входящие в период.
+
+    Args:
+        start (date): Начало периода включительно
+        end (date): Конец периода включительно
+        today (date): Текущая дата (для тестов)
+        grace_days (int): Льготный период; по умолчанию из конфигурации
+
+    Returns:
+        range: Порядковые номера месяцев
+    """
+    today = today or date.today()
+    grace = timedelta(days=_grace_days() if grace_days is None else grace_days)
+
+    first = _month_index(start) + (start.day != 1)
+    last = _month_index(end)
+    if end != _month_start(last + 1) - timedelta(days=1):
+        last -= 1
+    while last >= first and _month_start(last + 1) + grace > today:
+        last -= 1
+    return range(first, last + 1)
+
+
+def _uncovered_ranges(start, end, covered):
+    """Непрерывные отрезки периода вне месяцев со снимками."""
+    ranges = []
+    for month in range(_month_index(start), _month_index(end) + 1):
+        if month in covered:
+            continue
+        low = max(start, _month_start(month))
+        high = min(end, _month_start(month + 1) - timedelta(days=1))
+        if ranges and ranges[-1][1] + timedelta(days=1) == low:
+            ranges[-1] = (ranges[-1][0], high)
+        else:
+            ranges.append((low, high))
+    return ranges
+
+
+def _store_snapshots(user_id, version, parts):
+    """
+    Сохранение снимков закрытых месяцев.
+
+    Снимок не сохраняется, если данные пользователя изменились после
+    чтения версии version: запись задним числом могла попасть в месяц.
+
+    Args:
+        user_id (int): ID пользователя
+        version (int): Версия данных, из которой рассчитаны снимки
+        parts (dict): Номер месяца -> итоги месяца
+    """
+    if not parts or not has_app_context():
+        return
+
+    # database импортирует этот модуль для миграции
+    from database import write_transaction
+
+    try:
+        with write_transaction() as db:
+            db.executemany(_STORE_SNAPSHOT_QUERY, [
+                (user_id, _month_label(month), _dump_snapshot(part), user_id, version)
+                for month, part in parts.items()
+            ])
+    except sqlite3.Error as e:
+        current_app.logger.warning(f'Report snapshot error: {e}')
+
+
+def _snapshot_result(db, user_id, start, end, vectorized, today):
+    """Итоги периода из снимков закрытых месяцев и расчета остальных."""
+    closed = closed_months(start, end, today)
+
+    # Версия, снимки и строки читаются из одного снимка базы данных
+    owned = not db.in_transaction
+    if owned:
+        db.execute('BEGIN')
+    try:
+        version = get_data_version(db, user_id)
+        parts = {}
+        if closed:
+            for row in db.execute(
+                '''SELECT month, data FROM report_snapshots
+                   WHERE user_id = ? AND month BETWEEN ? AND ?''',
+                (user_id, _month_label(closed[0]), _month_label(closed[-1]))
+            ):
+                year, month = row['month'].split('-')
+                parts[int(year) * 12 + int(month) - 1] = _load_snapshot(row['data'])
+
+        rows = []
+        for low, high in _uncovered_ranges(start, end, parts):
+            rows.extend(_fetch_columns(db, user_id, low, high))
+    finally:
+        if owned:
+            db.commit()
+
+    by_month = defaultdict(list)
+    for row in rows:
+        by_month[row[_MONTH]].append(row)
+
+    missing = {}
+    for month in range(_month_index(start), _month_index(end) + 1):
+        if month in parts:
+            continue
+        low = max(start, _month_start(month))
+        high = min(end, _month_start(month + 1) - timedelta(days=1))
+        parts[month] = _aggregate(by_month[month], low.toordinal(), (high - low).days + 1,
+                                  month, 1, vectorized)
+        if month in closed:
+            missing[month] = parts[month]
+
+    _store_snapshots(user_id, version, missing)
+    return _merge(parts, _month_index(start), _month_index(end) - _month_index(start) + 1)
+
+
+def build_report(db, user_id, start_date, end_date, vectorized=None, snapshots=False, today=None):
+    """
+    Расчет отчета за период.
+
+    Args:
+        db (sqlite3.Connection): Соединение с базой данных
+        user_id (int): ID пользователя
+        start_date (date|str): Начало периода включительно
+        end_date (date|str): Конец периода включительно
+        vectorized (bool): Использовать NumPy; по умолчанию - если установлен
+        snapshots (bool): Брать закрытые месяцы из снимков и сохранять недостающие
+        today (date): Текущая дата для определения закрытых месяцев (для тестов)
+
+    Returns:
+        dict: totals, months, categories, largest_income, largest_expense
+            и peak_expense_day
+    """
+    start, end = _to_date(start_date), _to_date(end_date)
+    if vectorized is None:
+        vectorized = np is not None
+
+    first_month = _month_index(start)
+    months = max(_month_index(end) - first_month + 1, 0)
+    days = max((end - start).days + 1, 0)
+
+    if snapshots and months:
+        result = _snapshot_result(db, user_id, start, end, vectorized, today)
+    else:
+        rows = _fetch_columns(db, user_id, start, end)
+        result = _aggregate(rows, start.toordinal(), days, first_month, months, vectorized)
+
+    categories = {
+        row['id']: row
+        for row in db.execute(
+            'SELECT id, name, color FROM categories WHERE user_id = ?', (user_id,)
+        )
+    }
+    largest_ids = [row_id for row_id, _ in result['largest_income'] + result['largest_expense']]
+    details = {
+        row['id']: row
+        for row in db.execute(
+            f'''SELECT id, date, description, category_id FROM transactions
+                WHERE id IN ({', '.join('?' * len(largest_ids))})''',
+            largest_ids
+        )
+    } if largest_ids else {}
+
+    income, expense = result['income'], result['expense']
+
+    def average(total, count):
+        return round(total / count / 100, 2) if count else 0.0
+
+    def transaction(row_id, cents):
+        row = details[row_id]
+        return {
+            'id': row_id,
+            'date': str(row['date']),
+            'amount': cents / 100,
+            'description': row['description'],
+            'category_id': row['category_id'],
+        }
+
+    report_categories = []
+    for (category_id, transaction_type), (total, count) in result['categories'].items():
+        category = categories.get(category_id)
+        type_total = income if transaction_type == 'income' else expense
+        report_categories.append({
+            'category_id': category_id or None,
+            'name': category['name'] if category else None,
+            'color': category['color'] if category else None,
+            'type': transaction_type,
+            'total': total / 100,
+            'count': count,
+            'average': average(total, count),
+            'share': round(total / type_total, 4) if type_total else 0.0,
+        })
+    report_categories.sort(key=lambda item: (item['type'], -item['total'], item['name'] or '',
+                                          item['category_id'] or 0))
+
+    return {
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'totals': {
+            'income': income / 100,
+            'expense': expense / 100,
+            'balance': (income - expense) / 100,
+            'income_count': result['income_count'],
+            'expense_count': result['expense_count'],
+            'average_income': average(income, result['income_count']),
+            'average_expense': average(expense, result['expense_count']),
+            'monthly_average_income': average(income, months),
+            'monthly_average_expense': average(expense, months),
+            'daily_average_expense': average(expense, days),
+        },
+        'months': [
+            {
+                'month': _month_label(first_month + i),
+                'income': month_income / 100,
+                'expense': month_expense / 100,
+                'balance': (month_income - month_expense) / 100,
+                'count': count,
+            }
+            for i, (month_income, month_expense, count) in enumerate(result['months'])
+        ],
+        'categories': report_categories,
+        'largest_income': [transaction(*item) for item in result['largest_income'] if item[0] in details],
+        'largest_expense': [transaction(*item) for item in result['largest_expense'] if item[0] in details],
+        'peak_expense_day': {
+            'date': date.fromordinal(result['peak_day'][0]).isoformat(),
+            'expense': result['peak_day'][1] / 100,
+        } if result['peak_day'] else None,
+    }
+
+
+@cached('monthly_report')
+def generate_monthly_report(user_id, start_date, end_date, db):
+    """
+    Отчет пользователя за период для страницы отчетов.
+
+    Args:
+        user_id (int): ID пользователя
+        start_date (date|str): Начало периода
+        end_date (date|str): Конец периода
+        db (sqlite3.Connection): Соединение с базой данных
+
+    Returns:
+        dict: Отчет (см. build_report)
+    """
+    return build_report(db, user_id, start_date, end_date, snapshots=True)
@@ -0,0 +1,128 @@
+"""
+Полнотекстовый поиск по описаниям транзакций (SQLite FTS5).
+
+Индекс transactions_fts хранит только токены описаний и ссылается
+на transactions по rowid; синхронизацию выполняют триггеры,
+созданные миграцией.
+"""
+
+import re
+
+
+# Слова поискового запроса (буквы и цифры любого алфавита)
+TOKEN_REGEX = re.compile(r'\w+', re.UNICODE)
+
+# Ограничение длины запроса в словах
+MAX_QUERY_TOKENS = 10
+
+# Внешний контент: индекс хранит только токены, текст берется из transactions
+FTS_SCHEMA = (
+    '''
+    CREATE VIRTUAL TABLE transactions_fts USING fts5(
+        description,
+        content = 'transactions',
+        content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    ''',
+    '''
+    CREATE TRIGGER transactions_fts_insert AFTER INSERT ON transactions BEGIN
+        INSERT INTO transactions_fts (rowid, description)
+        VALUES (new.id, new.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER transactions_fts_delete AFTER DELETE ON transactions BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, description)
+        VALUES ('delete', old.id, old.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER transactions_fts_update AFTER UPDATE OF description ON transactions BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, description)
+        VALUES ('delete', old.id, old.description);
+        INSERT INTO transactions_fts (rowid, description)
+        VALUES (new.id, new.description);
+    END
+    ''',
+)
+
+
+def build_match_query(text):
+    """
+    Преобразование пользовательского ввода в запрос FTS5.
+
+    Каждое слово ищется по префиксу, все слова должны присутствовать.
+    Служебный синтаксис FTS5 во вводе экранируется.
+
+    Args:
+        text (str): Строка поиска
+
+    Returns:
+        str: Выражение MATCH или None, если слов нет
+    """
+    if not text:
+        return None
+
+    tokens = TOKEN_REGEX.findall(text)[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return None
+
+    return ' '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+
+def search_transactions(db, user_id, text, limit=20):
+    """
+    Поиск транзакций пользователя по описанию с ранжированием.
+
+    Args:
+        db (sqlite3.Connection): Соединение с базой данных
+        user_id (int): ID пользователя
+        text (str): Строка поиска
+        limit (int): Максимальное количество результатов
+
+    Returns:
+        list: Строки транзакций, самые релевантные первыми
+    """
+    match = build_match_query(text)
+    if match is None:
+        return []
+
+    return db.execute('''
+        SELECT t.*, c.name as category_name, c.color as category_color,
+               bm25(transactions_fts) as score
+        FROM transactions_fts
+        JOIN transactions t ON t.id = transactions_fts.rowid
+        LEFT JOIN categories c ON t.category_id = c.id
+        WHERE transactions_fts MATCH ? AND t.user_id = ?
+        ORDER BY score, t.date DESC
+        LIMIT ?
+    ''', (match, user_id, limit)).fetchall()
+
+
+def create_fts_index(db):
+    """
+    Создание индекса FTS5 и заполнение его существующими транзакциями.
+
+    Используется миграцией. Индекс пересоздается с нуля, поэтому
+    прерванное заполнение можно безопасно запустить повторно.
+    Заполнение - одно выражение INSERT ... SELECT в транзакции миграции:
+    внешний индекс FTS5 нельзя согласованно обновлять триггерами, пока
+    часть строк еще не проиндексирована, а деление на пачки внутри одной
+    транзакции не сократило бы время блокировки записи.
+
+    Args:
+        db (sqlite3.Connection): Соединение писателя в открытой транзакции
+    """
+    db.execute('DROP TABLE IF EXISTS transactions_fts')
+    for trigger in ('insert', 'delete', 'update'):
+        db.execute(f'DROP TRIGGER IF EXISTS transactions_fts_{trigger}')
+
+    for statement in FTS_SCHEMA:
+        db.execute(statement)
+
+    db.execute('''
+        INSERT INTO transactions_fts (rowid, description)
+        SELECT id, description FROM transactions
+    ''')
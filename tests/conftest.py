@@ -31,6 +31,9 @@ def app():
         'SECRET_KEY': 'test-secret-key',
     })
     
+    # Сбрасываем ограничения частоты входа от предыдущих тестов
+    flask_app.extensions['ratelimit'].reset()
+    
     # Создаем базу данных и таблицы
     with flask_app.app_context():
         init_db()
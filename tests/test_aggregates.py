@@ -0,0 +1,140 @@
+"""
+Тестирование помесячных агрегатов транзакций.
+"""
+
+import sqlite3
+from datetime import date
+
+import pytest
+
+from aggregates import (
+    MONTHLY_TOTALS_SCHEMA, calculate_statistics, category_statistics,
+    rebuild_monthly_totals, verify_monthly_totals
+)
+
+
+@pytest.fixture
+def ledger():
+    """База в памяти с триггерами агрегатов."""
+    db = sqlite3.connect(':memory:')
+    db.row_factory = sqlite3.Row
+    db.executescript('''
+        CREATE TABLE categories (
+            id INTEGER PRIMARY KEY, name TEXT, type TEXT, user_id INTEGER,
+            color TEXT, budget_limit REAL
+        );
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, amount REAL, description TEXT,
+            type TEXT, date DATE, user_id INTEGER, category_id INTEGER
+        );
+        INSERT INTO categories VALUES
+            (1, 'Еда', 'expense', 1, '#ff0000', 500),
+            (2, 'Транспорт', 'expense', 1, '#00ff00', NULL),
+            (3, 'Подарки', 'both', 1, '#0000ff', 100);
+    ''')
+    for statement in MONTHLY_TOTALS_SCHEMA:
+        db.execute(statement)
+    yield db
+    db.close()
+
+
+def add(db, amount, type_, day, category_id=1, user_id=1):
+    """Добавление транзакции."""
+    return db.execute(
+        'INSERT INTO transactions (amount, type, date, user_id, category_id) VALUES (?, ?, ?, ?, ?)',
+        (amount, type_, day, user_id, category_id)
+    ).lastrowid
+
+
+class TestMonthlyTotals:
+    """Тесты поддержки агрегатов триггерами."""
+
+    def test_insert_update_delete_stay_consistent(self, ledger):
+        """Тест согласованности агрегатов после всех видов изменений."""
+        first = add(ledger, 10.10, 'expense', '2024-01-05')
+        add(ledger, 0.20, 'expense', '2024-01-06')
+        second = add(ledger, 1000, 'income', '2024-02-01', category_id=None)
+
+        ledger.execute("UPDATE transactions SET date = '2024-03-01', category_id = 2 WHERE id = ?", (first,))
+        ledger.execute('UPDATE transactions SET amount = 999.99 WHERE id = ?', (second,))
+        ledger.execute('DELETE FROM transactions WHERE category_id = 2')
+
+        assert verify_monthly_totals(ledger) == []
+        rows = ledger.execute('SELECT * FROM monthly_totals ORDER BY month').fetchall()
+        assert [(row['month'], row['total_cents'], row['count']) for row in rows] == [
+            ('2024-01', 20, 1), ('2024-02', 99999, 1)
+        ]
+
+    def test_verify_detects_and_rebuild_fixes_drift(self, ledger):
+        """Тест обнаружения расхождения и пересчета."""
+        add(ledger, 5, 'expense', '2024-01-05')
+        add(ledger, 7, 'expense', '2024-01-05', user_id=2)
+        ledger.execute('UPDATE monthly_totals SET total_cents = 1 WHERE user_id = 1')
+
+        assert verify_monthly_totals(ledger) == [(1, '2024-01', 1, 'expense')]
+        assert verify_monthly_totals(ledger, user_id=2) == []
+
+        rebuild_monthly_totals(ledger, user_id=1)
+        assert verify_monthly_totals(ledger) == []
+
+
+class TestStatistics:
+    """Тесты статистики по агрегатам."""
+
+    def test_calculate_statistics(self, ledger):
+        """Тест итогов за все время и текущий месяц."""
+        add(ledger, 100, 'income', '2024-05-01', category_id=None)
+        add(ledger, 30.5, 'expense', '2024-05-02')
+        add(ledger, 10, 'expense', '2024-05-03', category_id=2)
+        add(ledger, 50, 'expense', '2024-04-30')
+        add(ledger, 999, 'income', '2024-05-01', user_id=2)
+
+        stats = calculate_statistics(1, ledger, today=date(2024, 5, 15))
+
+        assert stats['total_income'] == 100
+        assert stats['total_expense'] == 90.5
+        assert stats['balance'] == 9.5
+        assert stats['transactions_count'] == 4
+        assert stats['month_expense'] == 40.5
+        assert stats['month_transactions_count'] == 3
+        assert [c['name'] for c in stats['top_expense_categories']] == ['Еда', 'Транспорт']
+
+    def test_empty_user(self, ledger):
+        """Тест статистики пользователя без транзакций."""
+        stats = calculate_statistics(42, ledger)
+        assert stats['balance'] == 0
+        assert stats['transactions_count'] == 0
+
+
+class TestCategoryStatistics:
+    """Тесты статистики категорий одним запросом."""
+
+    def test_totals_and_budget_usage(self, ledger):
+        """Тест итогов категорий и доли лимита текущего месяца."""
+        add(ledger, 100, 'expense', '2024-05-02')
+        add(ledger, 50, 'expense', '2024-04-02')
+        add(ledger, 20, 'income', '2024-05-03', category_id=2)
+        add(ledger, 70, 'expense', '2024-05-03', category_id=1, user_id=2)
+
+        categories = category_statistics(1, ledger, today=date(2024, 5, 15))
+        by_name = {category['name']: category for category in categories}
+
+        assert [category['name'] for category in categories] == ['Подарки', 'Еда', 'Транспорт']
+        assert by_name['Еда']['count'] == 2
+        assert by_name['Еда']['total_expense'] == 150
+        assert by_name['Еда']['month_expense'] == 100
+        assert by_name['Еда']['budget_used'] == 0.2
+        assert by_name['Транспорт']['total_income'] == 20
+        assert by_name['Транспорт']['budget_used'] is None
+        assert by_name['Подарки']['count'] == 0
+        assert by_name['Подарки']['budget_used'] == 0
+
+
+class TestRebuildCommand:
+    """Тесты CLI команды пересчета агрегатов."""
+
+    def test_rebuild_and_verify(self, runner, db_session):
+        """Тест пересчета и проверки через CLI."""
+        result = runner.invoke(args=['db', 'rebuild-totals'])
+        assert result.exit_code == 0
+        assert 'совпадают' in result.output
@@ -0,0 +1,125 @@
+"""
+Тестирование кеша результатов.
+"""
+
+import time
+
+import pytest
+
+from aggregates import calculate_statistics
+from cache import MISSING, Cache, MemoryBackend, SQLiteBackend, cached
+from database import get_db, write_transaction
+
+
+class TestMemoryBackend:
+    """Тесты кеша в памяти процесса."""
+
+    def test_lru_eviction(self):
+        """Тест вытеснения давно неиспользуемой записи."""
+        backend = MemoryBackend(max_entries=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)
+
+        assert backend.get('b') is MISSING
+        assert backend.get('a') == 1
+        assert backend.evictions == 1
+
+    def test_discard_tag(self):
+        """Тест удаления записей пользователя по метке."""
+        backend = MemoryBackend()
+        backend.set('a', 1, tag=1)
+        backend.set('b', 2, tag=1)
+        backend.set('c', 3, tag=2)
+        backend.discard_tag(1)
+
+        assert backend.get('a') is MISSING and backend.get('b') is MISSING
+        assert backend.get('c') == 3
+
+    def test_ttl(self):
+        """Тест истечения срока жизни записи."""
+        backend = MemoryBackend()
+        backend.set('a', None, ttl=0)
+
+        assert backend.get('a') is MISSING
+
+
+class TestSQLiteBackend:
+    """Тесты общего кеша в файле SQLite."""
+
+    def test_shared_between_instances(self, tmp_path):
+        """Тест видимости записи из другого экземпляра (воркера)."""
+        path = str(tmp_path / 'cache.db')
+        SQLiteBackend(path).set('key', {'total': 1.5})
+
+        assert SQLiteBackend(path).get('key') == {'total': 1.5}
+
+    def test_prune(self, tmp_path):
+        """Тест вытеснения записей, прочитанных раньше других."""
+        backend = SQLiteBackend(str(tmp_path / 'cache.db'), max_entries=2, prune_interval=3)
+        backend.set('a', 1)
+        time.sleep(0.01)
+        backend.set('b', 2)
+        time.sleep(0.01)
+        backend.get('a')
+        backend.set('c', 3)
+
+        assert len(backend) == 2
+        assert backend.get('b') is MISSING
+        assert backend.evictions == 1
+
+
+class TestCachedDecorator:
+    """Тесты декоратора кеширования."""
+
+    @pytest.fixture
+    def cache(self, app):
+        """Кеш приложения в памяти на время теста."""
+        previous = app.extensions['cache']
+        app.extensions['cache'] = Cache(MemoryBackend())
+        yield app.extensions['cache']
+        app.extensions['cache'] = previous
+
+    def test_hit_until_write(self, app, db_session, cache):
+        """Тест попадания до записи и нового ключа после нее."""
+        user_id = db_session.execute('SELECT id FROM users').fetchone()['id']
+        first = calculate_statistics(user_id, get_db())
+        second = calculate_statistics(user_id, get_db())
+
+        assert second == first
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        with write_transaction(user_id) as db:
+            db.execute(
+                '''INSERT INTO transactions (amount, type, date, user_id)
+                   VALUES (5, 'expense', '2024-01-01', ?)''',
+                (user_id,)
+            )
+
+        third = calculate_statistics(user_id, get_db())
+        assert third['transactions_count'] == first['transactions_count'] + 1
+        assert cache.misses == 2
+
+    def test_arguments_in_key(self, app, db_session, cache):
+        """Тест разных ключей для разных аргументов."""
+        calls = []
+
+        @cached('test')
+        def report(user_id, db, period):
+            calls.append(period)
+            return period
+
+        user_id = db_session.execute('SELECT id FROM users').fetchone()['id']
+        for period in ('2024-01', '2024-02', '2024-01'):
+            report(user_id, get_db(), period=period)
+
+        assert calls == ['2024-01', '2024-02']
+
+    def test_without_app_context(self):
+        """Тест прямого вызова вне контекста приложения."""
+        @cached('test')
+        def report(user_id, db):
+            return user_id
+
+        assert report(1, None) == 1
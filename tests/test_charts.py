@@ -0,0 +1,94 @@
+"""
+Тестирование группировки транзакций для графиков.
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from charts import bucket_label, chart_series, count_buckets, iter_buckets
+from database import get_db, write_transaction
+
+
+@pytest.fixture
+def chart_user(app, db_session):
+    """Пользователь с транзакциями на границах недель, кварталов и лет."""
+    user_id = db_session.execute('SELECT id FROM users').fetchone()['id']
+    with write_transaction(user_id) as db:
+        db.execute('DELETE FROM transactions WHERE user_id = ?', (user_id,))
+        db.executemany(
+            'INSERT INTO transactions (amount, type, date, user_id) VALUES (?, ?, ?, ?)',
+            [(10, 'expense', '2023-12-31', user_id),
+             (20, 'expense', '2024-01-01', user_id),
+             (100, 'income', '2024-01-07', user_id),
+             (5.5, 'expense', '2024-04-01', user_id)]
+        )
+    return user_id
+
+
+class TestBuckets:
+    """Тесты вычисления интервалов."""
+
+    def test_iso_week_label(self):
+        """Тест ISO недели на границе года."""
+        assert bucket_label(date(2024, 12, 30), 'week') == '2025-W01'
+        assert bucket_label(date(2023, 1, 2), 'week') == '2023-W01'
+
+    @pytest.mark.parametrize('bucket,expected', [
+        ('day', 61), ('week', 10), ('month', 3), ('quarter', 2), ('year', 2),
+    ])
+    def test_count_matches_iteration(self, bucket, expected):
+        """Тест совпадения числа интервалов с перебором."""
+        start, end = date(2023, 12, 15), date(2024, 2, 13)
+
+        assert len(list(iter_buckets(start, end, bucket))) == expected
+        assert count_buckets(start, end, bucket) == expected
+
+
+class TestChartSeries:
+    """Тесты рядов графика."""
+
+    def test_gaps_filled(self, app, chart_user):
+        """Тест заполнения пустых интервалов нулями."""
+        series = chart_series(get_db(), chart_user, date(2023, 12, 31), date(2024, 1, 3))
+
+        assert [point['period'] for point in series] == [
+            '2023-12-31', '2024-01-01', '2024-01-02', '2024-01-03'
+        ]
+        assert [point['expense'] for point in series] == [10, 20, 0, 0]
+
+    def test_week(self, app, chart_user):
+        """Тест группировки по ISO неделям."""
+        series = chart_series(get_db(), chart_user, date(2023, 12, 25), date(2024, 1, 14), 'week')
+
+        assert [(p['period'], p['income'], p['expense']) for p in series] == [
+            ('2023-W52', 0, 10), ('2024-W01', 100, 20), ('2024-W02', 0, 0)
+        ]
+
+    def test_monthly_aggregates_match_range_scan(self, app, chart_user):
+        """Тест одинаковых итогов по агрегатам и по транзакциям."""
+        whole = chart_series(get_db(), chart_user, date(2023, 1, 1), date(2024, 12, 31), 'quarter')
+        partial = chart_series(get_db(), chart_user, date(2023, 1, 2), date(2024, 12, 30), 'quarter')
+
+        assert whole == partial
+        assert len(whole) == 8
+        assert whole[3]['expense'] == 10 and whole[4]['expense'] == 20
+        assert whole[5]['expense'] == 5.5
+
+    def test_invalid_period(self, app, chart_user):
+        """Тест ошибок для неверных параметров."""
+        with pytest.raises(ValueError):
+            chart_series(get_db(), chart_user, date(2024, 2, 1), date(2024, 1, 1))
+        with pytest.raises(ValueError):
+            chart_series(get_db(), chart_user, date(2024, 1, 1), date(2024, 2, 1), 'hour')
+        with pytest.raises(ValueError):
+            chart_series(get_db(), chart_user, date.max - timedelta(days=3), date.max)
+
+    def test_out_of_range_api(self, client, auth, chart_user, monkeypatch):
+        """Тест ответа 400 для периода до последней представимой даты."""
+        monkeypatch.setattr('main.render_template', lambda template, **context: template)
+        auth.login()
+        response = client.get('/api/transactions/chart?start=9999-12-01&end=9999-12-31')
+
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
@@ -0,0 +1,310 @@
+"""
+Тестирование слоя базы данных: пул соединений и очередь записи.
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+from database import (
+    MIGRATIONS, ConnectionPool, PoolTimeoutError, Writer, create_unique_user_indexes,
+    get_db, get_pool_stats, get_schema_version, migrate, unique_violation, write_transaction
+)
+
+
+@pytest.fixture
+def pool(tmp_path):
+    """Пул соединений поверх временного файла БД."""
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), max_size=2, timeout=0.05)
+    yield pool
+    pool.close()
+
+
+class TestConnectionPool:
+    """Тесты пула соединений."""
+
+    def test_connection_reused(self, pool):
+        """Тест повторного использования возвращенного соединения."""
+        first = pool.acquire()
+        pool.release(first)
+        second = pool.acquire()
+
+        assert second is first
+        assert pool.stats()['created'] == 1
+
+    def test_pragmas_applied(self, pool):
+        """Тест применения PRAGMA при создании соединения."""
+        connection = pool.acquire()
+
+        assert connection.execute('PRAGMA foreign_keys').fetchone()[0] == 1
+        pool.release(connection)
+
+    def test_pool_is_bounded(self, pool):
+        """Тест ограничения размера пула и таймаута ожидания."""
+        connections = [pool.acquire(), pool.acquire()]
+
+        with pytest.raises(PoolTimeoutError):
+            pool.acquire()
+
+        stats = pool.stats()
+        assert stats['checked_out'] == 2
+        assert stats['waits'] == 1
+        assert stats['wait_time'] > 0
+
+        for connection in connections:
+            pool.release(connection)
+
+    def test_waiter_gets_released_connection(self, pool):
+        """Тест передачи соединения ожидающему потоку."""
+        pool.timeout = 5
+        held = [pool.acquire(), pool.acquire()]
+        result = {}
+
+        def worker():
+            result['connection'] = pool.acquire()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        pool.release(held[0])
+        thread.join(timeout=5)
+
+        assert result['connection'] is held[0]
+        pool.release(result['connection'])
+        pool.release(held[1])
+
+    def test_release_rolls_back_open_transaction(self, pool):
+        """Тест отката незавершенной транзакции при возврате в пул."""
+        connection = pool.acquire()
+        connection.execute('CREATE TABLE items (value INTEGER)')
+        connection.commit()
+        connection.execute('INSERT INTO items VALUES (1)')
+        pool.release(connection)
+
+        connection = pool.acquire()
+        assert connection.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 0
+        pool.release(connection)
+
+
+class TestRequestConnection:
+    """Тесты соединения, привязанного к контексту приложения."""
+
+    def test_connection_acquired_lazily(self, app):
+        """Тест получения соединения только при первом обращении."""
+        with app.app_context():
+            before = get_pool_stats()['connections']['checked_out']
+
+            db = get_db(readonly=False)
+            assert get_db(readonly=False) is db
+            assert get_pool_stats()['connections']['checked_out'] == before + 1
+
+        with app.app_context():
+            assert get_pool_stats()['connections']['checked_out'] == before
+
+    def test_health_does_not_leak_connections(self, client, app):
+        """Тест возврата соединения в пул после запроса."""
+        # pytest-flask держит контекст приложения на время теста; в отдельном
+        # потоке, как и в сервере, каждый запрос получает свой контекст
+        statuses = []
+
+        def requests():
+            for _ in range(3):
+                statuses.append(client.get('/health').status_code)
+
+        thread = threading.Thread(target=requests)
+        thread.start()
+        thread.join()
+        assert statuses == [200, 200, 200]
+
+        with app.app_context():
+            stats = get_pool_stats()
+            assert stats['readers']['checked_out'] == 0
+            assert stats['connections']['checked_out'] == 0
+
+    def test_get_requests_use_readonly_connection(self, app):
+        """Тест соединения только для чтения в GET запросах."""
+        with app.test_request_context('/dashboard', method='GET'):
+            app.preprocess_request()
+            db = get_db()
+            with pytest.raises(sqlite3.OperationalError):
+                db.execute("INSERT INTO users (username, email, password_hash) VALUES ('a', 'b', 'c')")
+
+        with app.test_request_context('/transaction/add', method='POST'):
+            app.preprocess_request()
+            assert get_db().execute('PRAGMA query_only').fetchone()[0] == 0
+
+
+class TestWriter:
+    """Тесты единственного писателя и режима WAL."""
+
+    def test_init_db_enables_wal(self, app):
+        """Тест перевода базы данных в режим WAL."""
+        with app.app_context():
+            mode = get_db().execute('PRAGMA journal_mode').fetchone()[0]
+
+        assert mode == 'wal'
+
+    def test_write_transaction_commits(self, app):
+        """Тест фиксации изменений и видимости их читателям."""
+        with app.app_context():
+            with write_transaction() as db:
+                db.execute(
+                    "INSERT INTO users (username, email, password_hash) VALUES ('w', 'w@example.com', 'x')"
+                )
+
+            count = get_db(readonly=True).execute(
+                "SELECT COUNT(*) FROM users WHERE username = 'w'"
+            ).fetchone()[0]
+            assert count == 1
+            assert get_pool_stats()['writer']['transactions'] >= 1
+
+    def test_write_transaction_rolls_back_on_error(self, app):
+        """Тест отката транзакции при исключении."""
+        with app.app_context():
+            with pytest.raises(RuntimeError):
+                with write_transaction() as db:
+                    db.execute(
+                        "INSERT INTO users (username, email, password_hash) VALUES ('r', 'r@example.com', 'x')"
+                    )
+                    raise RuntimeError('boom')
+
+            count = get_db().execute(
+                "SELECT COUNT(*) FROM users WHERE username = 'r'"
+            ).fetchone()[0]
+            assert count == 0
+
+    def test_busy_database_retried_with_backoff(self, tmp_path):
+        """Тест повторов BEGIN IMMEDIATE при блокировке другим процессом."""
+        path = str(tmp_path / 'busy.db')
+        writer = Writer(path, busy_timeout=0, retries=2, backoff=0.001)
+
+        blocker = sqlite3.connect(path)
+        blocker.execute('BEGIN IMMEDIATE')
+
+        with pytest.raises(sqlite3.OperationalError):
+            with writer.transaction():
+                pass
+
+        blocker.rollback()
+        with writer.transaction() as db:
+            db.execute('CREATE TABLE items (value INTEGER)')
+
+        stats = writer.stats()
+        assert stats['busy_retries'] == 2
+        assert stats['busy_failures'] == 1
+        assert stats['transactions'] == 1
+        blocker.close()
+        writer.close()
+
+    def test_writers_are_serialized(self, tmp_path):
+        """Тест очереди писателей из разных потоков."""
+        path = str(tmp_path / 'queue.db')
+        writer = Writer(path)
+        with writer.transaction() as db:
+            db.execute('CREATE TABLE items (value INTEGER)')
+
+        def worker(value):
+            for _ in range(20):
+                with writer.transaction() as db:
+                    db.execute('INSERT INTO items VALUES (?)', (value,))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with writer.connection() as db:
+            assert db.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 80
+        assert writer.stats()['busy_failures'] == 0
+        writer.close()
+
+
+class TestMigrations:
+    """Тесты версионных миграций схемы."""
+
+    def test_init_db_applies_all_migrations(self, app):
+        """Тест применения миграций при инициализации."""
+        with app.app_context():
+            db = get_db()
+            assert get_schema_version(db) == MIGRATIONS[-1].version
+            assert db.execute('PRAGMA user_version').fetchone()[0] == MIGRATIONS[-1].version
+
+    def test_migrate_is_idempotent(self, app):
+        """Тест повторного запуска миграций."""
+        with app.app_context():
+            assert migrate() == []
+
+    def test_transaction_list_uses_index(self, app):
+        """Тест использования индекса лентой транзакций."""
+        with app.app_context():
+            plan = get_db().execute('''
+                EXPLAIN QUERY PLAN
+                SELECT * FROM transactions t
+                WHERE t.user_id = ?
+                ORDER BY t.date DESC, t.created_at DESC, t.id DESC
+            ''', (1,)).fetchall()
+
+        details = ' '.join(row['detail'] for row in plan)
+        assert 'idx_transactions_user_seek' in details
+        assert 'TEMP B-TREE' not in details
+
+    def test_category_stats_use_covering_index(self, app):
+        """Тест покрывающего индекса для статистики категорий."""
+        with app.app_context():
+            plan = get_db().execute('''
+                EXPLAIN QUERY PLAN
+                SELECT COUNT(*), SUM(amount) FROM transactions
+                WHERE category_id = ? AND user_id = ?
+            ''', (1, 1)).fetchall()
+
+        assert 'COVERING INDEX idx_transactions_category_user' in plan[0]['detail']
+
+    def test_upgrade_command(self, runner):
+        """Тест CLI команды обновления схемы."""
+        result = runner.invoke(args=['db', 'upgrade'])
+        assert result.exit_code == 0
+        assert 'актуальна' in result.output
+
+        result = runner.invoke(args=['db', 'current'])
+        assert result.output.strip() == str(MIGRATIONS[-1].version)
+
+
+class TestUniqueUsers:
+    """Тесты уникальности email и имени пользователя."""
+
+    def test_violation_column(self, app, db_session):
+        """Тест определения колонки по нарушению UNIQUE."""
+        with pytest.raises(sqlite3.IntegrityError) as error:
+            with write_transaction() as db:
+                db.execute(
+                    "INSERT INTO users (username, email, password_hash) VALUES ('other', ?, 'x')",
+                    ('test@example.com',)
+                )
+
+        assert unique_violation(error.value) == 'users.email'
+        assert unique_violation(sqlite3.IntegrityError('NOT NULL constraint failed: users.email')) \
+            is None
+
+    def test_duplicates_stop_migration(self):
+        """Тест остановки миграции при существующих дубликатах."""
+        db = sqlite3.connect(':memory:')
+        db.execute('CREATE TABLE users (username TEXT, email TEXT)')
+        db.executemany('INSERT INTO users VALUES (?, ?)', [('a', 'x@e'), ('b', 'x@e')])
+
+        with pytest.raises(RuntimeError, match='x@e'):
+            create_unique_user_indexes(db)
+
+    def test_register_duplicate_username(self, client, db_session, monkeypatch):
+        """Тест ошибки формы при занятом имени без предварительных SELECT."""
+        monkeypatch.setattr('main.render_template', lambda template, **context: template)
+        response = client.post('/register', data={
+            'username': 'testuser', 'email': 'new@example.com',
+            'password': 'Str0ng!Passw0rd', 'confirm_password': 'Str0ng!Passw0rd',
+            'agree_terms': 'y'
+        })
+
+        assert response.get_data(as_text=True) == 'auth/register.html'
+        with client.session_transaction() as session:
+            assert session['_flashes'] == [('danger', 'Имя пользователя уже занято')]
+        assert db_session.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 1
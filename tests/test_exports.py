@@ -0,0 +1,94 @@
+"""
+Тестирование потокового экспорта транзакций.
+"""
+
+import csv
+import gzip
+import io
+import sqlite3
+
+import pytest
+
+from database import get_pool
+from exports import CSV_HEADER, gzip_stream, iter_csv
+
+
+LABELS = {'income': 'Доход', 'expense': 'Расход'}
+
+
+@pytest.fixture
+def cursor():
+    """Курсор по 25 транзакциям."""
+    db = sqlite3.connect(':memory:')
+    db.row_factory = sqlite3.Row
+    db.execute('CREATE TABLE t (date TEXT, amount REAL, type TEXT, category TEXT, description TEXT)')
+    db.executemany(
+        'INSERT INTO t VALUES (?, ?, ?, ?, ?)',
+        [('2024-01-%02d' % (i + 1), i, 'income' if i % 2 else 'expense',
+          None if i % 3 else 'Еда', f'строка, {i}') for i in range(25)]
+    )
+    yield db.execute('SELECT * FROM t ORDER BY date')
+    db.close()
+
+
+class TestIterCsv:
+    """Тесты генератора CSV."""
+
+    def test_chunks(self, cursor):
+        """Тест выдачи заголовка и пачек строк."""
+        chunks = list(iter_csv(cursor, LABELS, chunk_size=10))
+
+        assert len(chunks) == 4  # заголовок + 10 + 10 + 5
+        rows = list(csv.reader(io.StringIO(''.join(chunks))))
+        assert rows[0] == CSV_HEADER
+        assert len(rows) == 26
+        assert rows[1] == ['2024-01-01', '0.0', 'Расход', 'Еда', 'строка, 0']
+        assert rows[2][2:4] == ['Доход', '']
+
+    def test_gzip_stream(self, cursor):
+        """Тест сжатия потока в gzip."""
+        plain = ''.join(iter_csv(cursor, LABELS))
+        cursor = cursor.connection.execute('SELECT * FROM t ORDER BY date')
+        compressed = b''.join(gzip_stream(iter_csv(cursor, LABELS)))
+
+        assert gzip.decompress(compressed).decode('utf-8') == plain
+
+
+class TestExportRoute:
+    """Тесты маршрута экспорта."""
+
+    def test_streamed_csv(self, client, auth, sample_transactions):
+        """Тест потокового ответа с CSV."""
+        auth.login()
+        response = client.get('/report/export?format=csv&type=income')
+
+        assert response.is_streamed
+        assert response.mimetype == 'text/csv'
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        assert len(rows) == 3
+
+    def test_gzip_export(self, client, auth, sample_transactions):
+        """Тест сжатого экспорта."""
+        auth.login()
+        response = client.get('/report/export?format=csv&gzip=1')
+
+        assert response.mimetype == 'application/gzip'
+        assert '.csv.gz' in response.headers['Content-Disposition']
+        rows = list(csv.reader(io.StringIO(gzip.decompress(response.data).decode('utf-8'))))
+        assert len(rows) == 7
+
+    def test_stream_holds_own_connection(self, app, client, auth, sample_transactions):
+        """Тест соединения генератора: занято во время чтения и возвращается после."""
+        auth.login()
+        response = client.get('/report/export?format=csv&gzip=1', buffered=False)
+
+        with app.app_context():
+            readers = get_pool(readonly=True)
+            # Запрос завершен, соединение занято только генератором ответа
+            chunks = iter(response.response)
+            next(chunks)
+            assert readers.stats()['checked_out'] == 1
+
+            list(chunks)
+            response.close()
+            assert readers.stats()['checked_out'] == 0
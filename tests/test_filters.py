@@ -0,0 +1,107 @@
+"""
+Тестирование фильтров транзакций и кеша количества.
+"""
+
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from database import get_db, write_transaction
+from filters import CountCache, TransactionFilter, count_cache, count_transactions
+
+
+class TestTransactionFilter:
+    """Тесты компиляции фильтров."""
+
+    def test_empty_filter(self):
+        """Тест пустого фильтра."""
+        transaction_filter = TransactionFilter(category_id='0', transaction_type='all', search='  ')
+
+        assert not transaction_filter
+        assert transaction_filter.compile() == ('', [])
+
+    def test_compile_all_fields(self):
+        """Тест компиляции всех условий."""
+        transaction_filter = TransactionFilter(
+            start_date=date(2024, 1, 1), end_date='2024-01-31', category_id=3,
+            transaction_type='expense', min_amount=Decimal('10'),
+            max_amount='99.5', search='кофе'
+        )
+        sql, params = transaction_filter.compile()
+
+        assert sql.count(' AND ') == 7
+        assert params == ['2024-01-01', '2024-01-31', 3, 'expense', 10.0, 99.5, '"кофе"*']
+
+    def test_equivalent_filters_share_key(self):
+        """Тест одинакового ключа для эквивалентных фильтров."""
+        first = TransactionFilter(start_date=date(2024, 1, 1), min_amount=Decimal('10'))
+        second = TransactionFilter.from_args(MultiDict({
+            'start_date': '2024-01-01', 'min_amount': '10.00', 'type': 'all'
+        }))
+
+        assert first.key() == second.key()
+        assert first == second
+
+    def test_invalid_date_rejected(self):
+        """Тест ошибки для некорректной даты."""
+        with pytest.raises(ValueError):
+            TransactionFilter.from_args(MultiDict({'start_date': 'yesterday'}))
+
+    @pytest.mark.parametrize('amount', ['abc', 'nan', 'Infinity', '1e999999999'])
+    def test_invalid_amount_rejected(self, amount):
+        """Тест ошибки ValueError для некорректной или бесконечной суммы."""
+        with pytest.raises(ValueError):
+            TransactionFilter.from_args(MultiDict({'min_amount': amount}))
+
+    def test_invalid_amount_api(self, client, auth, db_session, monkeypatch):
+        """Тест ответа 400 API списка транзакций на некорректную сумму."""
+        monkeypatch.setattr('main.render_template', lambda template, **context: template)
+        auth.login()
+        response = client.get('/api/transactions?min_amount=abc')
+
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
+
+
+class TestCountCache:
+    """Тесты кеша количества транзакций."""
+
+    def test_stale_value_not_stored(self):
+        """Тест отказа сохранять значение, посчитанное до изменения."""
+        cache = CountCache()
+        generation = cache.generation(1)
+        cache.invalidate(1)
+        cache.set(1, (), 10, generation)
+
+        assert cache.get(1, ()) is None
+
+    def test_eviction(self):
+        """Тест вытеснения давно неиспользуемых пользователей."""
+        cache = CountCache(max_users=2)
+        for user_id in (1, 2, 3):
+            cache.set(user_id, (), user_id, cache.generation(user_id))
+
+        assert cache.get(1, ()) is None
+        assert cache.get(3, ()) == 3
+
+    def test_count_invalidated_by_write(self, app, db_session):
+        """Тест сброса количества после записи транзакции пользователя."""
+        user_id = db_session.execute('SELECT id FROM users').fetchone()['id']
+        transaction_filter = TransactionFilter(transaction_type='expense')
+        count_cache.invalidate(user_id)
+
+        assert count_transactions(get_db(), user_id, transaction_filter) == 1
+        hits = count_cache.hits
+        assert count_transactions(get_db(), user_id, transaction_filter) == 1
+        assert count_cache.hits == hits + 1
+
+        with write_transaction(user_id) as db:
+            db.execute(
+                '''INSERT INTO transactions (amount, type, date, user_id)
+                   VALUES (5, 'expense', '2024-01-01', ?)''',
+                (user_id,)
+            )
+
+        assert count_transactions(get_db(), user_id, transaction_filter) == 2
@@ -0,0 +1,120 @@
+"""
+Тестирование кеша идентичности пользователей.
+"""
+
+import pytest
+from flask import session
+
+from database import write_transaction
+from identity import SESSION_KEY, IdentityCache, forget_identity, load_identity
+from instrumentation import current_query_stats
+
+
+USERS_QUERY = 'SELECT id, username, email, created_at FROM users WHERE id = ?'
+
+
+@pytest.fixture
+def user_id(app, db_session):
+    """ID тестового пользователя при пустом кеше идентичности."""
+    app.extensions['identity'].clear()
+    return db_session.execute('SELECT id FROM users').fetchone()['id']
+
+
+def users_queries():
+    """Количество чтений users в текущем запросе."""
+    return current_query_stats().shapes.get(USERS_QUERY, [0])[0]
+
+
+class TestIdentityCache:
+    """Тесты кеша идентичности."""
+
+    def test_lru_bound(self):
+        """Тест вытеснения давно не использованных пользователей."""
+        cache = IdentityCache(max_entries=2)
+        for user_id in (1, 2):
+            cache.set('db', user_id, (user_id,), cache.generation(user_id))
+        cache.get('db', 1)
+        cache.set('db', 3, (3,), cache.generation(3))
+
+        assert cache.get('db', 1) == (1,)
+        assert cache.get('db', 2) is None
+        assert cache.get('other', 3) is None
+
+    def test_ttl(self, monkeypatch):
+        """Тест истечения записи."""
+        cache = IdentityCache(ttl=10)
+        clock = [100.0]
+        monkeypatch.setattr('identity.time.monotonic', lambda: clock[0])
+        cache.set('db', 1, (1,), cache.generation(1))
+
+        assert cache.get('db', 1) == (1,)
+        clock[0] += 11
+        assert cache.get('db', 1) is None
+
+    def test_stale_read_not_stored(self):
+        """Тест отказа сохранить строку, прочитанную до сброса."""
+        cache = IdentityCache()
+        generation = cache.generation(1)
+        cache.discard(1)
+        cache.set('db', 1, (1,), generation)
+
+        assert cache.get('db', 1) is None
+
+    def test_resets_bounded(self):
+        """Тест ограничения памяти сбросов без сохранения устаревших строк."""
+        cache = IdentityCache(max_entries=2)
+        generation = cache.generation(1)
+        for user_id in range(1, 100):
+            cache.discard(user_id)
+
+        assert len(cache._resets) == 2
+        cache.set('db', 1, (1,), generation)
+        assert cache.get('db', 1) is None
+        cache.set('db', 1, (1,), cache.generation(1))
+        assert cache.get('db', 1) == (1,)
+
+
+class TestLoadIdentity:
+    """Тесты загрузки пользователя для Flask-Login."""
+
+    def test_cached_without_query(self, app, user_id):
+        """Тест повторной загрузки без обращения к базе данных."""
+        with app.test_request_context('/'):
+            app.preprocess_request()
+            assert load_identity(str(user_id)).username == 'testuser'
+            assert load_identity(str(user_id)).email == 'test@example.com'
+            assert users_queries() == 1
+
+    def test_profile_update_invalidates(self, app, user_id):
+        """Тест сброса идентичности после изменения профиля."""
+        with app.test_request_context('/profile'):
+            app.preprocess_request()
+            load_identity(user_id)
+            with write_transaction(user_id) as db:
+                db.execute('UPDATE users SET username = ? WHERE id = ?', ('renamed', user_id))
+            forget_identity(user_id)
+
+            assert load_identity(user_id).username == 'renamed'
+
+    def test_session_snapshot(self, app, user_id, monkeypatch):
+        """Тест снимка в сессии: принимается до смены версии данных."""
+        monkeypatch.setitem(app.config, 'IDENTITY_SESSION_SNAPSHOT', True)
+        with app.test_request_context('/'):
+            app.preprocess_request()
+            load_identity(user_id)
+            snapshot = list(session[SESSION_KEY])
+
+        app.extensions['identity'].clear()
+        with app.test_request_context('/'):
+            app.preprocess_request()
+            session[SESSION_KEY] = snapshot
+            assert load_identity(user_id).username == 'testuser'
+            assert users_queries() == 0
+
+            app.extensions['identity'].clear()
+            with write_transaction(user_id) as db:
+                db.execute("UPDATE users SET email = 'new@example.com' WHERE id = ?", (user_id,))
+
+            assert load_identity(user_id).email == 'new@example.com'
+            assert users_queries() == 1
+
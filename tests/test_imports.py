@@ -0,0 +1,93 @@
+"""
+Тестирование массового импорта транзакций.
+"""
+
+import io
+from datetime import date, timedelta
+
+import pytest
+from wtforms.validators import ValidationError
+
+from database import get_db
+from imports import import_transactions, validate_row
+
+
+CATEGORIES = {'test category': 7}
+
+
+class TestValidateRow:
+    """Тесты проверки строк импорта."""
+
+    def test_bank_statement_row(self):
+        """Тест строки выписки: отрицательная сумма, запятая, дата с точками."""
+        row = {'date': '05.01.2024', 'amount': '-1 234,50',
+               'category': 'Test Category', 'description': ' Кофе '}
+
+        assert validate_row(row, CATEGORIES) == (
+            1234.5, 'Кофе', 'expense', '2024-01-05', 7
+        )
+
+    def test_type_label(self):
+        """Тест типа, заданного подписью из экспорта."""
+        row = {'date': '2024-01-05', 'amount': '100', 'type': 'Доход',
+               'category': 'test category'}
+
+        assert validate_row(row, CATEGORIES)[2] == 'income'
+
+    @pytest.mark.parametrize('row', [
+        {'date': '2024-01-05', 'amount': 'abc', 'category': 'Test Category'},
+        {'date': '2024-01-05', 'amount': 'nan', 'category': 'Test Category'},
+        {'date': '2024-01-05', 'amount': '-sNaN', 'category': 'Test Category'},
+        {'date': '2024-01-05', 'amount': 'Infinity', 'category': 'Test Category'},
+        {'date': '2024-01-05', 'amount': '0', 'category': 'Test Category'},
+        {'date': (date.today() + timedelta(days=2)).isoformat(), 'amount': '1',
+         'category': 'Test Category'},
+        {'date': '2024-01-05', 'amount': '1', 'category': 'Нет такой'},
+        {'date': '2024-01-05', 'amount': '1', 'category': 'Test Category',
+         'description': 'реклама'},
+    ])
+    def test_invalid_rows(self, row):
+        """Тест отклонения строк по правилам формы транзакции."""
+        with pytest.raises(ValidationError):
+            validate_row(row, CATEGORIES)
+
+
+class TestImportTransactions:
+    """Тесты импорта из потока."""
+
+    def test_import_with_errors(self, app, db_session):
+        """Тест вставки корректных строк и отчета об ошибках по пачкам."""
+        user_id = db_session.execute('SELECT id FROM users').fetchone()['id']
+        lines = ['Дата;Сумма;Категория;Описание']
+        lines += [f'2024-02-{day:02d};-{day},00;Test Category;покупка {day}'
+                  for day in range(1, 6)]
+        lines.insert(3, '2024-02-10;1;Неизвестная;ошибка')
+        lines.append('2024-02-11;nan;Test Category;ошибка')
+
+        result = import_transactions(io.StringIO('\n'.join(lines)), user_id, batch_size=2)
+
+        assert (result.total, result.imported, result.failed) == (7, 5, 2)
+        assert result.errors[0]['line'] == 4
+        assert result.errors[1]['line'] == 8
+        count = get_db().execute(
+            "SELECT COUNT(*) FROM transactions WHERE user_id = ? AND date LIKE '2024-02-%'",
+            (user_id,)
+        ).fetchone()[0]
+        assert count == 5
+
+    def test_missing_columns(self, app, db_session):
+        """Тест ошибки при отсутствии обязательных колонок."""
+        with pytest.raises(ValueError):
+            import_transactions(io.StringIO('date,description\n2024-01-01,x\n'), 1)
+
+    def test_cli(self, runner, db_session, tmp_path):
+        """Тест команды flask transactions import."""
+        user_id = db_session.execute('SELECT id FROM users').fetchone()['id']
+        path = tmp_path / 'statement.csv'
+        path.write_text('date,amount,type,category\n2024-03-01,50,expense,Test Category\n',
+                        encoding='utf-8')
+
+        result = runner.invoke(args=['transactions', 'import', str(path),
+                                     '--user-id', str(user_id)])
+
+        assert 'Импортировано: 1 из 1' in result.output
@@ -0,0 +1,68 @@
+"""
+Тестирование учета SQL запросов.
+"""
+
+import logging
+
+from flask import Response
+
+from database import get_db
+from instrumentation import QueryStats, current_query_stats, statement_shape
+
+
+class TestStatementShape:
+    """Тесты нормализации выражений."""
+
+    def test_literals_and_lists(self):
+        """Тест замены литералов и сворачивания списков IN."""
+        first = statement_shape("SELECT * FROM t  WHERE id IN (?, ?, ?) AND name = 'a' LIMIT 10")
+        second = statement_shape("SELECT * FROM t WHERE id IN (?,?) AND name = 'b''c' LIMIT 20")
+
+        assert first == second == 'SELECT * FROM t WHERE id IN (?, ...) AND name = ? LIMIT ?'
+
+
+class TestQueryStats:
+    """Тесты статистики запроса."""
+
+    def test_repeated_and_slowest(self):
+        """Тест поиска повторов и самых медленных выражений."""
+        stats = QueryStats(slowest_limit=2)
+        for _ in range(5):
+            stats.record('SELECT name FROM categories WHERE id = ?', 0.125)
+        stats.record('SELECT 1', 0.5)
+        stats.record('BEGIN', 0.2)
+        for _ in range(5):
+            stats.record('BEGIN', 0.0)
+
+        assert stats.count == 12
+        assert stats.repeated(5) == [
+            (5, 0.625, 'SELECT name FROM categories WHERE id = ?')
+        ]
+        assert stats.slowest() == [(0.5, 'SELECT ?'), (0.2, 'BEGIN')]
+
+
+class TestRequestInstrumentation:
+    """Тесты учета SQL в рамках запроса."""
+
+    def test_server_timing_header(self, client):
+        """Тест заголовка Server-Timing с количеством выражений."""
+        response = client.get('/health')
+
+        timing = response.headers['Server-Timing']
+        assert timing.startswith('db;dur=')
+        assert 'queries' in timing and 'app;dur=' in timing
+
+    def test_n_plus_one_logged(self, app, caplog):
+        """Тест предупреждения о повторах одной формы выражения."""
+        with app.test_request_context('/categories'):
+            app.preprocess_request()
+            db = get_db()
+            for category_id in range(app.config['SQL_N_PLUS_ONE_THRESHOLD']):
+                db.execute('SELECT name FROM categories WHERE id = ?', (category_id,)).fetchone()
+
+            assert current_query_stats().count >= app.config['SQL_N_PLUS_ONE_THRESHOLD']
+            with caplog.at_level(logging.WARNING, logger=app.logger.name):
+                app.process_response(Response())
+
+        assert any('N+1 query' in record.getMessage() and '/categories' in record.getMessage()
+                   for record in caplog.records)
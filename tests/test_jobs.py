@@ -0,0 +1,235 @@
+"""
+Тестирование фоновых задач.
+"""
+
+import gzip
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from database import get_db, write_transaction
+from jobs import (
+    CANCELLED, FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueueFullError, JobRunner,
+    job_handler
+)
+
+
+# Управление тестовыми обработчиками
+release = threading.Event()
+started = threading.Event()
+
+
+@job_handler('test_wait')
+def wait_job(context):
+    """Задача, ожидающая разрешения на завершение."""
+    started.set()
+    release.wait(5)
+
+
+@job_handler('test_loop')
+def loop_job(context):
+    """Задача, сообщающая прогресс до отмены."""
+    started.set()
+    for step in range(500):
+        context.progress(step / 500)
+        time.sleep(0.01)
+
+
+@job_handler('test_fail')
+def fail_job(context):
+    """Задача, завершающаяся ошибкой."""
+    raise RuntimeError('сбой')
+
+
+def wait_finished(runner, job_id, user_id, timeout=10):
+    """Ожидание завершения задачи."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = runner.get(job_id, user_id)
+        if job['finished_at']:
+            return job
+        time.sleep(0.02)
+    raise AssertionError('Задача не завершилась')
+
+
+@pytest.fixture
+def user_id(db_session):
+    """ID тестового пользователя."""
+    return db_session.execute('SELECT id FROM users').fetchone()['id']
+
+
+@pytest.fixture
+def runner(app, tmp_path):
+    """Исполнитель с одним потоком и каталогом результатов во временной папке."""
+    release.clear()
+    started.clear()
+    runner = JobRunner(app, max_workers=1, max_queued=1,
+                       results_dir=str(tmp_path / 'results'))
+    previous = app.extensions['jobs']
+    app.extensions['jobs'] = runner
+    yield runner
+    release.set()
+    runner.shutdown()
+    app.extensions['jobs'] = previous
+
+
+class TestJobRunner:
+    """Тесты исполнителя фоновых задач."""
+
+    def test_report_job(self, app, user_id, runner):
+        """Тест отчета в фоне с файлом результата."""
+        job_id = runner.submit('report', user_id, start_date='2000-01-01', end_date='2100-12-31')
+        job = wait_finished(runner, job_id, user_id)
+
+        assert job['status'] == SUCCEEDED
+        assert job['progress'] == 1
+        with open(runner.result(job_id, user_id)['result_path'], encoding='utf-8') as f:
+            report = json.load(f)
+        assert report['totals']['expense_count'] == 1
+
+    def test_export_job(self, app, user_id, runner):
+        """Тест сжатого экспорта в фоне."""
+        job_id = runner.submit('export', user_id, filters={}, compress=True,
+                               type_labels={'income': 'Доход', 'expense': 'Расход'})
+        wait_finished(runner, job_id, user_id)
+
+        result = runner.result(job_id, user_id)
+        assert result['result_name'].endswith('.csv.gz')
+        with gzip.open(result['result_path'], 'rt', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert len(lines) == 2 and 'Расход' in lines[1]
+
+    def test_failure_recorded(self, app, user_id, runner):
+        """Тест сохранения ошибки обработчика."""
+        job_id = runner.submit('test_fail', user_id)
+        job = wait_finished(runner, job_id, user_id)
+
+        assert job['status'] == FAILED
+        assert job['error'] == 'сбой'
+
+    def test_queue_limit_and_cancel_queued(self, app, user_id, runner):
+        """Тест отказа при заполненной очереди и отмены задачи в очереди."""
+        running = runner.submit('test_wait', user_id)
+        assert started.wait(5)
+        queued = runner.submit('test_wait', user_id)
+
+        with pytest.raises(JobQueueFullError):
+            runner.submit('test_wait', user_id)
+
+        assert runner.cancel(queued, user_id) is True
+        release.set()
+
+        assert wait_finished(runner, running, user_id)['status'] == SUCCEEDED
+        assert runner.get(queued, user_id)['status'] == CANCELLED
+        assert runner.cancel(running, user_id) is False
+        assert runner.stats()['rejected'] == 1
+
+    def test_cancel_queued_removes_upload(self, app, user_id, runner):
+        """Тест удаления загруженного файла задачи, отмененной в очереди."""
+        running = runner.submit('test_wait', user_id)
+        assert started.wait(5)
+        path = runner.temp_path('.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('Дата;Сумма;Категория\n')
+        queued = runner.submit('import', user_id, path=path)
+
+        assert runner.cancel(queued, user_id) is True
+        release.set()
+        wait_finished(runner, running, user_id)
+        runner.shutdown()
+
+        assert not os.path.exists(path)
+
+    def test_prune_removes_files(self, app, user_id, runner):
+        """Тест удаления файлов результата и загрузки устаревшей задачи."""
+        upload = runner.temp_path('.csv')
+        result = runner.path('old.json')
+        for path in (upload, result):
+            open(path, 'w').close()
+        with write_transaction() as db:
+            db.execute(
+                '''INSERT INTO jobs (id, user_id, kind, params, status, result_path,
+                                     finished_at)
+                   VALUES ('old', ?, 'import', ?, ?, ?, '2000-01-01 00:00:00')''',
+                (user_id, json.dumps({'path': upload}), CANCELLED, result)
+            )
+
+        assert runner.prune() == 1
+        assert not os.path.exists(upload)
+        assert not os.path.exists(result)
+
+    def test_recover_interrupted(self, app, user_id, runner):
+        """Тест завершения задач остановленного процесса и сохранения чужих живых."""
+        upload = runner.temp_path('.csv')
+        open(upload, 'w').close()
+        with write_transaction() as db:
+            db.executemany(
+                '''INSERT INTO jobs (id, user_id, kind, params, status, owner)
+                   VALUES (?, ?, 'import', ?, ?, ?)''',
+                [('dead', user_id, json.dumps({'path': upload}), RUNNING,
+                  f'{socket.gethostname()}:999999999'),
+                 ('legacy', user_id, '{}', QUEUED, None),
+                 ('remote', user_id, '{}', RUNNING, 'other-host:1')]
+            )
+
+        assert runner.recover() == 2
+        dead = runner.get('dead', user_id)
+        assert dead['status'] == FAILED and dead['finished_at']
+        assert runner.get('legacy', user_id)['status'] == FAILED
+        assert runner.get('remote', user_id)['status'] == RUNNING
+
+        with write_transaction() as db:
+            db.execute("UPDATE jobs SET finished_at = '2000-01-01 00:00:00' WHERE id = 'dead'")
+        runner.prune()
+        assert runner.get('dead', user_id) is None
+        assert not os.path.exists(upload)
+
+    def test_cancel_running(self, app, user_id, runner):
+        """Тест отмены выполняющейся задачи при сообщении прогресса."""
+        job_id = runner.submit('test_loop', user_id)
+        assert started.wait(5)
+
+        assert runner.cancel(job_id, user_id) is True
+        assert wait_finished(runner, job_id, user_id)['status'] == CANCELLED
+
+    def test_other_user(self, app, user_id, runner):
+        """Тест недоступности задачи другого пользователя."""
+        job_id = runner.submit('test_fail', user_id)
+        wait_finished(runner, job_id, user_id)
+
+        assert runner.get(job_id, user_id + 1) is None
+        assert runner.cancel(job_id, user_id + 1) is None
+
+
+class TestJobRoutes:
+    """Тесты маршрутов фоновых задач."""
+
+    def test_status_and_download(self, client, auth, user_id, runner):
+        """Тест постановки, статуса и скачивания результата."""
+        auth.login()
+        response = client.post('/jobs/report', data={
+            'start_date': '2000-01-01', 'end_date': '2100-12-31'
+        })
+        assert response.status_code == 202
+
+        job_id = response.get_json()['data']['id']
+        assert response.headers['Location'].endswith(f'/jobs/{job_id}')
+        with client.application.app_context():
+            wait_finished(runner, job_id, user_id)
+
+        status = client.get(f'/jobs/{job_id}').get_json()['data']
+        download = client.get(status['download_url'])
+        assert download.status_code == 200
+        assert json.loads(download.data)['totals']['expense_count'] == 1
+
+    def test_invalid_period(self, client, auth, user_id, runner):
+        """Тест ошибки 400 при неверном периоде."""
+        auth.login()
+        response = client.post('/jobs/report', data={'start_date': 'вчера'})
+
+        assert response.status_code == 400
+        assert get_db().execute('SELECT COUNT(*) FROM jobs').fetchone()[0] == 0
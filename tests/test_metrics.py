@@ -0,0 +1,84 @@
+"""
+Тестирование метрик /metrics.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from metrics import MetricsRegistry
+
+
+def sample(text, line_start):
+    """Значение строки метрики, начинающейся с line_start."""
+    for line in text.splitlines():
+        if line.startswith(line_start + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+class TestMetricsRegistry:
+    """Тесты реестра метрик."""
+
+    def test_histogram_cumulative(self):
+        """Тест накопительных корзин, суммы и количества гистограммы."""
+        registry = MetricsRegistry()
+        for value in (0.003, 0.01, 0.2, 20):
+            registry.observe('password_hash_duration_seconds', (('operation', 'hash'),), value)
+
+        text = registry.render()
+        name = 'password_hash_duration_seconds'
+        assert sample(text, f'{name}_bucket{{operation="hash",le="0.005"}}') == 1
+        assert sample(text, f'{name}_bucket{{operation="hash",le="0.01"}}') == 2
+        assert sample(text, f'{name}_bucket{{operation="hash",le="10"}}') == 3
+        assert sample(text, f'{name}_bucket{{operation="hash",le="+Inf"}}') == 4
+        assert sample(text, f'{name}_count{{operation="hash"}}') == 4
+        assert f'# TYPE {name} histogram' in text
+
+    def test_workers_merged(self, tmp_path):
+        """Тест суммирования счетчиков всех процессов и мгновенных значений живых."""
+        # PID завершившегося процесса
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        dead = {
+            'pid': process.pid,
+            'counters': [['http_requests_total',
+                          [['endpoint', 'index'], ['method', 'GET'], ['status', '200']], 5]],
+            'histograms': [],
+            'buckets': {},
+            'gauges': [['http_requests_in_flight', [], 3]],
+        }
+        with open(os.path.join(tmp_path, f'metrics_{process.pid}.json'), 'w') as f:
+            json.dump(dead, f)
+
+        registry = MetricsRegistry(directory=str(tmp_path))
+        registry.request_started()
+        registry.request_started()
+        registry.request_finished('index', 'GET', 200, 0.02)
+
+        text = registry.render()
+        assert sample(text, 'http_requests_total{endpoint="index",method="GET",status="200"}') == 6
+        assert sample(text, 'http_requests_in_flight') == 1
+        assert sample(text, 'http_request_duration_seconds_count{endpoint="index"}') == 1
+
+
+class TestMetricsEndpoint:
+    """Тесты маршрута /metrics."""
+
+    def test_requests_counted(self, client):
+        """Тест учета запросов, состояния пулов и формата ответа."""
+        client.get('/health')
+        before = sample(client.get('/metrics').get_data(as_text=True),
+                        'http_requests_total{endpoint="health_check",method="GET",status="200"}')
+        client.get('/health')
+
+        response = client.get('/metrics')
+        text = response.get_data(as_text=True)
+
+        assert response.mimetype == 'text/plain'
+        assert sample(text, 'http_requests_total{endpoint="health_check",method="GET",status="200"}') \
+            == before + 1
+        assert sample(text, 'http_requests_in_flight') == 1
+        assert 'db_pool_connections{pool="readers",state="idle"}' in text
+        assert 'http_request_duration_seconds_bucket{endpoint="health_check",le="+Inf"}' in text
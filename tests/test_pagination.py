@@ -0,0 +1,125 @@
+"""
+Тестирование курсорной пагинации транзакций.
+"""
+
+import sqlite3
+
+import pytest
+
+from pagination import (
+    InvalidCursorError, decode_cursor, encode_cursor,
+    paginate, parse_fields, select_clause
+)
+
+
+@pytest.fixture
+def ledger():
+    """База в памяти с 25 транзакциями, часть из которых совпадает по дате."""
+    db = sqlite3.connect(':memory:')
+    db.row_factory = sqlite3.Row
+    db.execute('''
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY, amount REAL, description TEXT, type TEXT,
+            date DATE, user_id INTEGER, category_id INTEGER, created_at TIMESTAMP
+        )
+    ''')
+    for i in range(1, 26):
+        db.execute(
+            'INSERT INTO transactions VALUES (?, ?, ?, ?, ?, 1, NULL, ?)',
+            (i, i * 10, f'item {i}', 'expense', f'2024-01-{(i + 1) // 2:02d}',
+             '2024-01-01 00:00:00')
+        )
+    yield db
+    db.close()
+
+
+QUERY = 'SELECT t.* FROM transactions t WHERE t.user_id = ?'
+
+
+class TestCursor:
+    """Тесты кодирования курсора."""
+
+    def test_round_trip(self):
+        """Тест кодирования и декодирования курсора."""
+        row = {'date': '2024-01-05', 'created_at': '2024-01-05 10:00:00', 'id': 42}
+        assert decode_cursor(encode_cursor(row)) == ('2024-01-05', '2024-01-05 10:00:00', 42)
+
+    @pytest.mark.parametrize('cursor', [
+        '', 'garbage', 'WzEsMiwzXQ', 'eyJhIjoxfQ',
+        'WyIyMDI0LTAxLTA1Iix7ImEiOjF9LDNd', 'WyIyMDI0LTAxLTA1IixudWxsLDNd',
+    ])
+    def test_invalid_cursor(self, cursor):
+        """Тест отклонения поврежденного курсора."""
+        with pytest.raises(InvalidCursorError):
+            decode_cursor(cursor)
+
+
+class TestPaginate:
+    """Тесты выборки страниц по курсору."""
+
+    def test_walks_all_rows_without_gaps(self, ledger):
+        """Тест обхода всех строк без пропусков и повторов при равных датах."""
+        seen = []
+        cursor = None
+        while True:
+            page = paginate(ledger, QUERY, [1], cursor=cursor, per_page=7)
+            seen.extend(row['id'] for row in page.items)
+            if not page.next_cursor:
+                break
+            cursor = page.next_cursor
+
+        assert seen == list(range(25, 0, -1))
+
+    def test_previous_page(self, ledger):
+        """Тест возврата на предыдущую страницу."""
+        first = paginate(ledger, QUERY, [1], per_page=5)
+        second = paginate(ledger, QUERY, [1], cursor=first.next_cursor, per_page=5)
+        back = paginate(ledger, QUERY, [1], cursor=second.prev_cursor,
+                        per_page=5, backwards=True)
+
+        assert [row['id'] for row in back.items] == [row['id'] for row in first.items]
+        assert first.prev_cursor is None
+        assert back.prev_cursor is None
+        assert back.next_cursor == first.next_cursor
+
+
+class TestProjection:
+    """Тесты проекции полей."""
+
+    def test_parse_fields(self):
+        """Тест разбора списка полей."""
+        assert parse_fields('amount, date,amount') == ['amount', 'date']
+        with pytest.raises(ValueError):
+            parse_fields('amount,password_hash')
+
+    def test_category_join_only_when_needed(self):
+        """Тест JOIN с категориями только для полей категории."""
+        assert 'JOIN' not in select_clause(['amount'])
+        assert 'JOIN categories' in select_clause(['amount', 'category_name'])
+
+
+class TestTransactionsApi:
+    """Тесты JSON API списка транзакций."""
+
+    def test_projection_and_cursor(self, client, auth, sample_transactions):
+        """Тест проекции полей и курсора следующей страницы."""
+        auth.login()
+
+        response = client.get('/api/transactions?limit=4&fields=amount,description')
+        data = response.get_json()
+
+        assert response.status_code == 200
+        assert len(data['data']) == 4
+        assert set(data['data'][0]) == {'amount', 'description'}
+        assert data['next_cursor']
+
+        response = client.get(f'/api/transactions?limit=4&cursor={data["next_cursor"]}')
+        rest = response.get_json()
+        assert len(rest['data']) == 2
+        assert rest['next_cursor'] is None
+
+    def test_unknown_field_rejected(self, client, auth, db_session):
+        """Тест ошибки 400 для неизвестного поля."""
+        auth.login()
+        response = client.get('/api/transactions?fields=secret')
+        assert response.status_code == 400
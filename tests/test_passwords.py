@@ -0,0 +1,122 @@
+"""
+Тестирование пула хеширования паролей.
+"""
+
+import threading
+
+import bcrypt
+import pytest
+
+from passwords import (
+    PasswordHasher, PasswordHasherBusyError, calibrate_rounds, hash_cost, init_passwords
+)
+
+
+@pytest.fixture
+def hasher(app):
+    """Пул из одного потока без очереди."""
+    hasher = PasswordHasher(app, max_workers=1, max_queued=0, retry_after=7, rounds=5)
+    yield hasher
+    hasher.shutdown()
+
+
+class TestPasswordHasher:
+    """Тесты пула хеширования."""
+
+    def test_hash_and_verify(self, hasher, app):
+        """Тест хеширования и проверки с учетом времени в метриках."""
+        password_hash = hasher.hash('secret-password')
+
+        assert hasher.verify('secret-password', password_hash)
+        assert not hasher.verify('wrong-password', password_hash)
+        assert not hasher.verify('secret-password', 'pbkdf2:sha256:600000$salt$digest')
+        assert hasher.stats()['completed'] == 4
+        text = app.extensions['metrics'].render()
+        assert 'password_hash_duration_seconds_count{operation="verify"}' in text
+        assert 'password_hash_wait_seconds_count{operation="hash"}' in text
+
+    def test_overflow_rejected(self, hasher):
+        """Тест немедленного отказа при занятом пуле и заполненной очереди."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=hasher._call, args=('hash', slow))
+        thread.start()
+        assert started.wait(5)
+
+        with pytest.raises(PasswordHasherBusyError):
+            hasher.hash('secret-password')
+
+        release.set()
+        thread.join()
+        assert hasher.stats()['rejected'] == 1
+        assert hasher.hash('secret-password')
+
+
+class TestRehash:
+    """Тесты стоимости хешей и перехеширования."""
+
+    def test_hash_cost(self):
+        """Тест чтения стоимости из хеша."""
+        assert hash_cost(bcrypt.hashpw(b'secret', bcrypt.gensalt(5)).decode()) == 5
+        assert hash_cost('pbkdf2:sha256:600000$salt$digest') is None
+
+    def test_calibrate_rounds(self):
+        """Тест подбора стоимости в заданных границах."""
+        assert calibrate_rounds(0, min_rounds=5, max_rounds=6) == 5
+        assert calibrate_rounds(60, min_rounds=5, max_rounds=6) == 6
+
+    def test_calibration_only_raises(self, app, monkeypatch):
+        """Тест подбора не ниже BCRYPT_LOG_ROUNDS и допуска более дорогих хешей."""
+        monkeypatch.setitem(app.config, 'BCRYPT_LOG_ROUNDS', 5)
+        monkeypatch.setitem(app.config, 'PASSWORD_HASH_TARGET_TIME', 0.001)
+        monkeypatch.setitem(app.config, 'PASSWORD_HASH_MAX_ROUNDS', 6)
+        monkeypatch.setattr('passwords.calibrate_rounds', lambda *args, **kwargs: 4)
+        monkeypatch.setitem(app.extensions, 'passwords', app.extensions['passwords'])
+        hasher = init_passwords(app)
+        try:
+            assert hasher.rounds == 5
+            assert hash_cost(hasher.hash('secret')) == 5
+            assert not hasher.needs_rehash(bcrypt.hashpw(b'secret', bcrypt.gensalt(6)).decode())
+            assert hasher.needs_rehash(bcrypt.hashpw(b'secret', bcrypt.gensalt(4)).decode())
+        finally:
+            hasher.shutdown()
+
+    def test_rehash_on_login(self, app, client, db_session, hasher, monkeypatch):
+        """Тест замены хеша с другой стоимостью после успешного входа."""
+        monkeypatch.setitem(app.extensions, 'passwords', hasher)
+        old_hash = db_session.execute('SELECT password_hash FROM users').fetchone()[0]
+        assert hasher.needs_rehash(old_hash)
+
+        client.post('/login', data={
+            'email': 'test@example.com', 'password': 'testpassword123'
+        })
+        hasher.shutdown()
+
+        new_hash = db_session.execute('SELECT password_hash FROM users').fetchone()[0]
+        assert hash_cost(new_hash) == 5
+        assert bcrypt.checkpw(b'testpassword123', new_hash.encode())
+        assert hasher.stats()['rehashed'] == 1
+
+
+class TestPasswordRoutes:
+    """Тесты ответов маршрутов при перегрузке."""
+
+    def test_login_busy(self, app, client, db_session, hasher, monkeypatch):
+        """Тест ответа 503 с Retry-After при заполненной очереди."""
+        monkeypatch.setitem(app.extensions, 'passwords', hasher)
+        monkeypatch.setattr('main.render_template', lambda template, **context: template)
+        monkeypatch.setattr(hasher, '_slots', threading.BoundedSemaphore(1))
+        hasher._slots.acquire()
+
+        response = client.post('/login', data={
+            'email': 'test@example.com', 'password': 'testpassword123'
+        })
+
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '7'
+        assert response.get_data(as_text=True) == 'auth/login.html'
@@ -0,0 +1,142 @@
+"""
+Тестирование индекса префиксных сумм.
+"""
+
+import random
+from datetime import date
+
+import pytest
+
+from database import get_db, write_transaction
+from filters import TransactionFilter, summarize_transactions
+from prefix_sums import FenwickTree, prefix_index, range_totals
+
+
+@pytest.fixture
+def ledger_user(app, db_session):
+    """Пользователь с транзакциями в разные дни."""
+    user_id = db_session.execute('SELECT id FROM users').fetchone()['id']
+    with write_transaction(user_id) as db:
+        db.execute('DELETE FROM transactions WHERE user_id = ?', (user_id,))
+        db.executemany(
+            'INSERT INTO transactions (amount, type, date, user_id) VALUES (?, ?, ?, ?)',
+            [(1000, 'income', '2024-01-01', user_id),
+             (100.25, 'expense', '2024-01-05', user_id),
+             (50, 'expense', '2024-02-10', user_id),
+             (200, 'income', '2024-03-01', user_id)]
+        )
+    return user_id
+
+
+class TestFenwickTree:
+    """Тесты дерева Фенвика."""
+
+    def test_matches_brute_force(self):
+        """Тест совпадения сумм с прямым подсчетом после изменений."""
+        rng = random.Random(1)
+        values = [rng.randint(-100, 100) for _ in range(97)]
+        tree = FenwickTree.from_values(values)
+
+        for _ in range(50):
+            index = rng.randrange(len(values))
+            delta = rng.randint(-50, 50)
+            values[index] += delta
+            tree.add(index, delta)
+
+            start = rng.randrange(len(values))
+            end = rng.randrange(start, len(values))
+            assert tree.range_sum(start, end) == sum(values[start:end + 1])
+
+    def test_bounds(self):
+        """Тест диапазонов за пределами массива."""
+        tree = FenwickTree.from_values([1, 2, 3])
+
+        assert tree.prefix(-1) == 0
+        assert tree.prefix(10) == 6
+        assert tree.range_sum(2, 1) == 0
+
+
+class TestRangeTotals:
+    """Тесты итогов за период."""
+
+    def test_totals_and_balances(self, app, ledger_user):
+        """Тест итогов периода и остатков на границах."""
+        totals = range_totals(get_db(), ledger_user, date(2024, 1, 2), date(2024, 2, 29))
+
+        assert totals == {
+            'income': 0.0, 'expense': 150.25, 'balance': -150.25,
+            'opening_balance': 1000.0, 'closing_balance': 849.75,
+        }
+
+    def test_updated_on_write(self, app, ledger_user):
+        """Тест обновления индекса без перестройки после записи."""
+        range_totals(get_db(), ledger_user)
+        builds = prefix_index.builds
+
+        with write_transaction(ledger_user) as db:
+            changes = prefix_index.begin(db, ledger_user)
+            db.execute(
+                '''INSERT INTO transactions (amount, type, date, user_id)
+                   VALUES (30, 'expense', '2024-01-05', ?)''',
+                (ledger_user,)
+            )
+            changes.add('2024-01-05', 'expense', 30)
+            changes.finish(db)
+        prefix_index.apply(changes)
+
+        totals = range_totals(get_db(), ledger_user, date(2024, 1, 5), date(2024, 1, 5))
+        assert totals['expense'] == 130.25
+        assert prefix_index.builds == builds
+
+    def test_rebuilt_after_untracked_write(self, app, ledger_user):
+        """Тест перестройки индекса после записи без учета изменений."""
+        range_totals(get_db(), ledger_user)
+
+        with write_transaction(ledger_user) as db:
+            db.execute('DELETE FROM transactions WHERE user_id = ? AND type = ?',
+                       (ledger_user, 'income'))
+
+        assert range_totals(get_db(), ledger_user)['income'] == 0
+
+    def test_delete_uses_deleted_row(self, app, client, auth, ledger_user):
+        """Тест учета в индексе только действительно удаленной строки."""
+        auth.login()
+        with app.app_context():
+            range_totals(get_db(), ledger_user)
+            transaction_id = get_db().execute(
+                "SELECT id FROM transactions WHERE user_id = ? AND date = '2024-01-05'",
+                (ledger_user,)
+            ).fetchone()['id']
+
+        client.post(f'/transaction/{transaction_id}/delete')
+        client.post(f'/transaction/{transaction_id}/delete')
+
+        with app.app_context():
+            totals = range_totals(get_db(), ledger_user)
+            assert totals['expense'] == 50
+            assert totals['income'] == 1200
+
+
+class TestSummarizeTransactions:
+    """Тесты итоговой строки списка транзакций."""
+
+    @pytest.mark.parametrize('values', [
+        {'start_date': '2024-01-01', 'end_date': '2024-01-31'},
+        {'transaction_type': 'expense'},
+        {'start_date': '2024-02-01', 'min_amount': '10'},
+        {'search': 'нет'},
+    ])
+    def test_matches_sql(self, app, ledger_user, values):
+        """Тест совпадения с прямым подсчетом по фильтру."""
+        transaction_filter = TransactionFilter(**values)
+        where, params = transaction_filter.compile()
+        rows = get_db().execute(
+            'SELECT type, amount FROM transactions t WHERE t.user_id = ?' + where,
+            [ledger_user] + params
+        ).fetchall()
+        income = sum(row['amount'] for row in rows if row['type'] == 'income')
+        expense = sum(row['amount'] for row in rows if row['type'] == 'expense')
+
+        summary = summarize_transactions(get_db(), ledger_user, transaction_filter)
+        assert summary['income'] == pytest.approx(income)
+        assert summary['expense'] == pytest.approx(expense)
@@ -0,0 +1,76 @@
+"""
+Тестирование ограничения частоты входа и регистрации.
+"""
+
+import pytest
+
+from ratelimit import MemoryBackend, RateLimiter, SQLiteBackend, parse_rate
+
+
+class TestRateLimiter:
+    """Тесты корзин токенов."""
+
+    def test_parse_rate(self):
+        """Тест разбора правил."""
+        assert parse_rate('5/minute') == (5, 60)
+        with pytest.raises(ValueError):
+            parse_rate('5 per minute')
+
+    @pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+    def test_bucket(self, backend, tmp_path, monkeypatch):
+        """Тест отказа после исчерпания токенов и их восполнения."""
+        clock = [1000.0]
+        monkeypatch.setattr('ratelimit.time.monotonic', lambda: clock[0])
+        monkeypatch.setattr('ratelimit.time.time', lambda: clock[0])
+        store = MemoryBackend() if backend == 'memory' else SQLiteBackend(str(tmp_path / 'rl.db'))
+        limiter = RateLimiter(store, {'login_email': '2/minute'})
+
+        assert limiter.check(('login_email', 'a@example.com')) == 0
+        assert limiter.check(('login_email', 'a@example.com')) == 0
+        assert limiter.check(('login_email', 'a@example.com')) == 30
+        assert limiter.check(('login_email', 'b@example.com')) == 0
+
+        clock[0] += 30
+        assert limiter.check(('login_email', 'a@example.com')) == 0
+        assert limiter.stats()['rejected'] == 1
+
+    def test_eviction(self):
+        """Тест ограничения количества корзин в памяти."""
+        limiter = RateLimiter(MemoryBackend(max_entries=2), {'login_ip': '1/hour'})
+        for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+            limiter.check(('login_ip', ip))
+
+        assert limiter.stats()['buckets'] == 2
+
+
+class TestRateLimitedRoutes:
+    """Тесты ответа 429 маршрутов входа."""
+
+    def test_login_rejected_before_hashing(self, app, client, db_session, monkeypatch):
+        """Тест отказа по email до проверки пароля."""
+        monkeypatch.setattr('main.render_template', lambda template, **context: template)
+        capacity, _ = app.extensions['ratelimit'].rules['login_email']
+        for _ in range(capacity):
+            client.post('/login', data={'email': 'Test@Example.com', 'password': 'wrong'})
+
+        completed = app.extensions['passwords'].stats()['completed']
+        response = client.post('/login', data={'email': 'test@example.com', 'password': 'wrong'})
+
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) > 0
+        assert app.extensions['passwords'].stats()['completed'] == completed
+
+    def test_owner_not_locked_out(self, app, client, db_session, monkeypatch):
+        """Тест входа владельца после неудачных попыток с другого адреса."""
+        monkeypatch.setattr('main.render_template', lambda template, **context: template)
+        capacity, _ = app.extensions['ratelimit'].rules['login_email']
+        for _ in range(capacity + 1):
+            client.post('/login', data={'email': 'test@example.com', 'password': 'wrong'},
+                        environ_base={'REMOTE_ADDR': '10.0.0.66'})
+
+        for _ in range(capacity + 1):
+            response = client.post('/login', data={
+                'email': 'test@example.com', 'password': 'testpassword123'
+            })
+            assert response.status_code == 302
+            client.get('/logout')
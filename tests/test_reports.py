@@ -0,0 +1,168 @@
+"""
+Тестирование отчета за период.
+"""
+
+import random
+from datetime import date, timedelta
+
+import pytest
+
+import reports
+from database import get_db, write_transaction
+from reports import _load_snapshot, _store_snapshots, build_report, closed_months
+
+
+@pytest.fixture
+def report_user(app, db_session):
+    """Пользователь с транзакциями за три месяца (февраль без транзакций)."""
+    user_id = db_session.execute('SELECT id FROM users').fetchone()['id']
+    with write_transaction(user_id) as db:
+        db.execute('DELETE FROM transactions WHERE user_id = ?', (user_id,))
+        food = db.execute(
+            "INSERT INTO categories (name, type, user_id) VALUES ('Еда', 'expense', ?)",
+            (user_id,)
+        ).lastrowid
+        db.executemany(
+            '''INSERT INTO transactions (amount, type, date, description, user_id, category_id)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            [(1000, 'income', '2024-01-01', 'Зарплата', user_id, None),
+             (100.25, 'expense', '2024-01-05', 'Обед', user_id, food),
+             (50, 'expense', '2024-01-05', 'Ужин', user_id, food),
+             (300, 'expense', '2024-03-10', 'Прочее', user_id, None),
+             (200, 'income', '2024-03-01', 'Премия', user_id, None)]
+        )
+    return user_id
+
+
+class TestBuildReport:
+    """Тесты расчета отчета."""
+
+    def test_totals(self, app, report_user):
+        """Тест итогов и средних значений за период."""
+        report = build_report(get_db(), report_user, date(2024, 1, 1), date(2024, 3, 31))
+
+        totals = report['totals']
+        assert totals['income'] == 1200.0
+        assert totals['expense'] == 450.25
+        assert totals['balance'] == 749.75
+        assert (totals['income_count'], totals['expense_count']) == (2, 3)
+        assert totals['monthly_average_expense'] == round(450.25 / 3, 2)
+
+    def test_months_with_gaps(self, app, report_user):
+        """Тест заполнения месяцев без транзакций нулями."""
+        report = build_report(get_db(), report_user, '2024-01-01', '2024-03-31')
+
+        assert [month['month'] for month in report['months']] == ['2024-01', '2024-02', '2024-03']
+        assert report['months'][1] == {
+            'month': '2024-02', 'income': 0.0, 'expense': 0.0, 'balance': 0.0, 'count': 0,
+        }
+        assert report['months'][0]['expense'] == 150.25
+
+    def test_categories_and_largest(self, app, report_user):
+        """Тест долей категорий, крупнейших транзакций и дня с наибольшими тратами."""
+        report = build_report(get_db(), report_user, date(2024, 1, 1), date(2024, 3, 31))
+
+        food = next(item for item in report['categories'] if item['name'] == 'Еда')
+        assert food['total'] == 150.25
+        assert food['share'] == round(150.25 / 450.25, 4)
+        assert [item['description'] for item in report['largest_expense']] == ['Прочее', 'Обед', 'Ужин']
+        assert report['peak_expense_day'] == {'date': '2024-03-10', 'expense': 300.0}
+
+    def test_empty_period(self, app, report_user):
+        """Тест периода без транзакций."""
+        report = build_report(get_db(), report_user, date(2023, 1, 1), date(2023, 1, 31))
+
+        assert report['totals']['income'] == 0
+        assert report['categories'] == []
+        assert report['peak_expense_day'] is None
+
+
+def snapshot_months(user_id):
+    """Месяцы, для которых сохранены снимки."""
+    return [row['month'] for row in get_db().execute(
+        'SELECT month FROM report_snapshots WHERE user_id = ? ORDER BY month', (user_id,)
+    )]
+
+
+class TestSnapshots:
+    """Тесты снимков отчетов за закрытые месяцы."""
+
+    def test_closed_months(self):
+        """Тест выбора целых месяцев, закрытых с учетом льготного периода."""
+        months = closed_months(date(2024, 1, 15), date(2024, 5, 31), today=date(2024, 6, 2),
+                               grace_days=3)
+
+        assert [(month // 12, month % 12 + 1) for month in months] == [(2024, 2), (2024, 3), (2024, 4)]
+
+    def test_stored_and_stitched(self, app, report_user):
+        """Тест сохранения снимков и совпадения склеенного отчета с полным расчетом."""
+        period = (date(2024, 1, 1), date(2024, 3, 31))
+        expected = build_report(get_db(), report_user, *period)
+
+        first = build_report(get_db(), report_user, *period, snapshots=True, today=date(2024, 3, 20))
+        second = build_report(get_db(), report_user, *period, snapshots=True, today=date(2024, 3, 20))
+
+        assert snapshot_months(report_user) == ['2024-01', '2024-02']
+        assert first == second == expected
+
+    def test_backdated_write_invalidates_month(self, app, report_user):
+        """Тест удаления снимка только того месяца, которого коснулась запись."""
+        period = (date(2024, 1, 1), date(2024, 3, 31))
+        build_report(get_db(), report_user, *period, snapshots=True, today=date(2024, 5, 1))
+        assert snapshot_months(report_user) == ['2024-01', '2024-02', '2024-03']
+
+        with write_transaction(report_user) as db:
+            db.execute(
+                '''INSERT INTO transactions (amount, type, date, user_id)
+                   VALUES (25, 'expense', '2024-02-03', ?)''',
+                (report_user,)
+            )
+        assert snapshot_months(report_user) == ['2024-01', '2024-03']
+
+        report = build_report(get_db(), report_user, *period, snapshots=True, today=date(2024, 5, 1))
+        assert report['months'][1]['expense'] == 25.0
+        assert report == build_report(get_db(), report_user, *period)
+
+    def test_stale_snapshot_not_stored(self, app, report_user):
+        """Тест отказа от снимка, рассчитанного до последней записи."""
+        build_report(get_db(), report_user, date(2024, 1, 1), date(2024, 1, 31),
+                     snapshots=True, today=date(2024, 3, 1))
+        db = get_db()
+        data = db.execute('SELECT data FROM report_snapshots WHERE user_id = ?',
+                          (report_user,)).fetchone()['data']
+        version = db.execute('SELECT version FROM data_versions WHERE user_id = ?',
+                             (report_user,)).fetchone()['version']
+        with write_transaction() as writer:
+            writer.execute('DELETE FROM report_snapshots')
+
+        _store_snapshots(report_user, version - 1, {2024 * 12: _load_snapshot(data)})
+        assert snapshot_months(report_user) == []
+
+        _store_snapshots(report_user, version, {2024 * 12: _load_snapshot(data)})
+        assert snapshot_months(report_user) == ['2024-01']
+
+
+@pytest.mark.skipif(reports.np is None, reason='NumPy не установлен')
+class TestVectorized:
+    """Тесты совпадения векторного и построчного расчета."""
+
+    def test_same_result(self, app, report_user):
+        """Тест одинакового отчета на случайных данных с равными суммами."""
+        rng = random.Random(7)
+        with write_transaction(report_user) as db:
+            db.executemany(
+                'INSERT INTO transactions (amount, type, date, user_id) VALUES (?, ?, ?, ?)',
+                [(rng.choice([10, 99.99, 250.5, rng.uniform(1, 500)]),
+                  rng.choice(['income', 'expense']),
+                  (date(2024, 1, 1) + timedelta(days=rng.randrange(200))).isoformat(),
+                  report_user)
+                 for _ in range(500)]
+            )
+
+        db = get_db()
+        for period in ((date(2024, 1, 1), date(2024, 7, 31)), (date(2024, 2, 15), date(2024, 4, 10))):
+            assert build_report(db, report_user, *period, vectorized=True) == \
+                build_report(db, report_user, *period, vectorized=False)
+            assert build_report(db, report_user, *period, vectorized=True, snapshots=True,
+                                today=date(2024, 6, 1)) == \
+                build_report(db, report_user, *period, vectorized=False)
@@ -0,0 +1,87 @@
+"""
+Тестирование полнотекстового поиска по описаниям транзакций.
+"""
+
+import sqlite3
+
+import pytest
+
+from search import build_match_query, create_fts_index, search_transactions
+
+
+@pytest.fixture
+def ledger():
+    """База в памяти с транзакциями, созданными до появления индекса."""
+    db = sqlite3.connect(':memory:')
+    db.row_factory = sqlite3.Row
+    db.executescript('''
+        CREATE TABLE categories (id INTEGER PRIMARY KEY, name TEXT, color TEXT);
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, amount REAL, description TEXT,
+            type TEXT, date DATE, user_id INTEGER, category_id INTEGER
+        );
+    ''')
+    rows = [
+        ('Кофе в кофейне', 1), ('Продукты', 1), ('Кофемашина', 1),
+        ('Кофе с собой', 2), (None, 1), ('Зарплата за март', 1),
+    ]
+    for description, user_id in rows:
+        db.execute(
+            "INSERT INTO transactions (amount, description, type, date, user_id) "
+            "VALUES (1, ?, 'expense', '2024-01-01', ?)",
+            (description, user_id)
+        )
+    create_fts_index(db)
+    db.commit()
+    yield db
+    db.close()
+
+
+def ids(rows):
+    return sorted(row['id'] for row in rows)
+
+
+class TestMatchQuery:
+    """Тесты построения выражения MATCH."""
+
+    def test_prefix_terms(self):
+        """Тест поиска каждого слова по префиксу."""
+        assert build_match_query('кофе маш') == '"кофе"* "маш"*'
+
+    def test_syntax_is_escaped(self):
+        """Тест экранирования синтаксиса FTS5 во вводе."""
+        assert build_match_query('a" OR b*') == '"a"* "OR"* "b"*'
+        assert build_match_query('  ***  ') is None
+
+
+class TestSearch:
+    """Тесты поиска и синхронизации индекса."""
+
+    def test_backfill_and_prefix_match(self, ledger):
+        """Тест заполнения индекса и поиска по префиксу."""
+        assert ids(search_transactions(ledger, 1, 'коф')) == [1, 3]
+        assert ids(search_transactions(ledger, 1, 'КОФЕ коф')) == [1, 3]
+        assert ids(search_transactions(ledger, 1, 'кофе в')) == [1]
+        assert ids(search_transactions(ledger, 2, 'кофе')) == [4]
+
+    def test_triggers_keep_index_in_sync(self, ledger):
+        """Тест синхронизации индекса при вставке, изменении и удалении."""
+        ledger.execute(
+            "INSERT INTO transactions (amount, description, type, date, user_id) "
+            "VALUES (1, 'Кофе и круассан', 'expense', '2024-01-02', 1)"
+        )
+        ledger.execute("UPDATE transactions SET description = 'Чай' WHERE id = 1")
+        ledger.execute('DELETE FROM transactions WHERE id = 3')
+
+        assert ids(search_transactions(ledger, 1, 'кофе')) == [7]
+        assert ids(search_transactions(ledger, 1, 'чай')) == [1]
+        ledger.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('integrity-check')")
+
+    def test_ranked_by_relevance(self, ledger):
+        """Тест ранжирования: больше совпадений - выше в результатах."""
+        ledger.execute(
+            "INSERT INTO transactions (amount, description, type, date, user_id) "
+            "VALUES (1, 'Зарплата премия зарплата', 'income', '2023-01-01', 1)"
+        )
+        results = search_transactions(ledger, 1, 'зарплата')
+        assert [row['id'] for row in results] == [7, 6]
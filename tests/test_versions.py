@@ -0,0 +1,159 @@
+"""
+Тестирование версий данных пользователей и условных запросов.
+"""
+
+import sqlite3
+
+from database import get_database, get_db, write_transaction
+from versions import (
+    VersionTracker, _version_listeners, data_etag, get_data_version, on_version_changed
+)
+
+
+class TestDataVersion:
+    """Тесты увеличения версии данных триггерами."""
+
+    def test_bumped_by_writes(self, app, db_session):
+        """Тест роста версии при изменении транзакций, категорий и профиля."""
+        user_id = db_session.execute('SELECT id FROM users').fetchone()['id']
+        versions = [get_data_version(get_db(), user_id)]
+
+        statements = [
+            ('''INSERT INTO transactions (amount, type, date, user_id)
+                VALUES (5, 'expense', '2024-01-01', ?)''', (user_id,)),
+            ('UPDATE transactions SET amount = 6 WHERE user_id = ?', (user_id,)),
+            ('DELETE FROM transactions WHERE user_id = ?', (user_id,)),
+            ('UPDATE categories SET name = ? WHERE user_id = ?', ('Еда', user_id)),
+            ('UPDATE users SET username = ? WHERE id = ?', ('renamed', user_id)),
+        ]
+        for sql, params in statements:
+            with write_transaction(user_id) as db:
+                db.execute(sql, params)
+            versions.append(get_data_version(get_db(), user_id))
+
+        assert versions == sorted(set(versions))
+
+    def test_unknown_user(self, app):
+        """Тест нулевой версии для пользователя без изменений."""
+        assert get_data_version(get_db(), 999) == 0
+
+    def test_etag_depends_on_parts(self):
+        """Тест зависимости ETag от версии и параметров."""
+        assert data_etag(1, 2, '/api/statistics?') == data_etag(1, 2, '/api/statistics?')
+        assert data_etag(1, 2, '/a') != data_etag(1, 3, '/a')
+        assert data_etag(1, 2, '/a') != data_etag(1, 2, '/b')
+
+
+class TestConditionalRequests:
+    """Тесты ответов 304 по ETag."""
+
+    def test_not_modified_until_write(self, client, auth, db_session):
+        """Тест 304 до изменения данных и нового ETag после записи."""
+        auth.login()
+        response = client.get('/api/statistics')
+        etag = response.headers['ETag']
+        assert response.status_code == 200
+
+        response = client.get('/api/statistics', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+
+        user_id = db_session.execute('SELECT id FROM users').fetchone()['id']
+        with write_transaction(user_id) as db:
+            db.execute(
+                '''INSERT INTO transactions (amount, type, date, user_id)
+                   VALUES (5, 'expense', '2024-01-01', ?)''',
+                (user_id,)
+            )
+
+        response = client.get('/api/statistics', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+
+class TestVersionTracker:
+    """Тесты согласованности версий между процессами."""
+
+    def test_other_connection_commit_detected(self, app, db_session):
+        """Тест перепроверки версии после фиксации другим соединением (воркером)."""
+        user_id = db_session.execute('SELECT id FROM users').fetchone()['id']
+        database = get_database()
+        tracker = database.versions
+        changed = []
+        on_version_changed(changed.append)
+
+        try:
+            tracker.check(database.data_version())
+            version = tracker.get(get_db(), user_id)
+            lookups = tracker.lookups
+            assert tracker.get(get_db(), user_id) == version
+            assert tracker.lookups == lookups
+
+            other = sqlite3.connect(app.config['DATABASE_PATH'])
+            other.execute(
+                '''INSERT INTO transactions (amount, type, date, user_id)
+                   VALUES (5, 'expense', '2024-01-01', ?)''',
+                (user_id,)
+            )
+            other.commit()
+            other.close()
+
+            tracker.check(database.data_version())
+            assert tracker.get(get_db(), user_id) == version + 1
+            assert changed == [user_id]
+        finally:
+            _version_listeners.remove(changed.append)
+
+    def test_stale_read_not_memoized(self):
+        """Тест отказа запоминать версию, прочитанную до изменения."""
+        tracker = VersionTracker()
+
+        class RacingConnection:
+            """Соединение, во время чтения которого другой поток фиксирует запись."""
+
+            def execute(self, sql, params):
+                tracker.invalidate(1)
+                return self
+
+            def fetchone(self):
+                return {'version': 3}
+
+        assert tracker.get(RacingConnection(), 1) == 3
+        assert 1 not in tracker._verified
+
+    def test_eviction_notifies(self):
+        """Тест ограничения числа версий и сброса кешей вытесненного пользователя."""
+        tracker = VersionTracker(max_users=2)
+        changed = []
+        on_version_changed(changed.append)
+
+        class Connection:
+            def execute(self, sql, params):
+                return self
+
+            def fetchone(self):
+                return {'version': 1}
+
+        try:
+            for user_id in (1, 2, 1, 3):
+                tracker.get(Connection(), user_id)
+        finally:
+            _version_listeners.remove(changed.append)
+
+        assert list(tracker._versions) == [1, 3]
+        assert changed == [2]
+
+    def test_checked_lazily(self, app, client):
+        """Тест отсутствия сверки data_version в запросах без обращения к данным."""
+        tracker = get_database(app).versions
+        resets = tracker.resets
+        checks = []
+        original = tracker.check
+        tracker.check = lambda data_version: checks.append(data_version) or original(data_version)
+        try:
+            client.get('/metrics')
+        finally:
+            del tracker.check
+
+        assert checks == []
+        assert tracker.resets == resets
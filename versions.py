@@ -0,0 +1,262 @@
+"""
+Версии данных пользователей.
+
+Таблица data_versions хранит монотонно растущий номер версии данных
+каждого пользователя. Триггеры увеличивают его при любом изменении
+транзакций, категорий и профиля, поэтому версия меняется при записи из
+любого места (маршруты, импорт, CLI), а по ней строятся ETag ответов.
+
+VersionTracker хранит известные процессу версии и перепроверяет их,
+только когда PRAGMA data_version показывает фиксацию из другого
+соединения (в том числе из другого воркера).
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+DATA_VERSIONS_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''',
+) + tuple(
+    f'''
+    CREATE TRIGGER IF NOT EXISTS data_versions_{table}_{event.lower()}
+    AFTER {event} ON {table} BEGIN
+        INSERT INTO data_versions (user_id, version) VALUES ({row}.{column}, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+    END
+    '''
+    for table, column in (('transactions', 'user_id'), ('categories', 'user_id'), ('users', 'id'))
+    for event, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old'))
+    if table != 'users' or event == 'UPDATE'
+) + (
+    # Перенос транзакции или категории к другому пользователю меняет и его данные
+    '''
+    CREATE TRIGGER IF NOT EXISTS data_versions_transactions_move
+    AFTER UPDATE OF user_id ON transactions WHEN old.user_id != new.user_id BEGIN
+        INSERT INTO data_versions (user_id, version) VALUES (old.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS data_versions_categories_move
+    AFTER UPDATE OF user_id ON categories WHEN old.user_id != new.user_id BEGIN
+        INSERT INTO data_versions (user_id, version) VALUES (old.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+    END
+    ''',
+)
+
+
+def create_data_versions(db):
+    """
+    Создание таблицы версий и триггеров.
+
+    Используется миграцией.
+
+    Args:
+        db (sqlite3.Connection): Соединение писателя в открытой транзакции
+    """
+    for statement in DATA_VERSIONS_SCHEMA:
+        db.execute(statement)
+
+
+def get_data_version(db, user_id):
+    """
+    Текущая версия данных пользователя.
+
+    Args:
+        db (sqlite3.Connection): Соединение с базой данных
+        user_id (int): ID пользователя
+
+    Returns:
+        int: Версия; 0, если данные еще не изменялись
+    """
+    row = db.execute(
+        'SELECT version FROM data_versions WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    return row['version'] if row else 0
+
+
+def data_etag(user_id, version, *parts):
+    """
+    Сильный ETag для ответа, зависящего от данных пользователя.
+
+    Args:
+        user_id (int): ID пользователя
+        version (int): Версия данных пользователя
+        *parts: Прочие входные данные ответа (параметры запроса, язык, дата)
+
+    Returns:
+        str: Значение ETag без кавычек
+    """
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:16]
+    return f'{user_id}-{version}-{digest}'
+
+
+# ============================================================================
+# Согласованность кешей между процессами
+# ============================================================================
+
+# Обработчики смены версии данных пользователя, замеченной трекером
+_version_listeners = []
+
+# Функция, возвращающая трекер текущего запроса (см. use_request_tracker)
+_request_tracker = None
+
+
+def on_version_changed(listener):
+    """
+    Регистрация обработчика устаревания данных пользователя.
+
+    Обработчик вызывается с user_id, когда трекер видит новую версию
+    данных (например, после записи в другом воркере), и должен удалить
+    записи пользователя из кешей процесса.
+
+    Args:
+        listener (callable): Функция listener(user_id)
+
+    Returns:
+        callable: Тот же обработчик
+    """
+    _version_listeners.append(listener)
+    return listener
+
+
+def use_request_tracker(source):
+    """
+    Регистрация источника трекера версий для текущего запроса.
+
+    Args:
+        source (callable): Функция без аргументов, возвращающая
+            VersionTracker или None вне запроса
+    """
+    global _request_tracker
+    _request_tracker = source
+
+
+class VersionTracker:
+    """
+    Известные процессу версии данных пользователей одной базы данных.
+
+    Версия пользователя читается из data_versions один раз и затем берется
+    из памяти, пока счетчик PRAGMA data_version не изменится. Счетчик поколений
+    не дает сохранить версию, прочитанную до такого изменения. Хранится не
+    больше max_users версий; для вытесненного пользователя вызываются
+    обработчики устаревания, так как изменение его версии уже не будет замечено.
+    """
+
+    def __init__(self, max_users=100000):
+        """
+        Инициализация трекера.
+
+        Args:
+            max_users (int): Максимальное число пользователей в памяти
+        """
+        self.max_users = max_users
+        self._versions = OrderedDict()
+        self._verified = set()
+        self._data_version = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.resets = 0
+
+    def check(self, data_version):
+        """
+        Сверка со счетчиком PRAGMA data_version при первом обращении запроса к данным.
+
+        Args:
+            data_version (int): Текущее значение счетчика соединения наблюдателя
+        """
+        with self._lock:
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._verified.clear()
+                self._generation += 1
+                self.resets += 1
+
+    def invalidate(self, user_id):
+        """
+        Перепроверка версии пользователя после записи в этом процессе.
+
+        Запомненная версия забывается, и новая версия не считается чужим
+        изменением: кеши сверяют версию сами, а о записи этого процесса
+        узнают через on_user_data_changed (индекс префиксных сумм при этом
+        обновляется без перестройки).
+        """
+        with self._lock:
+            self._verified.discard(user_id)
+            self._versions.pop(user_id, None)
+            self._generation += 1
+
+    def get(self, db, user_id):
+        """
+        Версия данных пользователя.
+
+        Args:
+            db (sqlite3.Connection): Соединение с базой данных
+            user_id (int): ID пользователя
+
+        Returns:
+            int: Версия данных
+        """
+        with self._lock:
+            if user_id in self._verified:
+                self._versions.move_to_end(user_id)
+                return self._versions[user_id]
+            generation = self._generation
+
+        version = get_data_version(db, user_id)
+
+        evicted = []
+        with self._lock:
+            previous = self._versions.pop(user_id, None)
+            self._versions[user_id] = version
+            self.lookups += 1
+            if generation == self._generation:
+                self._verified.add(user_id)
+            while len(self._versions) > self.max_users:
+                evicted.append(self._versions.popitem(last=False)[0])
+                self._verified.discard(evicted[-1])
+
+        if previous is not None and previous != version:
+            evicted.append(user_id)
+        for changed_user_id in evicted:
+            for listener in _version_listeners:
+                listener(changed_user_id)
+        return version
+
+    def stats(self):
+        """Статистика трекера."""
+        return {
+            'users': len(self._versions),
+            'lookups': self.lookups,
+            'resets': self.resets,
+        }
+
+
+def current_data_version(db, user_id):
+    """
+    Версия данных пользователя с учетом проверки в текущем запросе.
+
+    В запросе версия берется из трекера процесса (PRAGMA data_version
+    сверяется при первом обращении); иначе (CLI, фоновые задачи) читается
+    из базы.
+
+    Args:
+        db (sqlite3.Connection): Соединение с базой данных
+        user_id (int): ID пользователя
+
+    Returns:
+        int: Версия данных
+    """
+    tracker = _request_tracker() if _request_tracker is not None else None
+    if tracker is None:
+        return get_data_version(db, user_id)
+    return tracker.get(db, user_id)